@@ -1,3 +1,21 @@
 #!/usr/bin/env python
 # SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: 2022 Rafael Silva <perigoso@riseup.net>
+
+import re
+
+# written by release.py from the latest version in metadata.json
+__version__ = "2.4"
+
+_VERSION_RE = re.compile(r'^__version__ = "(?P<version>[^"]*)"$', re.MULTILINE)
+
+
+def installed_version() -> str:
+    # the version of the package on disk, read every time, it differs from __version__ once the package is
+    # updated while this process still runs the old one
+    try:
+        with open(__file__, "r") as f:
+            match = _VERSION_RE.search(f.read())
+    except OSError:
+        match = None
+    return match.group("version") if match is not None else __version__
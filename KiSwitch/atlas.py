@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+import sys
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from PIL import Image, ImageDraw
+
+from KiSwitch.deps_path import deps_path
+from KiSwitch.kicad_mod import read_kicad_mod
+from KiSwitch.renderer import GenericRenderer
+from KiSwitch.util import footprint_bbox
+
+with deps_path():
+    from KicadModTree.nodes.Footprint import Footprint
+
+ATLAS_VERSION = 3
+
+TILE_MARGIN = 2
+
+
+class PillowRenderer(GenericRenderer):
+    def __init__(self, image: Image.Image, scale: float = 1, center: tuple[int, int] = (0, 0)):
+        super().__init__(scale, center)
+        # blend translucent layer colors on color images, single channel masks are drawn as is
+        self.image_draw = ImageDraw.Draw(image, "RGBA" if image.mode == "RGBA" else None)
+
+    def draw_circle(self, center: tuple[int, int], radius: int, color: str, width: int | None = None) -> None:
+        bbox = [center[0] - radius, center[1] - radius, center[0] + radius, center[1] + radius]
+        if width is None:
+            self.image_draw.ellipse(bbox, fill=color)
+        else:
+            self.image_draw.ellipse(bbox, outline=color, width=max(width, 1))
+
+    def draw_arc(self, center: tuple[int, int], start: tuple[int, int], end: tuple[int, int], color: str, width: int):
+        radius = math.hypot(start[0] - center[0], start[1] - center[1])
+        start_angle = math.degrees(math.atan2(start[1] - center[1], start[0] - center[0]))
+        end_angle = math.degrees(math.atan2(end[1] - center[1], end[0] - center[0]))
+        bbox = [center[0] - radius, center[1] - radius, center[0] + radius, center[1] + radius]
+
+        # pillow draws clockwise, going clockwise from end to start is the requested counter-clockwise arc
+        self.image_draw.arc(bbox, end_angle, start_angle, fill=color, width=max(width, 1))
+
+    def draw_line(self, start: tuple[int, int], end: tuple[int, int], color: str, width: int):
+        self.image_draw.line([start, end], fill=color, width=max(width, 1))
+
+    def draw_rect(self, start: tuple[int, int], end: tuple[int, int], color: str, width: int):
+        self.image_draw.rectangle([start, end], outline=color, width=max(width, 1))
+
+    def draw_polygon(self, points: list[tuple[int, int]], color: str, width: int | None = None):
+        if width is None:
+            self.image_draw.polygon(points, fill=color)
+        else:
+            self.image_draw.polygon(points, outline=color, width=max(width, 1))
+
+
+def footprint_extent(footprint: Footprint) -> float:
+    return max(1, *(abs(value) for value in footprint_bbox(footprint)))
+
+
+def render_tile(path: str, tile_size: int) -> Image.Image:
+    footprint = read_kicad_mod(path)
+
+    scale = (tile_size / 2 - TILE_MARGIN) / footprint_extent(footprint)
+
+    tile = Image.new("RGBA", (tile_size, tile_size), (0, 0, 0, 0))
+    renderer = PillowRenderer(tile, scale, (tile_size // 2, tile_size // 2))
+    renderer.draw(footprint)
+
+    return tile
+
+
+def get_tile(path: str, tile_size: int, cache_path: str = None) -> tuple[str, Image.Image]:
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    cache_file = None
+    if cache_path is not None:
+        cache_file = os.path.join(cache_path, f"{digest}_{tile_size}_v{ATLAS_VERSION}.png")
+        if os.path.isfile(cache_file):
+            with Image.open(cache_file) as tile:
+                return digest, tile.copy()
+
+    tile = render_tile(path, tile_size)
+
+    if cache_file is not None:
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        tile.save(tmp_file, format="PNG")
+        os.replace(tmp_file, cache_file)
+
+    return digest, tile
+
+
+def render_atlas(library_path: str, output_path: str, tile_size: int = 128, cache_path: str = None) -> dict:
+    footprint_files = sorted(glob.glob(os.path.join(library_path, "*.pretty", "*.kicad_mod")))
+
+    if len(footprint_files) == 0:
+        raise ValueError(f"No footprints found in {library_path}")
+
+    if cache_path is not None and not os.path.isdir(cache_path):
+        os.makedirs(cache_path)
+
+    columns = math.ceil(math.sqrt(len(footprint_files)))
+    rows = math.ceil(len(footprint_files) / columns)
+
+    atlas = Image.new("RGBA", (columns * tile_size, rows * tile_size), (0, 0, 0, 0))
+
+    index = {
+        "version": ATLAS_VERSION,
+        "image": f"{os.path.basename(output_path)}.png",
+        "tile_size": tile_size,
+        "columns": columns,
+        "rows": rows,
+        "footprints": {},
+    }
+
+    for number, footprint_file in enumerate(footprint_files):
+        group = os.path.splitext(os.path.basename(os.path.dirname(footprint_file)))[0]
+        name = os.path.splitext(os.path.basename(footprint_file))[0]
+
+        digest, tile = get_tile(footprint_file, tile_size, cache_path)
+
+        x = (number % columns) * tile_size
+        y = (number // columns) * tile_size
+        atlas.paste(tile, (x, y))
+
+        index["footprints"][f"{group}:{name}"] = {
+            "group": group,
+            "name": name,
+            "sha256": digest,
+            "x": x,
+            "y": y,
+            "w": tile_size,
+            "h": tile_size,
+        }
+
+    atlas.save(f"{output_path}.png", format="PNG", optimize=True)
+
+    with open(f"{output_path}.json", "w") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+
+    return index
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(
+        description="Render a footprint library thumbnail atlas.", usage="%(prog)s [options]"
+    )
+
+    parser.add_argument(
+        "-i", "--input", type=str, default="./library/footprints", help="library path (default: %(default)s)"
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default="./atlas", help="output path, without extension (default: %(default)s)"
+    )
+    parser.add_argument("-s", "--tile-size", type=int, default=128, help="tile size in pixels (default: %(default)s)")
+    parser.add_argument(
+        "-c", "--cache", type=str, default="./.atlas_cache", help="render cache path (default: %(default)s)"
+    )
+    parser.add_argument("--no-cache", action="store_true", help="render every footprint from scratch")
+
+    args = parser.parse_args()
+
+    # --------------------- Render ---------------------
+    render_atlas(args.input, args.output, args.tile_size, None if args.no_cache else args.cache)
+
+
+if __name__ == "__main__":
+    tui()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import math
+import os
+import sys
+import time
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from KiSwitch.deps_path import deps_path
+from KiSwitch.generator import KEYCAPS, SWITCHES, ParseKwargs
+from KiSwitch.layout import build_layout, keycap_spacing, parse_kle, read_kle
+
+with deps_path():
+    from KicadModTree.Vector import Vector2D
+    from KicadModTree.nodes.base import Arc, Line, Pad
+
+# outline kind -> layers it is drawn on, outlines only collide with outlines of the same kind
+OUTLINE_LAYERS = {
+    "courtyard": ["F.CrtYd"],
+    "back_courtyard": ["B.CrtYd"],
+}
+
+KEYCAP_FEATURE = "keycap"
+
+# segments per full turn when arcs are flattened
+ARC_SEGMENTS = 32
+
+# outlines that only touch, like the keycaps of adjacent keys, do not collide
+TOLERANCE = 1e-4
+
+ORIENTATION_EPSILON = 1e-9
+
+
+def _arc_points(node) -> list[Vector2D]:
+    steps = max(1, math.ceil(abs(node.angle) / 360 * ARC_SEGMENTS))
+    return [
+        Vector2D(node.start_pos).rotate(node.angle * step / steps, origin=node.center_pos) for step in range(steps + 1)
+    ]
+
+
+def outline_loops(nodes) -> list[list[tuple[float, float]]]:
+    # chains the lines and flattened arcs of a layer into closed polygons, open chains are dropped
+    segments = []
+    for node in nodes:
+        if isinstance(node, Line):
+            points = [node.start_pos, node.end_pos]
+        elif isinstance(node, Arc):
+            points = _arc_points(node)
+        else:
+            continue
+        points = [(round(point.x, 4), round(point.y, 4)) for point in points]
+        segments += [(points[i], points[i + 1]) for i in range(len(points) - 1) if points[i] != points[i + 1]]
+
+    ends = {}
+    for segment_id, (start, end) in enumerate(segments):
+        ends.setdefault(start, []).append(segment_id)
+        ends.setdefault(end, []).append(segment_id)
+
+    loops = []
+    used = set()
+    for segment_id, (start, end) in enumerate(segments):
+        if segment_id in used:
+            continue
+
+        used.add(segment_id)
+        loop = [start]
+        point = end
+        while point != start:
+            loop.append(point)
+            following = [other for other in ends[point] if other not in used]
+            if len(following) == 0:
+                loop = None
+                break
+            used.add(following[0])
+            other_start, other_end = segments[following[0]]
+            point = other_end if other_start == point else other_start
+
+        if loop is not None and len(loop) >= 3:
+            loops.append(loop)
+
+    return loops
+
+
+def footprint_shapes(footprint) -> list[tuple[str, object]]:
+    # (kind, geometry) in footprint coordinates, outlines are point lists and holes are (x, y, radius)
+    nodes = footprint.serialize()
+    shapes = []
+
+    for kind, layers in OUTLINE_LAYERS.items():
+        layer_nodes = [node for node in nodes if getattr(node, "layer", None) in layers]
+        shapes += [(kind, loop) for loop in outline_loops(layer_nodes)]
+
+    keycap = getattr(footprint, "features", {}).get(KEYCAP_FEATURE)
+    if keycap is not None:
+        shapes += [("keycap", loop) for loop in outline_loops(keycap.serialize())]
+
+    for node in nodes:
+        if isinstance(node, Pad) and node.drill is not None:
+            shapes.append(("hole", (node.at.x, node.at.y, max(node.drill.x, node.drill.y) / 2)))
+
+    return shapes
+
+
+def placement_transform(placement: dict) -> tuple[float, float, float, float]:
+    angle = math.radians(placement.get("rotation", 0))
+    return (placement["x"], placement["y"], math.cos(angle), math.sin(angle))
+
+
+def place_point(point: tuple[float, float], x: float, y: float, cos: float, sin: float) -> tuple[float, float]:
+    # kicad rotations are counterclockwise on screen, with y pointing down
+    return (x + point[0] * cos + point[1] * sin, y - point[0] * sin + point[1] * cos)
+
+
+def _bbox(kind: str, geometry, clearance: float = 0) -> tuple[float, float, float, float]:
+    # holes are grown by half the clearance, so the boxes of holes too close together overlap
+    if kind == "hole":
+        x, y, radius = geometry
+        radius += clearance / 2
+        return (x - radius, y - radius, x + radius, y + radius)
+
+    xs = [point[0] for point in geometry]
+    ys = [point[1] for point in geometry]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def _orientation(a, b, c) -> float:
+    return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+
+def _side(value: float) -> int:
+    return 0 if abs(value) <= ORIENTATION_EPSILON else (1 if value > 0 else -1)
+
+
+def _segments_intersect(a, b, c, d) -> bool:
+    # closed segments, touching ends and collinear overlaps count
+    o1, o2 = _side(_orientation(a, b, c)), _side(_orientation(a, b, d))
+    o3, o4 = _side(_orientation(c, d, a)), _side(_orientation(c, d, b))
+
+    if o1 * o2 > 0 or o3 * o4 > 0:
+        return False
+
+    if o1 == 0 and o2 == 0:
+        axis = 0 if abs(b[0] - a[0]) >= abs(b[1] - a[1]) else 1
+        return max(min(a[axis], b[axis]), min(c[axis], d[axis])) <= min(max(a[axis], b[axis]), max(c[axis], d[axis]))
+
+    return True
+
+
+def _inside(point, polygon) -> bool:
+    inside = False
+    for i in range(len(polygon)):
+        a, b = polygon[i - 1], polygon[i]
+        if (a[1] > point[1]) != (b[1] > point[1]):
+            if point[0] < a[0] + (point[1] - a[1]) * (b[0] - a[0]) / (b[1] - a[1]):
+                inside = not inside
+    return inside
+
+
+def _inset(polygon: list, distance: float) -> list:
+    # moves every edge inwards by distance, each corner along the bisector of its edge normals
+    area = sum(polygon[i - 1][0] * polygon[i][1] - polygon[i][0] * polygon[i - 1][1] for i in range(len(polygon)))
+    sign = 1 if area > 0 else -1
+
+    normals = []
+    for i in range(len(polygon)):
+        dx, dy = polygon[i][0] - polygon[i - 1][0], polygon[i][1] - polygon[i - 1][1]
+        length = math.hypot(dx, dy)
+        normals.append((-dy * sign / length, dx * sign / length))
+
+    inset = []
+    for i in range(len(polygon)):
+        # normals[i] belongs to the edge ending at vertex i, normals[i + 1] to the one starting there
+        n1, n2 = normals[i], normals[(i + 1) % len(polygon)]
+        scale = distance / max(1 + n1[0] * n2[0] + n1[1] * n2[1], TOLERANCE)
+        inset.append((polygon[i][0] + (n1[0] + n2[0]) * scale, polygon[i][1] + (n1[1] + n2[1]) * scale))
+
+    return inset
+
+
+def polygons_overlap(a: list, b: list) -> bool:
+    # outlines that only touch, like the keycaps of adjacent keys, are pulled apart by the inset
+    a, b = _inset(a, TOLERANCE), _inset(b, TOLERANCE)
+
+    for i in range(len(a)):
+        for j in range(len(b)):
+            if _segments_intersect(a[i - 1], a[i], b[j - 1], b[j]):
+                return True
+
+    return _inside(a[0], b) or _inside(b[0], a)
+
+
+def holes_overlap(a: tuple, b: tuple, clearance: float = 0) -> bool:
+    return math.hypot(a[0] - b[0], a[1] - b[1]) < a[2] + b[2] + clearance - TOLERANCE
+
+
+class SpatialHash:
+    # uniform grid, every item is listed in each cell its bounding box touches
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def _cells(self, bbox: tuple[float, float, float, float]):
+        min_x, min_y, max_x, max_y = (math.floor(value / self.cell_size) for value in bbox)
+        for cell_x in range(min_x, max_x + 1):
+            for cell_y in range(min_y, max_y + 1):
+                yield (cell_x, cell_y)
+
+    def insert(self, item, bbox: tuple[float, float, float, float]) -> None:
+        for cell in self._cells(bbox):
+            self.cells.setdefault(cell, []).append(item)
+
+    def pairs(self) -> set:
+        # items sharing at least one cell, each pair once
+        pairs = set()
+        for items in self.cells.values():
+            for i in range(len(items)):
+                for j in range(i + 1, len(items)):
+                    pairs.add((items[i], items[j]) if items[i] < items[j] else (items[j], items[i]))
+        return pairs
+
+
+def find_collisions(footprints: list, placements: list[dict], cell_size: float, clearance: float = 0) -> list[dict]:
+    # placements refer to footprints by index, shapes of a placement are never checked against each other
+    footprint_shapes_cache = {}
+    shapes = []
+
+    for placement_id, placement in enumerate(placements):
+        footprint_id = placement["footprint"]
+        if footprint_id not in footprint_shapes_cache:
+            footprint_shapes_cache[footprint_id] = footprint_shapes(footprints[footprint_id])
+
+        transform = placement_transform(placement)
+
+        for kind, geometry in footprint_shapes_cache[footprint_id]:
+            if kind == "hole":
+                x, y = place_point(geometry[:2], *transform)
+                geometry = (x, y, geometry[2])
+            else:
+                geometry = [place_point(point, *transform) for point in geometry]
+            shapes.append((placement_id, kind, geometry, _bbox(kind, geometry, clearance)))
+
+    # one grid per kind, shapes of different kinds never collide
+    grids = {}
+    for shape_id, (_, kind, _, bbox) in enumerate(shapes):
+        grids.setdefault(kind, SpatialHash(cell_size)).insert(shape_id, bbox)
+
+    pairs = set()
+    for grid in grids.values():
+        pairs.update(grid.pairs())
+
+    collisions = []
+    found = set()
+    for a_id, b_id in sorted(pairs):
+        a_placement, kind, a, a_bbox = shapes[a_id]
+        b_placement, _, b, b_bbox = shapes[b_id]
+
+        if a_placement == b_placement or (kind, a_placement, b_placement) in found:
+            continue
+
+        if a_bbox[0] > b_bbox[2] or b_bbox[0] > a_bbox[2] or a_bbox[1] > b_bbox[3] or b_bbox[1] > a_bbox[3]:
+            continue
+
+        if kind == "hole":
+            overlap = holes_overlap(a, b, clearance)
+        else:
+            overlap = polygons_overlap(a, b)
+
+        if overlap:
+            found.add((kind, a_placement, b_placement))
+            collisions.append({"kind": kind, "placements": (a_placement, b_placement)})
+
+    return collisions
+
+
+def layout_collisions(
+    keys: list[dict],
+    switch: str,
+    args: dict = {},
+    keycap: str = None,
+    keycap_args: dict = {},
+    stabilizers: bool = False,
+    clearance: float = 0,
+) -> tuple[list[dict], list[dict]]:
+    # builds each distinct footprint of the layout in memory, returns the placements and their collisions
+    footprints, placements = build_layout(keys, switch, args, keycap, keycap_args, stabilizers)
+
+    # a grid cell of one key unit keeps a handful of shapes per cell
+    cell_size = keycap_spacing(keycap, keycap_args)[0]
+
+    collisions = find_collisions(footprints, placements, cell_size, clearance)
+
+    placements = [dict(placement, footprint=footprints[placement["footprint"]].name) for placement in placements]
+    return placements, collisions
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(
+        description="Check a keyboard-layout-editor layout for overlapping footprints.", usage="%(prog)s [options]"
+    )
+
+    parser.add_argument(
+        "-a",
+        "--switch-arg",
+        type=str,
+        nargs="+",
+        action=ParseKwargs,
+        default={},
+        help="switch arguments (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-k", "--keycap", type=str, choices=KEYCAPS.keys(), help="keycap (default: the switch default keycap)"
+    )
+    parser.add_argument(
+        "-b",
+        "--keycap-arg",
+        type=str,
+        nargs="+",
+        action=ParseKwargs,
+        default={},
+        help="keycap arguments (default: %(default)s)",
+    )
+    parser.add_argument("-s", "--stabilizers", action="store_true", help="add stabilizers to the keys 2u and longer")
+    parser.add_argument(
+        "-c", "--clearance", type=float, default=0, help="minimum distance between holes in mm (default: %(default)s)"
+    )
+    parser.add_argument("layout", type=str, help="keyboard-layout-editor json file")
+    parser.add_argument("switch", type=str, choices=SWITCHES.keys(), help="switch to use")
+
+    args = parser.parse_args()
+
+    # --------------------- Check ---------------------
+    keycap = args.keycap if args.keycap is not None else SWITCHES[args.switch].DEFAULT_KEYCAP
+    keys = parse_kle(read_kle(args.layout))
+
+    start = time.perf_counter()
+    placements, collisions = layout_collisions(
+        keys, args.switch, args.switch_arg, keycap, args.keycap_arg, args.stabilizers, args.clearance
+    )
+    elapsed = time.perf_counter() - start
+
+    for collision in collisions:
+        a, b = (placements[placement_id] for placement_id in collision["placements"])
+        print(f"{collision['kind']}: {a['label']!r} ({a['footprint']}) and {b['label']!r} ({b['footprint']})")
+
+    print(f"{len(collisions)} collisions in {len(placements)} placements, {elapsed * 1000:.1f} ms")
+
+    sys.exit(1 if len(collisions) > 0 else 0)
+
+
+if __name__ == "__main__":
+    tui()
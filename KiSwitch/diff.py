@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import concurrent.futures
+import glob
+import json
+import math
+import os
+import sys
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+from PIL import Image
+
+from KiSwitch.atlas import PillowRenderer, footprint_extent
+from KiSwitch.deps_path import deps_path
+from KiSwitch.kicad_mod import read_kicad_mod
+
+with deps_path():
+    from KicadModTree.nodes.base import Pad
+
+DIFF_MARGIN = 4
+
+COLOR_UNCHANGED = (96, 96, 96)
+COLOR_REMOVED = (220, 50, 47)
+COLOR_ADDED = (64, 200, 64)
+
+
+def _node_layers(node) -> list[str]:
+    if isinstance(node, Pad):
+        layers = []
+        for layer in node.layers:
+            if layer.startswith("*."):
+                layers += [f"F.{layer[2:]}", f"B.{layer[2:]}"]
+            else:
+                layers.append(layer)
+        return layers
+
+    return [getattr(node, "layer", None)]
+
+
+class LayerMaskRenderer(PillowRenderer):
+    # renders a single layer as a binary mask
+    def __init__(self, image: Image.Image, layer: str, scale: float = 1, center: tuple[int, int] = (0, 0)):
+        super().__init__(image, scale, center)
+        self.layer = layer
+
+    def _call_draw(self, node):
+        if self.layer in _node_layers(node):
+            return super()._call_draw(node)
+
+    def layer_to_color(self, layer):
+        return 255
+
+    def pad_to_color(self, node):
+        return 255
+
+
+def footprint_layers(footprint) -> set[str]:
+    layers = set()
+    for node in footprint.serialize():
+        if node.__class__.__name__ in {"Arc", "Circle", "Line", "Pad", "Polygon"}:
+            layers.update(_node_layers(node))
+    return layers
+
+
+def rasterize_layer(footprint, layer: str, size: int, scale: float) -> np.ndarray:
+    mask = Image.new("L", (size, size), 0)
+    renderer = LayerMaskRenderer(mask, layer, scale, (size // 2, size // 2))
+    renderer.draw(footprint)
+    return np.asarray(mask) > 0
+
+
+def diff_footprint(old_path: str, new_path: str, scale: float, overlay_path: str = None) -> dict:
+    with open(old_path, "rb") as old_file, open(new_path, "rb") as new_file:
+        if old_file.read() == new_file.read():
+            return {"changed": False, "layers": {}}
+
+    old_footprint = read_kicad_mod(old_path)
+    new_footprint = read_kicad_mod(new_path)
+
+    # both footprints share the same canvas so their pixels line up
+    extent = max(footprint_extent(old_footprint), footprint_extent(new_footprint))
+    size = 2 * math.ceil(extent * scale) + 2 * DIFF_MARGIN
+
+    unchanged = np.zeros((size, size), dtype=bool)
+    removed_any = np.zeros((size, size), dtype=bool)
+    added_any = np.zeros((size, size), dtype=bool)
+    layers = {}
+
+    for layer in sorted(footprint_layers(old_footprint) | footprint_layers(new_footprint)):
+        old_mask = rasterize_layer(old_footprint, layer, size, scale)
+        new_mask = rasterize_layer(new_footprint, layer, size, scale)
+
+        removed = old_mask & ~new_mask
+        added = new_mask & ~old_mask
+
+        unchanged |= old_mask & new_mask
+        removed_any |= removed
+        added_any |= added
+
+        removed_pixels = int(np.count_nonzero(removed))
+        added_pixels = int(np.count_nonzero(added))
+        if removed_pixels or added_pixels:
+            layers[layer] = {"removed": removed_pixels, "added": added_pixels}
+
+    result = {"changed": len(layers) > 0, "layers": layers}
+
+    if result["changed"] and overlay_path is not None:
+        # changes are painted after every layer's unchanged pixels, so no layer hides another one's changes
+        overlay = np.zeros((size, size, 3), dtype=np.uint8)
+        overlay[unchanged] = COLOR_UNCHANGED
+        overlay[removed_any] = COLOR_REMOVED
+        overlay[added_any] = COLOR_ADDED
+        Image.fromarray(overlay, "RGB").save(overlay_path, format="PNG")
+        result["overlay"] = os.path.basename(overlay_path)
+
+    return result
+
+
+def _library_footprints(library_path: str) -> dict:
+    footprints = {}
+    for footprint_file in glob.glob(os.path.join(library_path, "*.pretty", "*.kicad_mod")):
+        group = os.path.splitext(os.path.basename(os.path.dirname(footprint_file)))[0]
+        name = os.path.splitext(os.path.basename(footprint_file))[0]
+        footprints[f"{group}:{name}"] = footprint_file
+    return footprints
+
+
+def diff_libraries(old_path: str, new_path: str, output_path: str, scale: float = 10, jobs: int = None) -> dict:
+    old_footprints = _library_footprints(old_path)
+    new_footprints = _library_footprints(new_path)
+
+    if not os.path.isdir(output_path):
+        os.makedirs(output_path)
+
+    report = {
+        "old": old_path,
+        "new": new_path,
+        "scale": scale,
+        "added": sorted(new_footprints.keys() - old_footprints.keys()),
+        "removed": sorted(old_footprints.keys() - new_footprints.keys()),
+        "changed": {},
+    }
+
+    common = sorted(old_footprints.keys() & new_footprints.keys())
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for key in common:
+            overlay_path = os.path.join(output_path, f"{key.replace(':', '__')}.png")
+            future = executor.submit(diff_footprint, old_footprints[key], new_footprints[key], scale, overlay_path)
+            futures[future] = key
+
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            if result["changed"]:
+                report["changed"][futures[future]] = result
+
+    report["changed"] = dict(sorted(report["changed"].items()))
+    report["unchanged"] = len(common) - len(report["changed"])
+
+    with open(os.path.join(output_path, "report.json"), "w") as f:
+        json.dump(report, f, indent=1)
+
+    return report
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(
+        description="Visually diff two footprint library builds.", usage="%(prog)s [options] old new"
+    )
+
+    parser.add_argument("old", type=str, help="old library path, containing .pretty directories")
+    parser.add_argument("new", type=str, help="new library path, containing .pretty directories")
+    parser.add_argument("-o", "--output", type=str, default="./diff", help="report path (default: %(default)s)")
+    parser.add_argument("-s", "--scale", type=float, default=10, help="pixels per mm (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: cpu count)")
+
+    args = parser.parse_args()
+
+    # --------------------- Diff ---------------------
+    report = diff_libraries(args.old, args.new, args.output, args.scale, args.jobs)
+
+    for key in report["removed"]:
+        print(f"removed: {key}")
+    for key in report["added"]:
+        print(f"added: {key}")
+    for key, result in report["changed"].items():
+        print(f"changed: {key} ({', '.join(result['layers'].keys())})")
+
+    print(f"{len(report['changed'])} changed, {report['unchanged']} unchanged")
+
+
+if __name__ == "__main__":
+    tui()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from KiSwitch.deps_path import deps_path
+from KiSwitch.model_store import lod_models
+
+with deps_path():
+    import KicadModTree
+
+CACHE_VERSION = 1
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+ENTRY_EXTENSION = ".kicad_mod"
+
+_SOURCE_HASH = None
+
+
+def default_cache_path() -> str:
+    # KISWITCH_CACHE_HOME replaces the whole cache directory, the per user cache directory is used otherwise
+    cache_home = os.environ.get("KISWITCH_CACHE_HOME")
+    if cache_home:
+        return cache_home
+
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+
+    return os.path.join(base, "kiswitch")
+
+
+def source_hash() -> str:
+    # the KiSwitch sources and the KicadModTree they build with, any change to either gives new keys.
+    # so do the reduced model variants in the library, footprints only reference the ones that exist.
+    # computed once per process
+    global _SOURCE_HASH
+
+    if _SOURCE_HASH is None:
+        sha256 = hashlib.sha256()
+        for package in [os.path.dirname(os.path.realpath(__file__)), os.path.dirname(KicadModTree.__file__)]:
+            for path in sorted(glob.glob(os.path.join(package, "**", "*.py"), recursive=True)):
+                sha256.update(os.path.relpath(path, package).replace("\\", "/").encode("utf-8") + b"\0")
+                with open(path, "rb") as f:
+                    sha256.update(hashlib.sha256(f.read()).digest())
+        for model in lod_models():
+            sha256.update(model.encode("utf-8") + b"\0")
+        _SOURCE_HASH = sha256.hexdigest()
+
+    return _SOURCE_HASH
+
+
+class FootprintCache:
+    # .kicad_mod bytes keyed by the parameters a footprint is built from, shared by every process of the user.
+    # entries are written to a temporary file and renamed into place, readers see a whole entry or none,
+    # and an entry removed while it is looked up is a miss, so no lock is needed
+    def __init__(self, path: str = None, max_size: int = DEFAULT_MAX_SIZE, max_age: float = DEFAULT_MAX_AGE):
+        self.path = os.path.join(path if path is not None else default_cache_path(), f"footprints_v{CACHE_VERSION}")
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def key(switch: str, args: dict = {}, keycap: str = None, keycap_size: str = None, keycap_args: dict = {}) -> str:
+        params = {
+            "switch": switch,
+            "args": args,
+            "keycap": keycap,
+            "keycap_size": keycap_size,
+            "keycap_args": keycap_args if keycap is not None else {},
+        }
+        canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(f"{source_hash()}:{canonical}".encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}{ENTRY_EXTENSION}")
+
+    def get(self, key: str) -> tuple[dict, bytes]:
+        # the footprint metadata and its file contents, None on a miss
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        # the metadata is stored as json on the first line, in front of the footprint file
+        header, _, data = entry.partition(b"\n")
+        try:
+            metadata = json.loads(header)
+        except ValueError:
+            metadata = None
+        if not isinstance(metadata, dict) or "name" not in metadata or len(data) == 0:
+            self.misses += 1
+            return None
+
+        # the modification time tells the least recently used entries apart when pruning
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return metadata, data
+
+    def put(self, key: str, metadata: dict, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=self.path)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(metadata, separators=(",", ":")).encode("utf-8") + b"\n")
+                f.write(data)
+            os.replace(tmp_path, self._entry_path(key))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _entries(self, extension: str = ENTRY_EXTENSION) -> list[tuple[float, int, str]]:
+        entries = []
+        with os.scandir(self.path) as scan:
+            for entry in scan:
+                if not entry.name.endswith(extension):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self) -> tuple[int, int]:
+        # entry count and total bytes
+        entries = self._entries()
+        return len(entries), sum(size for _, size, _ in entries)
+
+    def prune(self, max_size: int = None, max_age: float = None) -> int:
+        # drops entries older than max_age, then the least recently used ones until max_size is met.
+        # concurrent pruning may remove a little more than needed, never a half written entry
+        max_size = max_size if max_size is not None else self.max_size
+        max_age = max_age if max_age is not None else self.max_age
+
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        oldest = time.time() - max_age
+        removed = 0
+
+        # temporary files are only left behind by processes that died while writing
+        for mtime, _, path in self._entries(".tmp"):
+            if mtime < oldest:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+        for mtime, size, path in entries:
+            if mtime >= oldest and total <= max_size:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        return removed
+
+    def clear(self) -> int:
+        return self.prune(max_size=0)
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(description="Manage the footprint generation cache.", usage="%(prog)s [options]")
+
+    parser.add_argument(
+        "action",
+        type=str,
+        choices=["info", "prune", "clear"],
+        nargs="?",
+        default="info",
+        help="show, prune or clear the cache (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-c", "--cache", type=str, default=default_cache_path(), help="cache path (default: %(default)s)"
+    )
+    parser.add_argument(
+        "-s", "--max-size", type=float, default=DEFAULT_MAX_SIZE / 1024 / 1024, help="prune to this size in MiB"
+    )
+    parser.add_argument(
+        "-d",
+        "--max-age",
+        type=float,
+        default=DEFAULT_MAX_AGE / 24 / 60 / 60,
+        help="prune entries older than this in days",
+    )
+
+    args = parser.parse_args()
+
+    # --------------------- Run ---------------------
+    cache = FootprintCache(args.cache, args.max_size * 1024 * 1024, args.max_age * 24 * 60 * 60)
+
+    if args.action == "prune":
+        print(f"{cache.prune()} entries removed")
+    elif args.action == "clear":
+        print(f"{cache.clear()} entries removed")
+
+    count, size = cache.size()
+    print(f"{count} entries, {size / 1024 / 1024:.1f} MiB in {cache.path}")
+
+
+if __name__ == "__main__":
+    tui()
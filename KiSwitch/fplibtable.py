@@ -2,52 +2,107 @@
 # SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: 2022 Rafael Silva <perigoso@riseup.net>
 
+import contextlib
+import glob
 import os
+import shutil
+import sys
+import tempfile
 
-FPLIBTABLE = "fp-lib-table"
-
-
-def _parse_fp_lib_table(string: str) -> tuple():
-    index = 0
-    size = 0
-    subs = None
-
-    while string[index] != "(":
-        index += 1
-        if index == len(string):
-            return string
-
-    index += 1
-    string = string[index:]
-    size = index
-    index = 0
-
-    while string[index] != ")":
-        if string[index] == "(":
-            sub_size, sub = _parse_fp_lib_table(string[index:])
-
-            if subs is None:
-                subs = []
-            subs.append(sub)
-
-            string = string[:index] + string[index + sub_size :]
-
-            size += sub_size
-        else:
-            index += 1
-            size += 1
-
-        if index >= len(string):
-            raise Exception("No closing bracket found")
-
-    this = string[:index]
-    size += 1
-
-    return size, (this, subs)
+from KiSwitch.sexpr import SexprComment, format_sexpr, parse_sexpr, quote_sexpr
 
+FPLIBTABLE = "fp-lib-table"
 
-def parse_fp_lib_table_braces(string: str) -> tuple():
-    return _parse_fp_lib_table(string)[1]
+# parsed tables, keyed by real path, validated against (mtime_ns, size)
+_TABLE_CACHE = {}
+
+
+def parse_fp_lib_table(string: str) -> list:
+    return parse_sexpr(string, comments=True)
+
+
+def kicad_config_path(kicad_version: str = None) -> str:
+    # KICAD_CONFIG_HOME replaces the whole config directory, the versioned one is used otherwise
+    config_home = os.environ.get("KICAD_CONFIG_HOME")
+    if config_home:
+        return config_home
+
+    if sys.platform == "win32":
+        base = os.path.join(os.environ.get("APPDATA", os.path.expanduser("~")), "kicad")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Preferences/kicad")
+    else:
+        base = os.path.join(os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config")), "kicad")
+
+    if kicad_version is None:
+        versions = [os.path.basename(path) for path in glob.glob(os.path.join(base, "*.*")) if os.path.isdir(path)]
+        versions = [version for version in versions if all(part.isdigit() for part in version.split("."))]
+        if len(versions) == 0:
+            raise FileNotFoundError(f"No KiCad configuration found in {base}")
+        kicad_version = max(versions, key=lambda version: [int(part) for part in version.split(".")])
+
+    return os.path.join(base, kicad_version)
+
+
+def _umask() -> int:
+    # the umask can only be read by setting it
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+@contextlib.contextmanager
+def lock_fp_lib_table(path: str or os.path):
+    # advisory lock on a sidecar file, the table itself is replaced on every write so it can't hold the lock.
+    # the sidecar is removed again on release, so it is only left behind by a process that died holding it
+    lock_path = os.path.join(path, f"{FPLIBTABLE}.lock")
+
+    if sys.platform == "win32":
+        import msvcrt
+
+        with open(lock_path, "a+") as lock_file:
+            lock_file.seek(0)
+            # LK_LOCK gives up after 10 attempts, keep waiting like flock does
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+        # an open file can't be removed on windows, the last process to let go of the lock removes it
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+    else:
+        import fcntl
+
+        while True:
+            lock_file = open(lock_path, "a+")
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            # the holder before may have removed the file while this one waited on it, lock the new one then
+            try:
+                if os.path.samestat(os.fstat(lock_file.fileno()), os.stat(lock_path)):
+                    break
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+        try:
+            yield
+        finally:
+            # removed while still locked, so whoever waits on it next retries on a fresh file
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+            lock_file.close()
 
 
 def open_fp_lib_table(path: str or os.path) -> str:
@@ -61,37 +116,42 @@ def open_fp_lib_table(path: str or os.path) -> str:
 
 
 class FpLib:
-    def __init__(self, name: str, uri: str, type: str = "KiCad", options: str = "", descr: str = "") -> None:
+    FIELDS = ["name", "type", "uri", "options", "descr"]
+
+    def __init__(
+        self,
+        name: str,
+        uri: str,
+        type: str = "KiCad",
+        options: str = "",
+        descr: str = "",
+        extra: list = None,
+        comments: list = None,
+    ) -> None:
         self.name = name
         self.type = type
         self.uri = uri
         self.options = options
         self.descr = descr
+        # unknown items, such as (disabled), and the comments above the entry are kept for round tripping
+        self.extra = extra if extra is not None else []
+        self.comments = comments if comments is not None else []
 
     @classmethod
-    def fromLst(cls, value_list: list(tuple())) -> "FpLib":
-        name = ""
-        uri = ""
-        type = "KiCad"
-        options = ""
-        descr = ""
+    def fromLst(cls, value_list: list, comments: list = None) -> "FpLib":
+        values = {"name": "", "uri": "", "type": "KiCad", "options": "", "descr": ""}
+        extra = []
+        comments = list(comments) if comments is not None else []
 
         for value in value_list:
-            keyword, value = value[0].split(" ")
-            value = value.strip('"')
-
-            if keyword == "name":
-                name = value
-            elif keyword == "type":
-                type = value
-            elif keyword == "uri":
-                uri = value
-            elif keyword == "options":
-                options = value
-            elif keyword == "descr":
-                descr = value
-
-        return cls(name, uri, type, options, descr)
+            if isinstance(value, SexprComment):
+                comments.append(value)
+            elif isinstance(value, list) and len(value) == 2 and value[0] in cls.FIELDS:
+                values[value[0]] = value[1]
+            else:
+                extra.append(value)
+
+        return cls(**values, extra=extra, comments=comments)
 
     def __eq__(self, __o: object) -> bool:
         if isinstance(__o, str):
@@ -101,51 +161,169 @@ class FpLib:
         return False
 
     def __str__(self) -> str:
-        return f'(lib (name "{self.name}")(type "{self.type}")(uri "{self.uri}")(options "{self.options}")(descr "{self.descr}"))'
+        fields = "".join(f"({field} {quote_sexpr(getattr(self, field))})" for field in self.FIELDS)
+        return f"(lib {fields}{''.join(format_sexpr(item) for item in self.extra)})"
 
 
 class FpLibTable:
-    def __init__(self, libs: list = []) -> None:
-        self._libs = libs
+    def __init__(self, libs: list = None, header: list = None, comments: list = None) -> None:
+        # ordered by insertion, indexed by name
+        self._libs = {}
+        # non lib items, like (version 7), and trailing comments
+        self.header = header if header is not None else []
+        self.comments = comments if comments is not None else []
+
+        if libs is not None:
+            self.addLibs(libs)
 
     @classmethod
     def fromStr(cls, str: str) -> "FpLibTable":
         if str is None:
             return cls()
 
-        parsed = parse_fp_lib_table_braces(str)
+        parsed = parse_fp_lib_table(str)
 
-        if parsed[0].strip() != "fp_lib_table":
+        if len(parsed) == 0 or parsed[0] != "fp_lib_table":
             raise ValueError("Not a fp_lib_table")
 
         libs = []
-        for sub_parse in parsed[1]:
-            if sub_parse[0].strip() == "lib":
-                libs.append(FpLib.fromLst(sub_parse[1]))
+        header = []
+        comments = []
+        for item in parsed[1:]:
+            if isinstance(item, SexprComment):
+                comments.append(item)
+            elif isinstance(item, list) and len(item) > 0 and item[0] == "lib":
+                libs.append(FpLib.fromLst(item[1:], comments))
+                comments = []
+            else:
+                header += comments + [item]
+                comments = []
+
+        table = cls(header=header, comments=comments)
+        # kicad loads the first of duplicated names, so later duplicates are dropped instead of failing the read
+        for lib in libs:
+            if lib.name not in table:
+                table.addLib(lib)
+
+        return table
 
-        return cls(libs)
+    @classmethod
+    def read(cls, path: str or os.path, cache: bool = True) -> "FpLibTable":
+        fp_lib_table = os.path.realpath(os.path.join(path, FPLIBTABLE))
+
+        try:
+            stat = os.stat(fp_lib_table)
+        except FileNotFoundError:
+            _TABLE_CACHE.pop(fp_lib_table, None)
+            return cls()
+
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = _TABLE_CACHE.get(fp_lib_table)
+        if cache and cached is not None and cached[0] == key:
+            return cached[1].copy()
+
+        table = cls.fromStr(open_fp_lib_table(path))
+        _TABLE_CACHE[fp_lib_table] = (key, table.copy())
+        return table
+
+    @classmethod
+    def read_global(cls, kicad_version: str = None) -> "FpLibTable":
+        return cls.read(kicad_config_path(kicad_version))
 
     @classmethod
-    def read(cls, path: str or os.path) -> "FpLibTable":
-        return cls.fromStr(open_fp_lib_table(path))
+    @contextlib.contextmanager
+    def update(cls, path: str or os.path):
+        # read, modify and write under the lock, so concurrent updates from other processes are not lost
+        with lock_fp_lib_table(path):
+            table = cls.read(path, cache=False)
+            yield table
+            table.write(path)
+
+    def copy(self) -> "FpLibTable":
+        libs = [
+            FpLib(lib.name, lib.uri, lib.type, lib.options, lib.descr, list(lib.extra), list(lib.comments))
+            for lib in self._libs.values()
+        ]
+        return FpLibTable(libs, list(self.header), list(self.comments))
 
     def write(self, path: str or os.path) -> None:
-        with open(os.path.join(path, "fp-lib-table"), "w") as f:
-            f.write(str(self))
+        # written to a temporary file next to the table and renamed over it, so readers never see a partial table
+        fp_lib_table = os.path.join(path, FPLIBTABLE)
+
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{FPLIBTABLE}.", dir=path)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(str(self))
+            if os.path.exists(fp_lib_table):
+                shutil.copymode(fp_lib_table, tmp_path)
+            else:
+                # mkstemp creates the file private to the user, a new table gets the mode any new file would
+                os.chmod(tmp_path, 0o666 & ~_umask())
+            os.replace(tmp_path, fp_lib_table)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        _TABLE_CACHE.pop(os.path.realpath(fp_lib_table), None)
 
     @property
     def libs(self) -> list:
-        return self._libs
+        return list(self._libs.values())
+
+    def getLib(self, name: str) -> FpLib:
+        return self._libs.get(name)
 
-    def addLib(self, lib: FpLib) -> None:
-        self._libs.append(lib)
+    def addLib(self, lib: FpLib, replace: bool = False) -> None:
+        if lib.name in self._libs:
+            if not replace:
+                raise ValueError(f"Library {lib.name} already exists in {FPLIBTABLE}")
+            # replacing keeps the position and the comments of the old entry
+            if len(lib.comments) == 0:
+                lib.comments = self._libs[lib.name].comments
+
+        self._libs[lib.name] = lib
+
+    def addLibs(self, libs: list, replace: bool = False) -> None:
+        for lib in libs:
+            if not replace and lib.name in self._libs:
+                raise ValueError(f"Library {lib.name} already exists in {FPLIBTABLE}")
+
+        for lib in libs:
+            self.addLib(lib, replace)
 
     def removeLib(self, lib: object) -> None:
-        self._libs.remove(lib)
+        name = lib.name if isinstance(lib, FpLib) else lib
+        if name not in self._libs:
+            raise ValueError(f"Library {name} not in {FPLIBTABLE}")
+        del self._libs[name]
+
+    def removeLibs(self, libs: list) -> None:
+        for lib in libs:
+            self._libs.pop(lib.name if isinstance(lib, FpLib) else lib, None)
+
+    def __contains__(self, lib: object) -> bool:
+        return (lib.name if isinstance(lib, FpLib) else lib) in self._libs
+
+    def __len__(self) -> int:
+        return len(self._libs)
+
+    def __iter__(self):
+        return iter(self._libs.values())
 
     def __str__(self) -> str:
-        string = "(fp_lib_table\n"
-        for lib in self.libs:
-            string += f"  {lib}\n"
-        string += ")\n"
-        return string
+        lines = ["(fp_lib_table"]
+        for item in self.header:
+            lines.append(f"  {item if isinstance(item, SexprComment) else format_sexpr(item)}")
+        for lib in self._libs.values():
+            lines += [f"  {comment}" for comment in lib.comments]
+            lines.append(f"  {lib}")
+        lines += [f"  {comment}" for comment in self.comments]
+        lines.append(")")
+        return "\n".join(lines) + "\n"
+
+
+def register_libs(path: str or os.path, libs: list, replace: bool = True) -> FpLibTable:
+    # one read and one write, however many libraries are registered
+    with FpLibTable.update(path) as fp_lib_table:
+        fp_lib_table.addLibs(libs, replace)
+    return fp_lib_table
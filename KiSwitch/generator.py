@@ -12,6 +12,9 @@ if __name__ == "__main__":
 
 from KiSwitch.deps_path import deps_path
 
+from KiSwitch.footprint_cache import FootprintCache
+from KiSwitch.geometry import footprint_geometry
+from KiSwitch.index import footprint_fields
 from KiSwitch.keycap import Keycap, KeycapChoc
 
 from KiSwitch.switch import (
@@ -49,27 +52,22 @@ SWITCHES = {
 }
 
 
-def render_switches(
-    output_path: str,
+def build_switches(
     switch: str,
     args: dict = {},
     keycap: str = None,
     keycap_sizes: list[str] = None,
     keycap_args: dict = {},
-) -> None:
+):
     if switch not in SWITCHES:
         raise ValueError(f"{switch} is an invalid switch, valid switches are {SWITCHES.keys()}")
 
-    if not os.path.isdir(output_path):
-        os.mkdir(output_path)
-
     switch_class = SWITCHES.get(switch)
 
     base_switch = switch_class(**args)
 
-    switches = list()
-    switches.append(base_switch)
-
+    # keycap variants are copied from the base before it gets the generic nodes
+    keycap_switches = list()
     if keycap is not None:
         if keycap_sizes is None or len(keycap_sizes) == 0:
             keycap_sizes = switch_class.DEFAULT_KEYS
@@ -77,14 +75,174 @@ def render_switches(
         for keycap_node in render_keycaps(keycap, keycap_sizes, keycap_args):
             keycap_switch = copy.deepcopy(base_switch)
             keycap_switch.append_component(keycap_node)
+            keycap_switches.append(keycap_switch)
 
-            switches.append(keycap_switch)
-
-    for switch_footprint in switches:
+    for switch_footprint in [base_switch] + keycap_switches:
         switch_footprint.add_generic_nodes()
-        file_path = os.path.join(output_path, f"{switch_footprint.name}.kicad_mod")
-        file_handler = KicadFileHandler(switch_footprint)
-        file_handler.writeFile(file_path, timestamp=0)
+        yield switch_footprint
+
+
+def build_switch(
+    switch: str,
+    args: dict = {},
+    keycap: str = None,
+    keycap_size: str = None,
+    keycap_args: dict = {},
+):
+    # a single footprint, the base switch or one keycap variant of it
+    if switch not in SWITCHES:
+        raise ValueError(f"{switch} is an invalid switch, valid switches are {SWITCHES.keys()}")
+
+    switch_footprint = SWITCHES[switch](**args)
+
+    if keycap is not None and keycap_size is not None:
+        for keycap_node in render_keycaps(keycap, [keycap_size], keycap_args):
+            switch_footprint.append_component(keycap_node)
+
+    switch_footprint.add_generic_nodes()
+    return switch_footprint
+
+
+def count_switches(switch: str, keycap: str = None, keycap_sizes: list[str] = None, **kwargs) -> int:
+    if keycap is None:
+        return 1
+
+    if keycap_sizes is None or len(keycap_sizes) == 0:
+        keycap_sizes = SWITCHES[switch].DEFAULT_KEYS
+
+    return 1 + len(keycap_sizes)
+
+
+def serialize_switch(switch_footprint) -> bytes:
+    return KicadFileHandler(switch_footprint).serialize(timestamp=0).encode("utf-8")
+
+
+def write_footprint_data(output_path: str, name: str, data: bytes) -> str:
+    file_path = os.path.join(output_path, f"{name}.kicad_mod")
+    with open(file_path, "wb") as f:
+        f.write(data)
+    return file_path
+
+
+def footprint_metadata(switch_footprint) -> dict:
+    # what the index and the geometry sidecar take from a footprint, kept next to it in the cache
+    return {
+        "name": switch_footprint.name,
+        "index": footprint_fields(switch_footprint),
+        "geometry": footprint_geometry(switch_footprint),
+    }
+
+
+def _cache_put(cache, key: str, metadata: dict, data: bytes) -> None:
+    try:
+        cache.put(key, metadata, data)
+    except OSError:
+        # a cache that can't be written only costs building the footprint again next time
+        pass
+
+
+def generate_switch(
+    switch: str,
+    args: dict = {},
+    keycap: str = None,
+    keycap_size: str = None,
+    keycap_args: dict = {},
+    cache=None,
+) -> tuple:
+    # (name, file data, footprint, metadata) of a single footprint, like generate_switches yields them
+    key = None
+    if cache is not None:
+        key = cache.key(switch, args, keycap if keycap_size is not None else None, keycap_size, keycap_args)
+        entry = cache.get(key)
+        if entry is not None:
+            metadata, data = entry
+            return metadata["name"], data, None, metadata
+
+    switch_footprint = build_switch(switch, args, keycap, keycap_size, keycap_args)
+    data = serialize_switch(switch_footprint)
+    metadata = None
+
+    if cache is not None:
+        metadata = footprint_metadata(switch_footprint)
+        _cache_put(cache, key, metadata, data)
+
+    return switch_footprint.name, data, switch_footprint, metadata
+
+
+def generate_switches(
+    switch: str,
+    args: dict = {},
+    keycap: str = None,
+    keycap_sizes: list[str] = None,
+    keycap_args: dict = {},
+    cache=None,
+):
+    # yields (keycap size, name, file data, footprint, metadata) for the base switch and then every keycap size.
+    # footprints are only built when any of them is missing from the cache, on a hit footprint is None and the
+    # cached metadata stands in for it. metadata is None for footprints built without a cache
+    if switch not in SWITCHES:
+        raise ValueError(f"{switch} is an invalid switch, valid switches are {SWITCHES.keys()}")
+
+    if keycap is not None and (keycap_sizes is None or len(keycap_sizes) == 0):
+        keycap_sizes = SWITCHES[switch].DEFAULT_KEYS
+
+    sizes = [None] + (list(keycap_sizes) if keycap is not None else [])
+
+    keys = []
+    entries = []
+    if cache is not None:
+        keys = [cache.key(switch, args, keycap if size is not None else None, size, keycap_args) for size in sizes]
+        entries = [cache.get(key) for key in keys]
+
+        if all(entry is not None for entry in entries):
+            for size, (metadata, data) in zip(sizes, entries):
+                yield size, metadata["name"], data, None, metadata
+            return
+
+    for position, switch_footprint in enumerate(build_switches(switch, args, keycap, keycap_sizes, keycap_args)):
+        data = serialize_switch(switch_footprint)
+        metadata = None
+
+        if cache is not None:
+            metadata = footprint_metadata(switch_footprint)
+            if entries[position] is None:
+                _cache_put(cache, keys[position], metadata, data)
+
+        yield sizes[position], switch_footprint.name, data, switch_footprint, metadata
+
+
+def render_switches(
+    output_path: str,
+    switch: str,
+    args: dict = {},
+    keycap: str = None,
+    keycap_sizes: list[str] = None,
+    keycap_args: dict = {},
+    index=None,
+    geometry=None,
+    cache=None,
+) -> None:
+    if switch not in SWITCHES:
+        raise ValueError(f"{switch} is an invalid switch, valid switches are {SWITCHES.keys()}")
+
+    if not os.path.isdir(output_path):
+        os.mkdir(output_path)
+
+    group = os.path.splitext(os.path.basename(os.path.normpath(output_path)))[0]
+
+    for size, name, data, switch_footprint, metadata in generate_switches(
+        switch, args, keycap, keycap_sizes, keycap_args, cache
+    ):
+        write_footprint_data(output_path, name, data)
+
+        if metadata is None and (index is not None or geometry is not None):
+            metadata = footprint_metadata(switch_footprint)
+
+        if index is not None:
+            index.add_fields(metadata["index"], group, switch, args, keycap if size is not None else None, size)
+
+        if geometry is not None:
+            geometry.add_geometry(name, metadata["geometry"], group)
 
 
 def render_keycaps(keycap: str, sizes: list[str], args: dict = {}) -> list[Node]:
@@ -149,6 +307,9 @@ def tui():
         help="keycap arguments (default: %(default)s)",
     )
 
+    parser.add_argument("-c", "--cache", type=str, default=None, help="generation cache path (default: user cache)")
+    parser.add_argument("--no-cache", action="store_true", help="build every footprint from scratch")
+
     parser.add_argument(
         "switch",
         type=str,
@@ -159,7 +320,14 @@ def tui():
     args = parser.parse_args()
 
     # --------------------- Generate ---------------------
-    render_switches(args.output, args.switch, args.switch_arg, args.keycap, args.keycap_sizes, args.keycap_arg)
+    cache = None if args.no_cache else FootprintCache(args.cache)
+
+    render_switches(
+        args.output, args.switch, args.switch_arg, args.keycap, args.keycap_sizes, args.keycap_arg, cache=cache
+    )
+
+    if cache is not None:
+        cache.prune()
 
 
 if __name__ == "__main__":
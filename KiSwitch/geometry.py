@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from KiSwitch.deps_path import deps_path
+from KiSwitch.util import node_bbox_points, points_bbox
+
+with deps_path():
+    from KicadModTree.nodes.base import Pad
+
+GEOMETRY_MAGIC = b"KSGM"
+
+GEOMETRY_VERSION = 1
+
+GEOMETRY_EXTENSION = ".geometry"
+
+# little endian, fixed size records so a footprint is found by binary search straight in the mapped file:
+# header, footprints sorted by name, layer boxes, pads, then the utf-8 string table they point into
+_HEADER = struct.Struct("<4sHHIIII")
+# name offset, name length, bbox, first layer, layer count, first pad, pad count
+_FOOTPRINT = struct.Struct("<II4dIIII")
+# layer name offset, layer name length, bbox
+_LAYER = struct.Struct("<II4d")
+# number offset, number length, type offset, type length, x, y, width, height, drill, rotation
+_PAD = struct.Struct("<IIII6d")
+
+
+def footprint_geometry(footprint) -> dict:
+    # per layer bounding boxes and pads of a built footprint, layers are listed as the footprint names them
+    layer_points = {}
+    points = []
+    pads = []
+
+    for node in footprint.serialize():
+        node_points = node_bbox_points(node)
+        points += node_points
+
+        layers = node.layers if isinstance(node, Pad) else [getattr(node, "layer", None)]
+        for layer in layers:
+            if layer is not None and len(node_points) > 0:
+                layer_points.setdefault(layer, []).extend(node_points)
+
+        if isinstance(node, Pad):
+            drill = max(node.drill.x, node.drill.y) if node.drill is not None else 0
+            pads.append(
+                {
+                    "number": str(node.number),
+                    "type": node.type,
+                    "at": [node.at.x, node.at.y],
+                    "size": [node.size.x, node.size.y],
+                    "drill": drill,
+                    "rotation": node.rotation,
+                }
+            )
+
+    return {
+        "bbox": list(points_bbox(points)),
+        "layers": {layer: list(points_bbox(layer_points[layer])) for layer in sorted(layer_points)},
+        "pads": pads,
+    }
+
+
+class FootprintGeometry:
+    # collects the geometry of footprints as they are built, one sidecar is written per group
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, footprint, group: str) -> dict:
+        return self.add_geometry(footprint.name, footprint_geometry(footprint), group)
+
+    def add_geometry(self, name: str, geometry: dict, group: str) -> dict:
+        self.groups.setdefault(group, {})[name] = geometry
+        return geometry
+
+    def write(self, output_path: str) -> list[str]:
+        paths = []
+        for group, footprints in sorted(self.groups.items()):
+            path = os.path.join(output_path, f"{group}{GEOMETRY_EXTENSION}")
+            write_sidecar(path, footprints)
+            paths.append(path)
+        return paths
+
+
+def write_sidecar(path: str, footprints: dict) -> None:
+    strings = bytearray()
+    string_offsets = {}
+
+    def string(value: str) -> tuple[int, int]:
+        if value not in string_offsets:
+            data = value.encode("utf-8")
+            string_offsets[value] = (len(strings), len(data))
+            strings.extend(data)
+        return string_offsets[value]
+
+    footprint_records = []
+    layer_records = []
+    pad_records = []
+
+    for name in sorted(footprints):
+        geometry = footprints[name]
+        footprint_records.append(
+            _FOOTPRINT.pack(
+                *string(name),
+                *geometry["bbox"],
+                len(layer_records),
+                len(geometry["layers"]),
+                len(pad_records),
+                len(geometry["pads"]),
+            )
+        )
+
+        for layer, bbox in geometry["layers"].items():
+            layer_records.append(_LAYER.pack(*string(layer), *bbox))
+
+        for pad in geometry["pads"]:
+            pad_records.append(
+                _PAD.pack(
+                    *string(pad["number"]),
+                    *string(pad["type"]),
+                    *pad["at"],
+                    *pad["size"],
+                    pad["drill"],
+                    pad["rotation"],
+                )
+            )
+
+    header = _HEADER.pack(
+        GEOMETRY_MAGIC, GEOMETRY_VERSION, 0, len(footprint_records), len(layer_records), len(pad_records), len(strings)
+    )
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.writelines(footprint_records)
+        f.writelines(layer_records)
+        f.writelines(pad_records)
+        f.write(strings)
+    os.replace(tmp_path, path)
+
+
+class GeometrySidecar:
+    # reads a sidecar through a read only mapping, nothing is decoded until it is asked for
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        try:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+        magic, version, _, self.footprint_count, layer_count, pad_count, strings_size = _HEADER.unpack_from(
+            self._buffer, 0
+        )
+        records_size = self.footprint_count * _FOOTPRINT.size + layer_count * _LAYER.size + pad_count * _PAD.size
+        if magic != GEOMETRY_MAGIC or version != GEOMETRY_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported geometry sidecar {path}")
+        if len(self._buffer) != _HEADER.size + records_size + strings_size:
+            self.close()
+            raise ValueError(f"Truncated geometry sidecar {path}")
+
+        self._footprints = _HEADER.size
+        self._layers = self._footprints + self.footprint_count * _FOOTPRINT.size
+        self._pads = self._layers + layer_count * _LAYER.size
+        self._strings = self._pads + pad_count * _PAD.size
+
+    def close(self) -> None:
+        self._buffer.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.footprint_count
+
+    def __contains__(self, name: str) -> bool:
+        return self._find(name) is not None
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings + offset
+        return self._buffer[start : start + length].decode("utf-8")
+
+    def _record(self, index: int) -> tuple:
+        return _FOOTPRINT.unpack_from(self._buffer, self._footprints + index * _FOOTPRINT.size)
+
+    def _find(self, name: str) -> tuple:
+        # records are sorted by name, compared as python compares the str they were sorted as
+        low, high = 0, self.footprint_count
+        while low < high:
+            middle = (low + high) // 2
+            record = self._record(middle)
+            record_name = self._string(record[0], record[1])
+            if record_name == name:
+                return record
+            if record_name < name:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def _get(self, name: str) -> tuple:
+        record = self._find(name)
+        if record is None:
+            raise KeyError(name)
+        return record
+
+    def names(self) -> list[str]:
+        return [self._string(*self._record(index)[:2]) for index in range(self.footprint_count)]
+
+    def bbox(self, name: str) -> tuple[float, float, float, float]:
+        return self._get(name)[2:6]
+
+    def layer_bboxes(self, name: str) -> dict:
+        record = self._get(name)
+        layers = {}
+        for index in range(record[6], record[6] + record[7]):
+            layer = _LAYER.unpack_from(self._buffer, self._layers + index * _LAYER.size)
+            layers[self._string(layer[0], layer[1])] = layer[2:6]
+        return layers
+
+    def layer_bbox(self, name: str, layer: str) -> tuple[float, float, float, float]:
+        return self.layer_bboxes(name).get(layer)
+
+    def pads(self, name: str) -> list[dict]:
+        record = self._get(name)
+        pads = []
+        for index in range(record[8], record[8] + record[9]):
+            pad = _PAD.unpack_from(self._buffer, self._pads + index * _PAD.size)
+            pads.append(
+                {
+                    "number": self._string(pad[0], pad[1]),
+                    "type": self._string(pad[2], pad[3]),
+                    "at": list(pad[4:6]),
+                    "size": list(pad[6:8]),
+                    "drill": pad[8],
+                    "rotation": pad[9],
+                }
+            )
+        return pads
+
+    def footprint(self, name: str) -> dict:
+        return {
+            "bbox": list(self.bbox(name)),
+            "layers": {layer: list(bbox) for layer, bbox in self.layer_bboxes(name).items()},
+            "pads": self.pads(name),
+        }
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(description="Print footprint geometry from a sidecar.", usage="%(prog)s [options]")
+
+    parser.add_argument("sidecar", type=str, help=f"{GEOMETRY_EXTENSION} file")
+    parser.add_argument("names", type=str, nargs="*", help="footprints to print (default: list the footprints)")
+
+    args = parser.parse_args()
+
+    # --------------------- Print ---------------------
+    with GeometrySidecar(args.sidecar) as sidecar:
+        if len(args.names) == 0:
+            for name in sidecar.names():
+                print(name)
+            return
+
+        print(json.dumps({name: sidecar.footprint(name) for name in args.names}, indent=1))
+
+
+if __name__ == "__main__":
+    tui()
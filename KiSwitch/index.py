@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import bisect
+import json
+import os
+import re
+import sys
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from KiSwitch.util import footprint_bbox
+
+INDEX_VERSION = 1
+
+INDEX_FILE = "index.json"
+
+_SIZE_RE = re.compile(r"^(\d+(?:\.\d+)?)u$")
+
+# query words that stand for several tag words
+QUERY_SYNONYMS = {
+    "rotated": ["90deg", "180deg", "270deg"],
+    "hot-swap": ["hotswap"],
+    "iso": ["isoenter"],
+}
+
+
+def normalize_word(word: str) -> str:
+    word = word.lower().strip(",;")
+
+    # keycap sizes are tagged with two decimals, "1.5u" finds "1.50u"
+    match = _SIZE_RE.match(word)
+    if match is not None:
+        return f"{float(match.group(1)):.2f}u"
+
+    return word
+
+
+def tokenize_tags(tags: str) -> list[str]:
+    words = []
+    for word in tags.split():
+        word = normalize_word(word)
+        if word and word not in words:
+            words.append(word)
+    return words
+
+
+def footprint_fields(footprint) -> dict:
+    models = [node.filename for node in footprint.serialize() if node.__class__.__name__ == "Model"]
+
+    return {
+        "name": footprint.name,
+        "description": footprint.description,
+        "tags": footprint.tags,
+        "bbox": [round(value, 4) for value in footprint_bbox(footprint)],
+        "models": models,
+    }
+
+
+class FootprintIndex:
+    def __init__(self, entries: list = None):
+        self.entries = []
+        # tag word -> sorted entry ids
+        self.words = {}
+        self._vocabulary = None
+
+        for entry in entries or []:
+            self._add_entry(entry)
+
+    def _add_entry(self, entry: dict) -> None:
+        entry_id = len(self.entries)
+        self.entries.append(entry)
+
+        for word in tokenize_tags(f"{entry['name']} {entry['tags'] or ''}".replace("_", " ")):
+            self.words.setdefault(word, []).append(entry_id)
+
+        self._vocabulary = None
+
+    def add(
+        self,
+        footprint,
+        group: str,
+        switch: str = None,
+        params: dict = None,
+        keycap: str = None,
+        keycap_size: str = None,
+    ) -> dict:
+        return self.add_fields(footprint_fields(footprint), group, switch, params, keycap, keycap_size)
+
+    def add_fields(
+        self,
+        fields: dict,
+        group: str,
+        switch: str = None,
+        params: dict = None,
+        keycap: str = None,
+        keycap_size: str = None,
+    ) -> dict:
+        # fields are what footprint_fields took from the footprint, kept by callers that no longer have it
+        entry = {
+            "name": fields["name"],
+            "group": group,
+            "switch": switch,
+            "params": {key: value for key, value in sorted((params or {}).items())},
+            "keycap": keycap,
+            "keycap_size": keycap_size,
+            "description": fields["description"],
+            "tags": fields["tags"],
+            "bbox": fields["bbox"],
+            "models": fields["models"],
+        }
+
+        self._add_entry(entry)
+        return entry
+
+    def _match_word(self, word: str) -> set:
+        words = [word] + QUERY_SYNONYMS.get(word, [])
+        matched = set()
+
+        for word in words:
+            if word in self.words:
+                matched.update(self.words[word])
+                continue
+
+            # unknown words match as a prefix, "plat" finds "plated"
+            if self._vocabulary is None:
+                self._vocabulary = sorted(self.words.keys())
+            start = bisect.bisect_left(self._vocabulary, word)
+            for candidate in self._vocabulary[start:]:
+                if not candidate.startswith(word):
+                    break
+                matched.update(self.words[candidate])
+
+        return matched
+
+    def search(self, query: str) -> list[dict]:
+        # every query word has to match, results keep the build order
+        matches = None
+        for word in query.split():
+            word = normalize_word(word)
+            if not word:
+                continue
+
+            found = self._match_word(word)
+            matches = found if matches is None else matches & found
+            if not matches:
+                return []
+
+        if matches is None:
+            return []
+
+        return [self.entries[entry_id] for entry_id in sorted(matches)]
+
+    def to_dict(self) -> dict:
+        return {"version": INDEX_VERSION, "entries": self.entries, "words": dict(sorted(self.words.items()))}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FootprintIndex":
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version {data.get('version')}")
+
+        index = cls()
+        index.entries = data["entries"]
+        index.words = data["words"]
+        return index
+
+    def write(self, path: str) -> None:
+        # compact separators, the index ships next to the library
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def read(cls, path: str) -> "FootprintIndex":
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(description="Search the footprint index.", usage="%(prog)s [options] query")
+
+    parser.add_argument(
+        "-i",
+        "--index",
+        type=str,
+        default=f"./output/{INDEX_FILE}",
+        help="index file, written by keyswitch_generator.py into its output (default: %(default)s)",
+    )
+    parser.add_argument("query", type=str, nargs="+", help="words to search for")
+
+    args = parser.parse_args()
+
+    # --------------------- Search ---------------------
+    for entry in FootprintIndex.read(args.index).search(" ".join(args.query)):
+        print(f"{entry['group']}:{entry['name']}")
+
+
+if __name__ == "__main__":
+    tui()
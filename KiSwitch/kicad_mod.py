@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import concurrent.futures
+import glob
+import math
+import mmap
+import os
+import sys
+import time
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from KiSwitch.deps_path import deps_path
+from KiSwitch.sexpr import parse_sexpr, sexpr_find
+
+with deps_path():
+    from KicadModTree.nodes.Footprint import Footprint
+    from KicadModTree.nodes.base import Arc, Circle, Line, Model, Pad, Polygon, Text
+
+# below this many files a library is parsed in process, a worker pool only pays off on larger libraries
+PARALLEL_MIN_FILES = 64
+
+
+def _xy(sexpr: list, keyword: str) -> list[float]:
+    return [float(value) for value in sexpr_find(sexpr, keyword)[1:3]]
+
+
+def _xyz(sexpr: list, keyword: str) -> list[float]:
+    item = sexpr_find(sexpr, keyword)
+    if item is None:
+        return None
+    return [float(value) for value in sexpr_find(item, "xyz")[1:4]]
+
+
+def _value(sexpr: list, keyword: str, default=None):
+    item = sexpr_find(sexpr, keyword)
+    return item[1] if item is not None and len(item) > 1 else default
+
+
+def _width(sexpr: list) -> float:
+    width = _value(sexpr, "width")
+    return float(width) if width is not None else None
+
+
+def _read_line(sexpr: list):
+    return Line(start=_xy(sexpr, "start"), end=_xy(sexpr, "end"), layer=_value(sexpr, "layer"), width=_width(sexpr))
+
+
+def _read_circle(sexpr: list):
+    center = _xy(sexpr, "center")
+    end = _xy(sexpr, "end")
+    radius = math.hypot(end[0] - center[0], end[1] - center[1])
+    return Circle(center=center, radius=radius, layer=_value(sexpr, "layer"), width=_width(sexpr))
+
+
+def _read_arc(sexpr: list):
+    # legacy arcs store the center as start and the start point as end
+    return Arc(
+        center=_xy(sexpr, "start"),
+        start=_xy(sexpr, "end"),
+        angle=float(_value(sexpr, "angle")),
+        layer=_value(sexpr, "layer"),
+        width=_width(sexpr),
+    )
+
+
+def _read_poly(sexpr: list):
+    points = [[float(point[1]), float(point[2])] for point in sexpr_find(sexpr, "pts")[1:]]
+    return Polygon(nodes=points, layer=_value(sexpr, "layer"), width=_width(sexpr))
+
+
+def _read_text(sexpr: list):
+    at = sexpr_find(sexpr, "at")
+    font = sexpr_find(sexpr_find(sexpr, "effects"), "font")
+    justify = sexpr_find(sexpr_find(sexpr, "effects"), "justify")
+
+    return Text(
+        type=sexpr[1],
+        text=sexpr[2],
+        at=[float(at[1]), float(at[2])],
+        rotation=float(at[3]) if len(at) > 3 else 0,
+        layer=_value(sexpr, "layer"),
+        size=_xy(font, "size"),
+        thickness=float(_value(font, "thickness")),
+        hide="hide" in sexpr[3:],
+        mirror=justify is not None and "mirror" in justify,
+    )
+
+
+def _read_pad(sexpr: list):
+    at = sexpr_find(sexpr, "at")
+
+    kwargs = {
+        "number": sexpr[1],
+        "type": sexpr[2],
+        "shape": sexpr[3],
+        "at": [float(at[1]), float(at[2])],
+        "rotation": float(at[3]) if len(at) > 3 else 0,
+        "size": _xy(sexpr, "size"),
+        "layers": sexpr_find(sexpr, "layers")[1:],
+    }
+
+    drill = sexpr_find(sexpr, "drill")
+    if drill is not None:
+        values = [item for item in drill[1:] if not isinstance(item, list)]
+        if values[0] == "oval":
+            kwargs["drill"] = [float(values[1]), float(values[2])]
+        else:
+            kwargs["drill"] = float(values[0])
+
+        offset = sexpr_find(drill, "offset")
+        if offset is not None:
+            kwargs["offset"] = [float(offset[1]), float(offset[2])]
+
+    for keyword in ["solder_mask_margin", "solder_paste_margin", "solder_paste_margin_ratio"]:
+        value = _value(sexpr, keyword)
+        if value is not None:
+            kwargs[keyword] = float(value)
+
+    radius_ratio = _value(sexpr, "roundrect_rratio")
+    if radius_ratio is not None:
+        kwargs["radius_ratio"] = float(radius_ratio)
+
+    return Pad(**kwargs)
+
+
+def _read_model(sexpr: list):
+    # kicad 5 files use (at), newer ones (offset), both in the same units as the serializer expects
+    kwargs = {"filename": sexpr[1], "at": _xyz(sexpr, "at") or _xyz(sexpr, "offset")}
+    kwargs["scale"] = _xyz(sexpr, "scale")
+    kwargs["rotate"] = _xyz(sexpr, "rotate")
+    return Model(**{key: value for key, value in kwargs.items() if value is not None})
+
+
+READERS = {
+    "fp_line": _read_line,
+    "fp_circle": _read_circle,
+    "fp_arc": _read_arc,
+    "fp_poly": _read_poly,
+    "fp_text": _read_text,
+    "pad": _read_pad,
+    "model": _read_model,
+}
+
+
+def footprint_from_sexpr(sexpr: list) -> Footprint:
+    if len(sexpr) < 2 or sexpr[0] not in {"module", "footprint"}:
+        raise ValueError("Not a footprint")
+
+    footprint = Footprint(sexpr[1])
+    footprint.setDescription(_value(sexpr, "descr"))
+    footprint.setTags(_value(sexpr, "tags"))
+    footprint.setAttribute(_value(sexpr, "attr"))
+
+    for keyword, setter in [
+        ("solder_mask_margin", footprint.setMaskMargin),
+        ("solder_paste_margin", footprint.setPasteMargin),
+        ("solder_paste_ratio", footprint.setPasteMarginRatio),
+    ]:
+        value = _value(sexpr, keyword)
+        if value is not None:
+            setter(float(value))
+
+    # unknown items are skipped, the nodes cover everything the generator writes
+    for item in sexpr[2:]:
+        if isinstance(item, list) and len(item) > 0 and item[0] in READERS:
+            footprint.append(READERS[item[0]](item))
+
+    return footprint
+
+
+def parse_kicad_mod(path: str) -> list:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Empty footprint file {path}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return parse_sexpr(buffer)
+
+
+def read_kicad_mod(path: str) -> Footprint:
+    return footprint_from_sexpr(parse_kicad_mod(path))
+
+
+def read_pretty(pretty_path: str, jobs: int = None) -> dict:
+    footprint_files = sorted(glob.glob(os.path.join(pretty_path, "*.kicad_mod")))
+    return _read_files({os.path.splitext(os.path.basename(path))[0]: path for path in footprint_files}, jobs)
+
+
+def read_library(library_path: str, jobs: int = None) -> dict:
+    # footprints of every .pretty directory, keyed by "group:name"
+    footprint_files = {}
+    for path in sorted(glob.glob(os.path.join(library_path, "*.pretty", "*.kicad_mod"))):
+        group = os.path.splitext(os.path.basename(os.path.dirname(path)))[0]
+        name = os.path.splitext(os.path.basename(path))[0]
+        footprint_files[f"{group}:{name}"] = path
+
+    return _read_files(footprint_files, jobs)
+
+
+def _read_files(footprint_files: dict, jobs: int = None) -> dict:
+    workers = jobs if jobs is not None else os.cpu_count() or 1
+
+    # starting the workers and pickling the node trees back costs more than parsing a few files in process
+    if workers <= 1 or len(footprint_files) < PARALLEL_MIN_FILES:
+        return {key: read_kicad_mod(path) for key, path in footprint_files.items()}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        # chunking keeps the per task overhead small, footprints are only a few kB each
+        chunksize = max(1, len(footprint_files) // (4 * workers))
+        footprints = executor.map(read_kicad_mod, footprint_files.values(), chunksize=chunksize)
+        return dict(zip(footprint_files.keys(), footprints))
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(description="Read a footprint library.", usage="%(prog)s [options] path")
+
+    parser.add_argument("path", type=str, help="library path, a .pretty directory or a .kicad_mod file")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: cpu count)")
+
+    args = parser.parse_args()
+
+    # --------------------- Read ---------------------
+    start = time.perf_counter()
+
+    if os.path.isfile(args.path):
+        footprints = {os.path.basename(args.path): read_kicad_mod(args.path)}
+    elif args.path.endswith(".pretty"):
+        footprints = read_pretty(args.path, args.jobs)
+    else:
+        footprints = read_library(args.path, args.jobs)
+
+    nodes = sum(len(footprint.serialize()) for footprint in footprints.values())
+    print(f"{len(footprints)} footprints, {nodes} nodes in {time.perf_counter() - start:.3f} s")
+
+
+if __name__ == "__main__":
+    tui()
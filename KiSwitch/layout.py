@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from KiSwitch.footprint_cache import FootprintCache
+from KiSwitch.generator import (
+    KEYCAPS,
+    SWITCHES,
+    ParseKwargs,
+    build_switch,
+    footprint_metadata,
+    generate_switch,
+    write_footprint_data,
+)
+from KiSwitch.keycap import Keycap
+from KiSwitch.switch import StabilizerCherryMX
+
+STABILIZER = "StabilizerCherryMX"
+
+# keyboard-layout-editor key properties, the ones marked per key are reset after every key
+KLE_KEY_DEFAULTS = {
+    "x": 0.0,
+    "y": 0.0,
+    "width": 1.0,
+    "height": 1.0,
+    "x2": 0.0,
+    "y2": 0.0,
+    "width2": 0.0,
+    "height2": 0.0,
+    "rotation": 0.0,
+    "rotation_x": 0.0,
+    "rotation_y": 0.0,
+    "decal": False,
+}
+
+KLE_PER_KEY = ["width", "height", "x2", "y2", "width2", "height2", "decal"]
+
+# the ISO enter as keyboard-layout-editor draws it, a 1.25u x 2u key with a 1.5u wide top
+KLE_ISO_ENTER = {"width": 1.25, "height": 2.0, "x2": -0.25, "y2": 0.0, "width2": 1.5, "height2": 1.0}
+
+# raw data copied from keyboard-layout-editor has unquoted keys
+_KLE_KEY_RE = re.compile(r'"(?:[^"\\]|\\.)*"|(?<=[{,])(\s*)([A-Za-z_]\w*)(\s*:)')
+
+
+def read_kle(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        quoted = _KLE_KEY_RE.sub(lambda m: m.group(0) if m.group(2) is None else f'{m[1]}"{m[2]}"{m[3]}', text)
+        data = json.loads(f"[{quoted}]")
+
+    # the layout is sometimes saved as an object with the rows under "keys"
+    if isinstance(data, dict):
+        data = data.get("keys", [])
+
+    if not isinstance(data, list):
+        raise ValueError(f"Invalid layout {path}, expected a list of rows")
+
+    return data
+
+
+def _kle_excerpt(value) -> str:
+    text = json.dumps(value)
+    return text if len(text) <= 40 else f"{text[:37]}..."
+
+
+def parse_kle(rows: list) -> list[dict]:
+    # follows the deserializer of keyboard-layout-editor, positions are in key units
+    keys = []
+    current = dict(KLE_KEY_DEFAULTS)
+
+    for index, row in enumerate(rows, 1):
+        # keyboard metadata
+        if isinstance(row, dict):
+            continue
+        if not isinstance(row, list):
+            raise ValueError(f"Invalid layout row {index}, expected a list of keys: {_kle_excerpt(row)}")
+
+        for item in row:
+            if not isinstance(item, (str, dict)):
+                raise ValueError(
+                    f"Invalid layout row {index}, expected key labels and properties: {_kle_excerpt(item)}"
+                )
+
+            if isinstance(item, str):
+                key = dict(current)
+                key["width2"] = key["width2"] or key["width"]
+                key["height2"] = key["height2"] or key["height"]
+                key["label"] = " ".join(line for line in item.split("\n") if line)
+                keys.append(key)
+
+                current["x"] += current["width"]
+                for name in KLE_PER_KEY:
+                    current[name] = KLE_KEY_DEFAULTS[name]
+                continue
+
+            if "r" in item:
+                current["rotation"] = float(item["r"])
+            if "rx" in item:
+                current["rotation_x"] = current["x"] = float(item["rx"])
+                current["y"] = current["rotation_y"]
+            if "ry" in item:
+                current["rotation_y"] = current["y"] = float(item["ry"])
+                current["x"] = current["rotation_x"]
+
+            current["x"] += float(item.get("x", 0))
+            current["y"] += float(item.get("y", 0))
+
+            if "w" in item:
+                current["width"] = current["width2"] = float(item["w"])
+            if "h" in item:
+                current["height"] = current["height2"] = float(item["h"])
+            for name, short_name in [("x2", "x2"), ("y2", "y2"), ("width2", "w2"), ("height2", "h2")]:
+                if short_name in item:
+                    current[name] = float(item[short_name])
+            if "d" in item:
+                current["decal"] = bool(item["d"])
+
+        current["y"] += 1
+        current["x"] = current["rotation_x"]
+
+    return keys
+
+
+def _keycap_shapes() -> dict:
+    # (type, width, rotation) -> keycap size, offset shapes can't be told apart in a layout
+    shapes = {}
+    for size, shape in Keycap.KEYCAP_DEFAULT_SHAPES.items():
+        if shape.get("offset_x", 0) != 0 or shape.get("offset_y", 0) != 0:
+            continue
+        shapes[(shape["type"], shape.get("width"), shape.get("rotation", 0))] = size
+    return shapes
+
+
+KEYCAP_SHAPES = _keycap_shapes()
+
+
+def key_shape(key: dict) -> str:
+    # the keycap size of a key, keys taller than they are wide use the 90 degree shapes
+    if all(key[name] == value for name, value in KLE_ISO_ENTER.items()):
+        return Keycap.KEYCAP_ISO_ENTER
+
+    if key["x2"] != 0 or key["y2"] != 0 or key["width2"] != key["width"] or key["height2"] != key["height"]:
+        raise ValueError(f"key {key['label']!r} at {key['x']}, {key['y']} has an unsupported shape")
+
+    if key["height"] > key["width"]:
+        shape = (Keycap.KEYCAP_TYPE_REGULAR, key["height"], 90) if key["width"] == 1 else None
+    else:
+        shape = (Keycap.KEYCAP_TYPE_REGULAR, key["width"], 0) if key["height"] == 1 else None
+
+    if shape not in KEYCAP_SHAPES:
+        raise ValueError(f"key {key['label']!r} of {key['width']:g}u x {key['height']:g}u has no keycap shape")
+
+    return KEYCAP_SHAPES[shape]
+
+
+def key_stabilizer(key: dict) -> tuple[float, float]:
+    # stabilizer size and rotation for a key, None for keys without one
+    if key_shape(key) == Keycap.KEYCAP_ISO_ENTER:
+        length, rotation = key["height"], 90
+    elif key["height"] > key["width"]:
+        length, rotation = key["height"], 90
+    else:
+        length, rotation = key["width"], 0
+
+    tag = f"{length:.2f}u"
+    for size, entry in StabilizerCherryMX.LU_TABLE.items():
+        if tag in entry["tags"]:
+            return size, rotation
+
+    return None
+
+
+def key_position(key: dict, spacing_x: float, spacing_y: float) -> tuple[float, float, float]:
+    # switch center in mm and its kicad rotation, keyboard-layout-editor rotates clockwise around rx, ry
+    origin_x = key["rotation_x"] * spacing_x
+    origin_y = key["rotation_y"] * spacing_y
+    x = (key["x"] + key["width"] / 2) * spacing_x - origin_x
+    y = (key["y"] + key["height"] / 2) * spacing_y - origin_y
+
+    angle = math.radians(key["rotation"])
+    cos, sin = math.cos(angle), math.sin(angle)
+
+    return origin_x + x * cos - y * sin, origin_y + x * sin + y * cos, -key["rotation"] % 360
+
+
+def keycap_spacing(keycap: str = None, keycap_args: dict = {}) -> tuple[float, float]:
+    # size of one key unit in mm, as the keycap would be built
+    if keycap is not None and keycap not in KEYCAPS:
+        raise ValueError(f"{keycap} is an invalid keycap, valid keycaps are {KEYCAPS.keys()}")
+
+    keycap_class = KEYCAPS[keycap if keycap is not None else "Keycap"]
+    spacing_x = float(keycap_args.get("spacing_x", keycap_class.spacing_x))
+    spacing_y = keycap_args.get("spacing_y", keycap_class.spacing_y)
+    return spacing_x, float(spacing_y) if spacing_y is not None else spacing_x
+
+
+def layout_footprints(
+    keys: list[dict],
+    switch: str,
+    args: dict = {},
+    keycap: str = None,
+    keycap_args: dict = {},
+    stabilizers: bool = False,
+) -> tuple[list[dict], list[dict]]:
+    # the distinct footprints a layout needs and the placement of every key, placements refer to footprints by index
+    if switch not in SWITCHES:
+        raise ValueError(f"{switch} is an invalid switch, valid switches are {SWITCHES.keys()}")
+
+    spacing_x, spacing_y = keycap_spacing(keycap, keycap_args)
+
+    footprints = []
+    footprint_ids = {}
+    placements = []
+
+    def footprint_id(footprint: dict) -> int:
+        spec = json.dumps(footprint, sort_keys=True)
+        if spec not in footprint_ids:
+            footprint_ids[spec] = len(footprints)
+            footprints.append(footprint)
+        return footprint_ids[spec]
+
+    for key in keys:
+        if key["decal"]:
+            continue
+
+        size = key_shape(key)
+        x, y, rotation = key_position(key, spacing_x, spacing_y)
+
+        footprint = {"switch": switch, "args": args, "keycap": keycap, "keycap_size": size if keycap else None}
+        placements.append(
+            {"label": key["label"], "footprint": footprint_id(footprint), "x": x, "y": y, "rotation": rotation}
+        )
+
+        stabilizer = key_stabilizer(key) if stabilizers else None
+        if stabilizer is not None:
+            footprint = {"switch": STABILIZER, "args": {"size": stabilizer[0]}, "keycap": None, "keycap_size": None}
+            placements.append(
+                {
+                    "label": key["label"],
+                    "footprint": footprint_id(footprint),
+                    "x": x,
+                    "y": y,
+                    "rotation": (rotation + stabilizer[1]) % 360,
+                }
+            )
+
+    return footprints, placements
+
+
+def build_layout(
+    keys: list[dict],
+    switch: str,
+    args: dict = {},
+    keycap: str = None,
+    keycap_args: dict = {},
+    stabilizers: bool = False,
+) -> tuple[list, list[dict]]:
+    # the distinct footprints of a layout built in memory, placements refer to them by index
+    specs, placements = layout_footprints(keys, switch, args, keycap, keycap_args, stabilizers)
+
+    footprints = []
+    for spec in specs:
+        spec_keycap_args = keycap_args if spec["keycap"] is not None else {}
+        footprints.append(
+            build_switch(spec["switch"], spec["args"], spec["keycap"], spec["keycap_size"], spec_keycap_args)
+        )
+
+    return footprints, placements
+
+
+def render_layout(
+    output_path: str,
+    keys: list[dict],
+    switch: str,
+    args: dict = {},
+    keycap: str = None,
+    keycap_args: dict = {},
+    stabilizers: bool = False,
+    index=None,
+    cache=None,
+) -> list[dict]:
+    # writes each distinct footprint once, returns the placements with the footprint and switch names
+    footprints, placements = layout_footprints(keys, switch, args, keycap, keycap_args, stabilizers)
+
+    if not os.path.isdir(output_path):
+        os.mkdir(output_path)
+
+    group = os.path.splitext(os.path.basename(os.path.normpath(output_path)))[0]
+
+    names = []
+    for footprint in footprints:
+        keycap_args_used = keycap_args if footprint["keycap"] is not None else {}
+        name, data, switch_footprint, metadata = generate_switch(
+            footprint["switch"],
+            footprint["args"],
+            footprint["keycap"],
+            footprint["keycap_size"],
+            keycap_args_used,
+            cache,
+        )
+        write_footprint_data(output_path, name, data)
+        names.append(name)
+
+        if index is not None:
+            if metadata is None:
+                metadata = footprint_metadata(switch_footprint)
+            index.add_fields(
+                metadata["index"],
+                group,
+                footprint["switch"],
+                footprint["args"],
+                footprint["keycap"],
+                footprint["keycap_size"],
+            )
+
+    return [
+        dict(placement, footprint=names[placement["footprint"]], switch=footprints[placement["footprint"]]["switch"])
+        for placement in placements
+    ]
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(
+        description="Generate the footprints of a keyboard-layout-editor layout.", usage="%(prog)s [options]"
+    )
+
+    parser.add_argument("-o", "--output", type=str, default="./output", help="output path (default: %(default)s)")
+    parser.add_argument(
+        "-a",
+        "--switch-arg",
+        type=str,
+        nargs="+",
+        action=ParseKwargs,
+        default={},
+        help="switch arguments (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-k", "--keycap", type=str, choices=KEYCAPS.keys(), help="keycap (default: the switch default keycap)"
+    )
+    parser.add_argument(
+        "-b",
+        "--keycap-arg",
+        type=str,
+        nargs="+",
+        action=ParseKwargs,
+        default={},
+        help="keycap arguments (default: %(default)s)",
+    )
+    parser.add_argument("-s", "--stabilizers", action="store_true", help="add stabilizers to the keys 2u and longer")
+    parser.add_argument("-p", "--placements", type=str, help="write the key placements to this json file")
+    parser.add_argument("-c", "--cache", type=str, default=None, help="generation cache path (default: user cache)")
+    parser.add_argument("--no-cache", action="store_true", help="build every footprint from scratch")
+    parser.add_argument("layout", type=str, help="keyboard-layout-editor json file")
+    parser.add_argument("switch", type=str, choices=SWITCHES.keys(), help="switch to use")
+
+    args = parser.parse_args()
+
+    # --------------------- Generate ---------------------
+    keycap = args.keycap if args.keycap is not None else SWITCHES[args.switch].DEFAULT_KEYCAP
+    keys = parse_kle(read_kle(args.layout))
+
+    cache = None if args.no_cache else FootprintCache(args.cache)
+
+    placements = render_layout(
+        args.output, keys, args.switch, args.switch_arg, keycap, args.keycap_arg, args.stabilizers, cache=cache
+    )
+
+    if cache is not None:
+        cache.prune()
+
+    if args.placements is not None:
+        with open(args.placements, "w") as f:
+            json.dump(placements, f, indent=1)
+
+    footprints = sorted(set(placement["footprint"] for placement in placements))
+    for footprint in footprints:
+        count = sum(1 for placement in placements if placement["footprint"] == footprint)
+        print(f"{count:4d} {footprint}")
+
+    print(f"{len(placements)} placements, {len(footprints)} footprints")
+
+
+if __name__ == "__main__":
+    tui()
@@ -0,0 +1,422 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import glob
+import hashlib
+import io
+import math
+import os
+import sys
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+
+from KiSwitch.vrml import VRML_ATOMS, VRML_HEADER, VrmlNode, VrmlUse, format_vrml, iter_vrml
+
+# nodes that only hold values, identical ones are written once and referenced with USE
+DEDUP_TYPES = {
+    "Appearance",
+    "Color",
+    "Coordinate",
+    "ImageTexture",
+    "IndexedFaceSet",
+    "Material",
+    "TextureCoordinate",
+    "TextureTransform",
+}
+
+NAME_PREFIXES = {"Appearance": "a", "Coordinate": "c", "IndexedFaceSet": "g", "Material": "m"}
+
+# kicad computes its own normals from the crease angle
+DROPPED_FIELDS = {"IndexedFaceSet": {"normal", "normalIndex", "normalPerVertex"}}
+
+DEFAULT_FIELDS = {
+    "IndexedFaceSet": {"ccw": ("TRUE",), "convex": ("TRUE",), "solid": ("TRUE",), "creaseAngle": (0,)},
+    "Material": {
+        "ambientIntensity": (0.2,),
+        "diffuseColor": (0.8, 0.8, 0.8),
+        "emissiveColor": (0, 0, 0),
+        "shininess": (0.2,),
+        "specularColor": (0, 0, 0),
+        "transparency": (0,),
+    },
+}
+
+# faces of merged shapes must agree on everything but their coordinates and indices
+MERGE_FIELDS = {"coord", "coordIndex", "ccw", "convex", "solid", "creaseAngle"}
+
+
+class _Processed:
+    # a field value that already went through the compactor
+    def __init__(self, value, digest: str):
+        self.value = value
+        self.digest = digest
+
+
+def _compact_number(token: str) -> str:
+    if token.startswith('"') or token in VRML_ATOMS or token.lstrip("-").isdigit():
+        return token
+    try:
+        value = float(token)
+    except ValueError:
+        return token
+
+    text = repr(value)
+    if text.endswith(".0"):
+        text = text[:-2]
+    if text == "-0":
+        text = "0"
+    return text if len(text) < len(token) else token
+
+
+def _is_default(node: VrmlNode, field: str, value) -> bool:
+    default = DEFAULT_FIELDS.get(node.type, {}).get(field)
+    if default is None or not isinstance(value, tuple) or len(value) != len(default):
+        return False
+    for token, default_value in zip(value, default):
+        if isinstance(default_value, str):
+            if token != default_value:
+                return False
+        else:
+            try:
+                if float(token) != default_value:
+                    return False
+            except ValueError:
+                return False
+    return True
+
+
+def _faces(coord_index: list) -> list[list[int]]:
+    indices = np.array(coord_index, dtype=str).astype(np.int64)
+    ends = np.nonzero(indices < 0)[0]
+    faces = np.split(indices, ends)
+    return [face[face >= 0].tolist() for face in faces if np.count_nonzero(face >= 0) > 0]
+
+
+def face_normals(points: np.ndarray, faces: list) -> np.ndarray:
+    # newell's method, robust for non planar polygons, faces are batched by their vertex count
+    normals = np.zeros((len(faces), 3))
+
+    by_length = {}
+    for number, face in enumerate(faces):
+        by_length.setdefault(len(face), []).append(number)
+
+    for numbers in by_length.values():
+        vertices = points[np.array([faces[number] for number in numbers])]
+        normal = np.cross(vertices, np.roll(vertices, -1, axis=1)).sum(axis=1)
+        length = np.linalg.norm(normal, axis=1, keepdims=True)
+        normals[numbers] = np.divide(normal, length, out=np.zeros_like(normal), where=length > 0)
+
+    return normals
+
+
+def weld_vertices(quantized: np.ndarray, points: np.ndarray, faces: list, crease_angle: float) -> np.ndarray:
+    # maps every vertex to the first one at the same quantized position. kicad smooths normals across the faces
+    # sharing a vertex index, so a group is only welded when no faces it would join lie within the crease angle
+    _, first, inverse = np.unique(quantized, axis=0, return_index=True, return_inverse=True)
+    mapping = first[inverse.reshape(-1)]
+
+    duplicates = np.nonzero(mapping != np.arange(len(mapping)))[0]
+    if len(duplicates) == 0 or crease_angle <= 0:
+        return mapping
+
+    groups = {}
+    for vertex in duplicates:
+        groups.setdefault(int(mapping[vertex]), [int(mapping[vertex])]).append(int(vertex))
+
+    grouped = {vertex for members in groups.values() for vertex in members}
+    incident = {}
+    for number, face in enumerate(faces):
+        for vertex in face:
+            if vertex in grouped:
+                incident.setdefault(vertex, []).append(number)
+
+    needed = sorted({face for faces_of_vertex in incident.values() for face in faces_of_vertex})
+    normals = face_normals(points, [faces[face] for face in needed])
+    normal_rows = {face: row for row, face in enumerate(needed)}
+    min_dot = math.cos(crease_angle)
+
+    for members in groups.values():
+        member_normals = [normals[[normal_rows[face] for face in incident.get(vertex, [])]] for vertex in members]
+
+        smoothed = any(
+            (member_normals[a] @ member_normals[b].T > min_dot).any()
+            for a in range(len(members))
+            for b in range(a + 1, len(members))
+        )
+        if smoothed:
+            mapping[members] = members
+
+    return mapping
+
+
+class VrmlCompactor:
+    def __init__(self, precision: int = 4, weld: bool = True):
+        self.precision = precision
+        self.scale = 10**precision
+        self.weld = weld
+
+        self.names = {}  # input DEF name -> output name
+        self.digests = {}  # output name -> content digest
+        self.named = {}  # content digest -> output name
+        self.pending = {}  # input DEF name -> node defined by a shape without geometry
+        self.count = 0
+
+    def _new_name(self, node: VrmlNode) -> str:
+        self.count += 1
+        return f"{NAME_PREFIXES.get(node.type, 'n')}{self.count - 1}"
+
+    def _collect_pending(self, value) -> None:
+        # palette shapes only define materials, they are emitted where they are first used
+        if isinstance(value, VrmlNode):
+            if value.name is not None:
+                self.pending[value.name] = value
+                return
+            for _, field_value in value.fields:
+                self._collect_pending(field_value)
+        elif isinstance(value, list):
+            for item in value:
+                self._collect_pending(item)
+
+    def _compact_faceset(self, node: VrmlNode) -> None:
+        coord = node.get("coord")
+        coord_index = node.get("coordIndex", [])
+
+        if not isinstance(coord, VrmlNode) or coord.name is not None:
+            return
+
+        points = np.array([float(value) for value in coord.get("point", [])]).reshape(-1, 3)
+        quantized = np.round(points * self.scale).astype(np.int64)
+
+        # colors and texture coordinates may be indexed by vertex, those keep their vertices as they are
+        indexed = any(node.get(field) is not None for field in ["color", "texCoord", "colorIndex", "texCoordIndex"])
+
+        faces = _faces(coord_index)
+        if self.weld and not indexed and len(points) > 0:
+            crease_angle = float(node.get("creaseAngle", ("0",))[0])
+            mapping = weld_vertices(quantized, points, faces, crease_angle)
+
+            welded_faces = []
+            for face in faces:
+                face = [int(mapping[index]) for index in face]
+                face = [index for number, index in enumerate(face) if index != face[number - 1]]
+                if len(face) >= 3:
+                    welded_faces.append(face)
+
+            indices = np.array([index for face in welded_faces for index in face], dtype=np.int64)
+            used, inverse = np.unique(indices, return_inverse=True)
+            quantized = quantized[used]
+
+            faces = []
+            position = 0
+            for face in welded_faces:
+                faces.append(inverse[position : position + len(face)].tolist())
+                position += len(face)
+
+            node.set("coordIndex", [str(index) for face in faces for index in face + [-1]])
+
+        coord.set("point", [self._format_coordinate(value) for value in quantized.reshape(-1)])
+
+    def _format_coordinate(self, value: int) -> str:
+        sign = "-" if value < 0 else ""
+        integer, fraction = divmod(abs(int(value)), self.scale)
+        fraction = f"{fraction:0{self.precision}d}".rstrip("0")
+        return f"{sign}{integer}.{fraction}" if fraction else f"{sign}{integer}"
+
+    def _process(self, value):
+        # returns the compacted value and its content digest
+        if isinstance(value, _Processed):
+            return value.value, value.digest
+
+        if isinstance(value, VrmlUse):
+            if value.name in self.pending:
+                return self._process(self.pending.pop(value.name))
+            if value.name not in self.names:
+                raise ValueError(f"USE of undefined vrml node {value.name}")
+            name = self.names[value.name]
+            return VrmlUse(name), self.digests[name]
+
+        if isinstance(value, tuple):
+            value = tuple(_compact_number(token) for token in value)
+            return value, " ".join(value)
+
+        if isinstance(value, list):
+            if any(isinstance(item, (VrmlNode, VrmlUse)) for item in value):
+                items = list(self._compact_nodes(value))
+                return [item for item, _ in items], " ".join(digest for _, digest in items)
+            value = [_compact_number(token) for token in value]
+            return value, " ".join(value)
+
+        if value.type == "IndexedFaceSet":
+            self._compact_faceset(value)
+
+        fields = []
+        digest = hashlib.sha256(value.type.encode())
+        for field, field_value in value.fields:
+            if field in DROPPED_FIELDS.get(value.type, set()):
+                continue
+            field_value, field_digest = self._process(field_value)
+            if _is_default(value, field, field_value):
+                continue
+            fields.append([field, field_value])
+            digest.update(f"{field} {field_digest} ".encode())
+        value.fields = fields
+        digest = digest.hexdigest()
+
+        if value.type in DEDUP_TYPES and digest in self.named:
+            if value.name is not None:
+                self.names[value.name] = self.named[digest]
+            return VrmlUse(self.named[digest]), digest
+
+        if value.type in DEDUP_TYPES or value.name is not None:
+            name = self._new_name(value)
+            if value.name is not None:
+                self.names[value.name] = name
+            value.name = name
+            self.digests[name] = digest
+            self.named.setdefault(digest, name)
+
+        return value, digest
+
+    def _mergeable(self, shape: VrmlNode):
+        # returns the merge key of a shape whose faces can join its neighbours, or None
+        geometry = shape.get("geometry")
+        if shape.name is not None or not isinstance(geometry, VrmlNode) or geometry.type != "IndexedFaceSet":
+            return None
+        if geometry.name is not None or any(field not in MERGE_FIELDS for field, _ in geometry.fields):
+            return None
+        coord = geometry.get("coord")
+        if not isinstance(coord, VrmlNode) or coord.name is not None:
+            return None
+
+        appearance = shape.get("appearance")
+        digest = None
+        if appearance is not None:
+            appearance, digest = self._process(appearance)
+            shape.set("appearance", _Processed(appearance, digest))
+
+        parameters = tuple(
+            (field, tuple(_compact_number(token) for token in value))
+            for field, value in sorted(geometry.fields)
+            if field not in {"coord", "coordIndex"}
+        )
+        return digest, parameters
+
+    def _merge(self, shapes: list[VrmlNode]) -> VrmlNode:
+        merged = shapes[0]
+        if len(shapes) == 1:
+            return merged
+
+        # indices are offset, not welded, so every face keeps the vertices it had
+        points = []
+        coord_index = []
+        for shape in shapes:
+            geometry = shape.get("geometry")
+            offset = len(points) // 3
+            for face in _faces(geometry.get("coordIndex", [])):
+                coord_index += [str(index + offset) for index in face] + ["-1"]
+            points += geometry.get("coord").get("point", [])
+
+        geometry = merged.get("geometry")
+        geometry.set("coordIndex", coord_index)
+        geometry.get("coord").set("point", points)
+        return merged
+
+    def compact_nodes(self, nodes):
+        for node, _ in self._compact_nodes(nodes):
+            yield node
+
+    def _compact_nodes(self, nodes):
+        # merges runs of shapes sharing an appearance, one run is held at a time
+        run = []
+        run_key = None
+
+        for node in nodes:
+            shape = isinstance(node, VrmlNode) and node.type == "Shape"
+            if shape and node.name is None and node.get("geometry") is None:
+                self._collect_pending(node)
+                continue
+
+            key = self._mergeable(node) if shape else None
+            if key is not None and key == run_key:
+                run.append(node)
+                continue
+
+            if len(run) > 0:
+                yield self._process(self._merge(run))
+            run, run_key = [], None
+
+            if key is not None:
+                run, run_key = [node], key
+            else:
+                yield self._process(node)
+
+        if len(run) > 0:
+            yield self._process(self._merge(run))
+
+
+def compact_vrml(input_file, output_file, precision: int = 4, weld: bool = True) -> None:
+    compactor = VrmlCompactor(precision, weld)
+
+    output_file.write(VRML_HEADER.encode())
+    for node in compactor.compact_nodes(iter_vrml(input_file)):
+        output_file.write(f"{format_vrml(node)}\n".encode())
+
+
+def compact_vrml_file(input_path: str, output_path: str = None, precision: int = 4, weld: bool = True) -> bytes:
+    # returns the compacted model, and writes it when an output path is given
+    output = io.BytesIO()
+    with open(input_path, "rb") as f:
+        compact_vrml(f, output, precision, weld)
+
+    if output_path is not None:
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(output.getvalue())
+        os.replace(tmp_path, output_path)
+
+    return output.getvalue()
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(description="Losslessly compact vrml models.", usage="%(prog)s [options] [files]")
+
+    parser.add_argument(
+        "files",
+        type=str,
+        nargs="*",
+        default=sorted(glob.glob("./library/3dmodels/3d-library.3dshapes/*.wrl")),
+        help="vrml files (default: the library models)",
+    )
+    parser.add_argument("-o", "--output", type=str, default=None, help="output path (default: in place)")
+    parser.add_argument(
+        "-p", "--precision", type=int, default=4, help="coordinate decimals, in 0.1 in (default: %(default)s)"
+    )
+    parser.add_argument("--no-weld", action="store_true", help="keep duplicate vertices")
+
+    args = parser.parse_args()
+
+    # --------------------- Compact ---------------------
+    if args.output is not None and not os.path.isdir(args.output):
+        os.makedirs(args.output)
+
+    total_before = total_after = 0
+    for path in args.files:
+        output_path = path if args.output is None else os.path.join(args.output, os.path.basename(path))
+        before = os.path.getsize(path)
+        after = len(compact_vrml_file(path, output_path, args.precision, not args.no_weld))
+
+        total_before += before
+        total_after += after
+        print(f"{os.path.basename(path)}: {before} -> {after} bytes")
+
+    print(f"{len(args.files)} models, {total_before} -> {total_after} bytes")
+
+
+if __name__ == "__main__":
+    tui()
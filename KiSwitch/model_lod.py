@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import glob
+import heapq
+import io
+import os
+import sys
+import time
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+
+from KiSwitch.model_compact import VrmlCompactor, _faces
+from KiSwitch.model_store import MODEL_LODS, lod_model, parse_lod_model
+from KiSwitch.vrml import VRML_HEADER, VrmlNode, VrmlUse, format_vrml, iter_vrml
+
+# open edges are held in place by planes through them, weighted well above the surface planes
+BOUNDARY_WEIGHT = 100
+
+# models this small get no reduced variants, footprints use the full model for them
+LOD_MIN_TRIANGLES = 1000
+
+# kicad vrml units are tenths of an inch
+MM_PER_UNIT = 2.54
+
+
+def _plane_quadrics(planes: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    return weights[:, None, None] * planes[:, :, None] * planes[:, None, :]
+
+
+def vertex_quadrics(points: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    vertices = points[triangles]
+    normals = np.cross(vertices[:, 1] - vertices[:, 0], vertices[:, 2] - vertices[:, 0])
+    areas = np.linalg.norm(normals, axis=1)
+    normals = np.divide(normals, areas[:, None], out=np.zeros_like(normals), where=areas[:, None] > 0)
+
+    planes = np.hstack([normals, -np.einsum("ij,ij->i", normals, vertices[:, 0])[:, None]])
+    face_quadrics = _plane_quadrics(planes, areas / 2)
+
+    quadrics = np.zeros((len(points), 4, 4))
+    for corner in range(3):
+        np.add.at(quadrics, triangles[:, corner], face_quadrics)
+
+    # edges used by a single triangle are open, a plane through the edge along the face normal keeps them in place
+    edges = np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]])
+    edge_faces = np.tile(np.arange(len(triangles)), 3)
+    keys = np.sort(edges, axis=1)
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    boundary = counts[inverse.reshape(-1)] == 1
+
+    if np.any(boundary):
+        edges, edge_faces = edges[boundary], edge_faces[boundary]
+        directions = points[edges[:, 1]] - points[edges[:, 0]]
+        lengths = np.linalg.norm(directions, axis=1)
+        normals = np.cross(directions, normals[edge_faces])
+        norms = np.linalg.norm(normals, axis=1)
+        normals = np.divide(normals, norms[:, None], out=np.zeros_like(normals), where=norms[:, None] > 0)
+
+        planes = np.hstack([normals, -np.einsum("ij,ij->i", normals, points[edges[:, 0]])[:, None]])
+        edge_quadrics = _plane_quadrics(planes, BOUNDARY_WEIGHT * lengths**2)
+        np.add.at(quadrics, edges[:, 0], edge_quadrics)
+        np.add.at(quadrics, edges[:, 1], edge_quadrics)
+
+    return quadrics
+
+
+def _cross(u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    # np.cross is slow on the handful of faces around a single collapse
+    x = u[:, 1] * v[:, 2] - u[:, 2] * v[:, 1]
+    y = u[:, 2] * v[:, 0] - u[:, 0] * v[:, 2]
+    z = u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]
+    return np.stack([x, y, z], axis=1)
+
+
+def collapse_targets(quadrics: np.ndarray, a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # the point minimizing each quadric when it is well conditioned, otherwise the best of the ends and midpoint
+    systems = quadrics[:, :3, :3]
+    solvable = np.abs(np.linalg.det(systems)) > 1e-12
+
+    optimal = np.zeros_like(a)
+    if np.any(solvable):
+        optimal[solvable] = np.linalg.solve(systems[solvable], -quadrics[solvable, :3, 3:4])[:, :, 0]
+
+    candidates = np.stack([optimal, a, b, (a + b) / 2], axis=1)
+    homogeneous = np.concatenate([candidates, np.ones(candidates.shape[:2] + (1,))], axis=2)
+    costs = np.einsum("kci,kij,kcj->kc", homogeneous, quadrics, homogeneous)
+    costs[~solvable, 0] = np.inf
+
+    best = np.argmin(costs, axis=1)
+    rows = np.arange(len(best))
+    return np.maximum(costs[rows, best], 0), candidates[rows, best]
+
+
+def decimate(points: np.ndarray, triangles: np.ndarray, ratio: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # quadric edge collapse, returns the new points, triangles and for every input point the point it collapsed into
+    points = points.astype(float).copy()
+    target = max(int(len(triangles) * ratio), 1)
+
+    quadrics = vertex_quadrics(points, triangles)
+    faces = [list(triangle) for triangle in triangles.tolist()]
+    alive = [True] * len(faces)
+    face_count = len(faces)
+
+    vertex_faces = [set() for _ in range(len(points))]
+    for number, face in enumerate(faces):
+        for vertex in face:
+            vertex_faces[vertex].add(number)
+
+    parent = list(range(len(points)))
+    version = [0] * len(points)
+    heap = []
+
+    def push(edges: np.ndarray) -> None:
+        a, b = edges[:, 0], edges[:, 1]
+        costs, targets = collapse_targets(quadrics[a] + quadrics[b], points[a], points[b])
+        for (a, b), cost, target in zip(edges.tolist(), costs.tolist(), targets):
+            heapq.heappush(heap, (cost, a, b, version[a], version[b], target))
+
+    edges = np.sort(np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]]), axis=1)
+    push(np.unique(edges, axis=0))
+
+    while face_count > target and len(heap) > 0:
+        cost, a, b, version_a, version_b, point = heapq.heappop(heap)
+        if version[a] != version_a or version[b] != version_b or parent[a] != a or parent[b] != b:
+            continue
+
+        shared = vertex_faces[a] & vertex_faces[b]
+        moved = (vertex_faces[a] | vertex_faces[b]) - shared
+
+        # reject collapses that would flip or flatten a face
+        if len(moved) > 0:
+            moved_faces = np.array([faces[number] for number in moved])
+            old = points[moved_faces]
+            new = old.copy()
+            new[(moved_faces == a) | (moved_faces == b)] = point
+            old_normals = _cross(old[:, 1] - old[:, 0], old[:, 2] - old[:, 0])
+            new_normals = _cross(new[:, 1] - new[:, 0], new[:, 2] - new[:, 0])
+            dots = np.einsum("ij,ij->i", old_normals, new_normals)
+            if np.any((dots <= 0) & (np.einsum("ij,ij->i", old_normals, old_normals) > 0)):
+                continue
+
+        for number in shared:
+            alive[number] = False
+            face_count -= 1
+            for vertex in faces[number]:
+                vertex_faces[vertex].discard(number)
+
+        for number in vertex_faces[b]:
+            faces[number] = [a if vertex == b else vertex for vertex in faces[number]]
+        vertex_faces[a] |= vertex_faces[b]
+        vertex_faces[b] = set()
+
+        points[a] = point
+        quadrics[a] += quadrics[b]
+        parent[b] = a
+        version[a] += 1
+
+        neighbours = sorted({vertex for number in vertex_faces[a] for vertex in faces[number]} - {a})
+        if len(neighbours) > 0:
+            push(np.array([[min(a, neighbour), max(a, neighbour)] for neighbour in neighbours]))
+
+    def root(vertex: int) -> int:
+        while parent[vertex] != vertex:
+            parent[vertex] = parent[parent[vertex]]
+            vertex = parent[vertex]
+        return vertex
+
+    remaining = np.array([faces[number] for number in range(len(faces)) if alive[number]], dtype=np.int64)
+    used, inverse = np.unique(remaining.reshape(-1), return_inverse=True)
+    remap = np.full(len(points), -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+
+    collapsed = remap[np.array([root(vertex) for vertex in range(len(points))], dtype=np.int64)]
+    return points[used], inverse.reshape(-1, 3), collapsed
+
+
+def _closest_points(points: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    # closest point on each triangle (n, 3, 3) to each point (n, 3), by voronoi region of the triangle
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    ab, ac, ap = b - a, c - a, points - a
+    d1, d2 = np.einsum("ij,ij->i", ab, ap), np.einsum("ij,ij->i", ac, ap)
+    bp = points - b
+    d3, d4 = np.einsum("ij,ij->i", ab, bp), np.einsum("ij,ij->i", ac, bp)
+    cp = points - c
+    d5, d6 = np.einsum("ij,ij->i", ab, cp), np.einsum("ij,ij->i", ac, cp)
+
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = va + vb + vc
+        v = np.nan_to_num(vb / denominator)
+        w = np.nan_to_num(vc / denominator)
+        result = a + ab * v[:, None] + ac * w[:, None]
+
+        edge_ab = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        t = np.nan_to_num(d1 / (d1 - d3))
+        result[edge_ab] = (a + ab * t[:, None])[edge_ab]
+
+        edge_ac = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        t = np.nan_to_num(d2 / (d2 - d6))
+        result[edge_ac] = (a + ac * t[:, None])[edge_ac]
+
+        edge_bc = (va <= 0) & ((d4 - d3) >= 0) & ((d5 - d6) >= 0)
+        t = np.nan_to_num((d4 - d3) / ((d4 - d3) + (d5 - d6)))
+        result[edge_bc] = (b + (c - b) * t[:, None])[edge_bc]
+
+    result[(d1 <= 0) & (d2 <= 0)] = a[(d1 <= 0) & (d2 <= 0)]
+    result[(d3 >= 0) & (d4 <= d3)] = b[(d3 >= 0) & (d4 <= d3)]
+    result[(d6 >= 0) & (d5 <= d6)] = c[(d6 >= 0) & (d5 <= d6)]
+
+    return result
+
+
+def surface_error(points: np.ndarray, new_points: np.ndarray, new_triangles: np.ndarray, collapsed: np.ndarray):
+    # distance of every input point to the faces around the point it collapsed into, an upper bound of the
+    # distance to the decimated surface, returns the largest and the root mean square distance
+    vertex_faces = [[] for _ in range(len(new_points))]
+    for number, triangle in enumerate(new_triangles.tolist()):
+        for vertex in triangle:
+            vertex_faces[vertex].append(number)
+
+    pairs = [
+        (point, face) for point, vertex in enumerate(collapsed.tolist()) if vertex >= 0 for face in vertex_faces[vertex]
+    ]
+    if len(pairs) == 0:
+        return 0.0, 0.0
+
+    pairs = np.array(pairs)
+    closest = _closest_points(points[pairs[:, 0]], new_points[new_triangles[pairs[:, 1]]])
+    distances = np.linalg.norm(points[pairs[:, 0]] - closest, axis=1)
+
+    nearest = np.full(len(points), np.inf)
+    np.minimum.at(nearest, pairs[:, 0], distances)
+    nearest = nearest[np.isfinite(nearest)]
+
+    return float(nearest.max()), float(np.sqrt(np.mean(nearest**2)))
+
+
+def _triangulate(faces: list) -> np.ndarray:
+    # fans, kicad triangulates the same way
+    return np.array([[face[0], face[corner], face[corner + 1]] for face in faces for corner in range(1, len(face) - 1)])
+
+
+def decimate_faceset(node: VrmlNode, ratio: float) -> tuple[int, int, float, float]:
+    coord = node.get("coord")
+    points = np.array([float(value) for value in coord.get("point", [])]).reshape(-1, 3)
+    triangles = _triangulate(_faces(node.get("coordIndex", [])))
+    if len(triangles) == 0:
+        return 0, 0, 0.0, 0.0
+
+    # collapses need a connected mesh, coincident vertices are welded first
+    _, first, inverse = np.unique(np.round(points, 6), axis=0, return_index=True, return_inverse=True)
+    welded = inverse.reshape(-1)[triangles]
+    welded = welded[(welded[:, 0] != welded[:, 1]) & (welded[:, 1] != welded[:, 2]) & (welded[:, 2] != welded[:, 0])]
+    welded_points = points[first]
+
+    new_points, new_triangles, collapsed = decimate(welded_points, welded, ratio)
+    max_error, rms_error = surface_error(welded_points, new_points, new_triangles, collapsed)
+
+    coord.set("point", [f"{value:.4f}".rstrip("0").rstrip(".") for value in new_points.reshape(-1)])
+    node.set("coordIndex", [str(index) for triangle in new_triangles.tolist() for index in triangle + [-1]])
+
+    return len(welded), len(new_triangles), max_error, rms_error
+
+
+def _facesets(value, found: list) -> None:
+    if isinstance(value, VrmlNode):
+        if value.type == "IndexedFaceSet":
+            found.append(value)
+        for _, field_value in value.fields:
+            _facesets(field_value, found)
+    elif isinstance(value, list):
+        for item in value:
+            _facesets(item, found)
+
+
+def _coordinate_uses(value, uses: dict) -> None:
+    if isinstance(value, VrmlUse):
+        uses[value.name] = uses.get(value.name, 0) + 1
+    elif isinstance(value, VrmlNode):
+        for _, field_value in value.fields:
+            _coordinate_uses(field_value, uses)
+    elif isinstance(value, list):
+        for item in value:
+            _coordinate_uses(item, uses)
+
+
+def decimate_vrml(input_file, output_file, ratio: float) -> dict:
+    # nothing is written and None is returned for models under LOD_MIN_TRIANGLES.
+    # shapes are merged and deduplicated first, so each material is decimated as one mesh
+    nodes = list(VrmlCompactor().compact_nodes(iter_vrml(input_file)))
+
+    facesets = []
+    uses = {}
+    for node in nodes:
+        _facesets(node, facesets)
+        _coordinate_uses(node, uses)
+
+    # a coordinate node shared by several face sets can not be decimated for one of them
+    facesets = [
+        faceset
+        for faceset in facesets
+        if isinstance(faceset.get("coord"), VrmlNode) and uses.get(faceset.get("coord").name, 0) == 0
+    ]
+    if sum(len(_triangulate(_faces(faceset.get("coordIndex", [])))) for faceset in facesets) < LOD_MIN_TRIANGLES:
+        return None
+
+    report = {"triangles": 0, "decimated": 0, "max_error": 0.0, "rms_error": 0.0}
+    squared_error = 0.0
+    for faceset in facesets:
+        triangles, decimated, max_error, rms_error = decimate_faceset(faceset, ratio)
+        report["triangles"] += triangles
+        report["decimated"] += decimated
+        report["max_error"] = max(report["max_error"], max_error * MM_PER_UNIT)
+        squared_error += (rms_error * MM_PER_UNIT) ** 2 * triangles
+
+    if report["triangles"] > 0:
+        report["rms_error"] = (squared_error / report["triangles"]) ** 0.5
+
+    output_file.write(VRML_HEADER.encode())
+    for node in nodes:
+        output_file.write(f"{format_vrml(node)}\n".encode())
+
+    return report
+
+
+def generate_lods(path: str, output_path: str = None, levels: list[int] = MODEL_LODS) -> dict:
+    # writes a reduced model for each level, in percent of the triangles kept, returns a report per level
+    output_path = output_path if output_path is not None else os.path.dirname(path)
+    reports = {}
+
+    for level in levels:
+        output = io.BytesIO()
+        with open(path, "rb") as f:
+            reports[level] = decimate_vrml(f, output, level / 100)
+
+        lod_path = os.path.join(output_path, lod_model(os.path.basename(path), level))
+
+        # a variant left from before the model became too small to reduce would be a stale copy
+        if reports[level] is None:
+            if os.path.isfile(lod_path):
+                os.remove(lod_path)
+            continue
+
+        tmp_path = f"{lod_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(output.getvalue())
+        os.replace(tmp_path, lod_path)
+
+    return reports
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(
+        description="Generate reduced detail vrml models.", usage="%(prog)s [options] [files]"
+    )
+
+    parser.add_argument("files", type=str, nargs="*", default=None, help="vrml files (default: the library models)")
+    parser.add_argument("-o", "--output", type=str, default=None, help="output path (default: next to each model)")
+    parser.add_argument(
+        "-l",
+        "--levels",
+        type=int,
+        nargs="+",
+        default=MODEL_LODS,
+        help="percent of the triangles to keep (default: %(default)s)",
+    )
+
+    args = parser.parse_args()
+
+    # --------------------- Decimate ---------------------
+    files = args.files or sorted(glob.glob("./library/3dmodels/3d-library.3dshapes/*.wrl"))
+    files = [path for path in files if parse_lod_model(os.path.basename(path)) is None]
+
+    if args.output is not None and not os.path.isdir(args.output):
+        os.makedirs(args.output)
+
+    for path in files:
+        start = time.perf_counter()
+        reports = generate_lods(path, args.output, args.levels)
+
+        for level, report in reports.items():
+            if report is None:
+                print(f"{lod_model(os.path.basename(path), level)}: under {LOD_MIN_TRIANGLES} triangles, not reduced")
+                continue
+            print(
+                f"{lod_model(os.path.basename(path), level)}: "
+                f"{report['triangles']} -> {report['decimated']} triangles, "
+                f"max error {report['max_error']:.3f} mm, rms {report['rms_error']:.3f} mm"
+            )
+        print(f"{os.path.basename(path)}: {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    tui()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from KiSwitch.sexpr import parse_sexpr, sexpr_find_all
+
+MANIFEST_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+
+# footprints reference the vrml model, the step model of the same name is shipped for mechanical export
+MODEL_EXTENSIONS = [".wrl", ".stp"]
+
+# reduced detail vrml models, in percent of the triangles kept
+MODEL_LODS = [50, 25, 10]
+
+LIBRARY_MODELS_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "library", "3dmodels", "3d-library.3dshapes"
+)
+
+_LOD_MODEL_RE = re.compile(r"(?P<base>.+)_LOD(?P<level>\d+)(?P<extension>\.wrl)$")
+
+
+def hash_file(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def lod_model(model: str, level: int) -> str:
+    base, extension = os.path.splitext(model)
+    return f"{base}_LOD{level}{extension}"
+
+
+def parse_lod_model(model: str) -> tuple[str, int]:
+    # the full detail model and the level of a reduced one, None for any other model
+    match = _LOD_MODEL_RE.match(model)
+    if match is None:
+        return None
+    return match.group("base") + match.group("extension"), int(match.group("level"))
+
+
+def has_lod_model(model: str, level: int, models_path: str = LIBRARY_MODELS_PATH) -> bool:
+    # models too small to be worth reducing have no variants, their footprints keep the full model
+    return os.path.isfile(os.path.join(models_path, lod_model(os.path.basename(model), level)))
+
+
+def lod_models(models_path: str = LIBRARY_MODELS_PATH) -> list[str]:
+    # the reduced variants present, an empty list without the library models
+    if not os.path.isdir(models_path):
+        return []
+    return sorted(model for model in os.listdir(models_path) if parse_lod_model(model) is not None)
+
+
+def model_references(library_path: str) -> dict:
+    # model file name -> footprints using it, "group:name"
+    references = {}
+
+    for footprint_file in sorted(glob.glob(os.path.join(library_path, "*.pretty", "*.kicad_mod"))):
+        group = os.path.splitext(os.path.basename(os.path.dirname(footprint_file)))[0]
+        name = os.path.splitext(os.path.basename(footprint_file))[0]
+
+        with open(footprint_file, "rb") as f:
+            sexpr = parse_sexpr(f.read())
+
+        for model in sexpr_find_all(sexpr, "model"):
+            base = os.path.splitext(os.path.basename(model[1].replace("\\", "/")))[0]
+            for extension in MODEL_EXTENSIONS:
+                references.setdefault(base + extension, []).append(f"{group}:{name}")
+
+    return references
+
+
+def build_manifest(models_path: str, library_path: str, previous: dict = None) -> dict:
+    # hashes of files whose size and mtime did not change are taken from the previous manifest
+    previous_models = previous["models"] if previous is not None else {}
+    references = model_references(library_path)
+
+    models = {}
+    for model_file in sorted(os.listdir(models_path)):
+        path = os.path.join(models_path, model_file)
+        if not os.path.isfile(path):
+            continue
+
+        stat = os.stat(path)
+        old = previous_models.get(model_file)
+        if old is not None and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+            sha256 = old["sha256"]
+        else:
+            sha256 = hash_file(path)
+
+        models[model_file] = {
+            "sha256": sha256,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "footprints": _model_footprints(references, model_file),
+        }
+
+    return {
+        "version": MANIFEST_VERSION,
+        "models": models,
+        "missing": sorted(model for model in references if model not in models and model.endswith(".wrl")),
+    }
+
+
+def _model_footprints(references: dict, model_file: str) -> list[str]:
+    # reduced detail models ship with the model they were made from
+    lod = parse_lod_model(model_file)
+    return references.get(model_file if lod is None else lod[0], [])
+
+
+def redundant_lod_models(manifest: dict) -> list[str]:
+    # reduced variants with the same content as their full detail model
+    models = manifest["models"]
+    redundant = []
+    for model, entry in models.items():
+        lod = parse_lod_model(model)
+        if lod is not None and lod[0] in models and models[lod[0]]["sha256"] == entry["sha256"]:
+            redundant.append(model)
+    return redundant
+
+
+def referenced_models(manifest: dict) -> list[str]:
+    return [model for model, entry in manifest["models"].items() if len(entry["footprints"]) > 0]
+
+
+def duplicate_models(manifest: dict) -> dict:
+    # sha256 -> model files sharing that content
+    by_hash = {}
+    for model, entry in manifest["models"].items():
+        by_hash.setdefault(entry["sha256"], []).append(model)
+    return {sha256: models for sha256, models in by_hash.items() if len(models) > 1}
+
+
+def changed_models(old_manifest: dict, new_manifest: dict) -> list[str]:
+    old_models = old_manifest["models"] if old_manifest is not None else {}
+    return [
+        model
+        for model in referenced_models(new_manifest)
+        if model not in old_models or old_models[model]["sha256"] != new_manifest["models"][model]["sha256"]
+    ]
+
+
+def object_path(store_path: str, sha256: str) -> str:
+    return os.path.join(store_path, "objects", sha256[:2], sha256)
+
+
+def store_models(manifest: dict, models_path: str, store_path: str, models: list[str] = None) -> list[str]:
+    # each distinct content is stored once, returns the hashes that were new to the store
+    stored = []
+
+    for model in models if models is not None else referenced_models(manifest):
+        sha256 = manifest["models"][model]["sha256"]
+        target = object_path(store_path, sha256)
+        if os.path.exists(target):
+            continue
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_target = f"{target}.{os.getpid()}.tmp"
+        shutil.copyfile(os.path.join(models_path, model), tmp_target)
+        os.replace(tmp_target, target)
+        stored.append(sha256)
+
+    return stored
+
+
+def read_manifest(path: str) -> dict:
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, "r") as f:
+        manifest = json.load(f)
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+
+    return manifest
+
+
+def write_manifest(manifest: dict, path: str) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def export_models(manifest: dict, store_path: str, output_path: str, models: list[str]) -> None:
+    # materializes models from the store, hard linked when the filesystem allows it
+    os.makedirs(output_path, exist_ok=True)
+
+    for model in models:
+        source = object_path(store_path, manifest["models"][model]["sha256"])
+        target = os.path.join(output_path, model)
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(description="Content addressed 3D model store.", usage="%(prog)s [options]")
+
+    parser.add_argument(
+        "-m",
+        "--models",
+        type=str,
+        default="./library/3dmodels/3d-library.3dshapes",
+        help="3D models path (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-l", "--library", type=str, default="./library/footprints", help="library path (default: %(default)s)"
+    )
+    parser.add_argument("-s", "--store", type=str, default="./.model_store", help="store path (default: %(default)s)")
+    parser.add_argument("-o", "--output", type=str, default=None, help="export the changed models to this path")
+
+    args = parser.parse_args()
+
+    # --------------------- Store ---------------------
+    manifest_file = os.path.join(args.store, MANIFEST_FILE)
+    previous = read_manifest(manifest_file)
+
+    manifest = build_manifest(args.models, args.library, previous)
+    changed = changed_models(previous, manifest)
+
+    os.makedirs(args.store, exist_ok=True)
+    stored = store_models(manifest, args.models, args.store, changed)
+
+    if args.output is not None:
+        export_models(manifest, args.store, args.output, changed)
+
+    write_manifest(manifest, manifest_file)
+
+    unreferenced = [model for model in manifest["models"] if model not in referenced_models(manifest)]
+
+    for model in manifest["missing"]:
+        print(f"missing: {model}")
+    for model in unreferenced:
+        print(f"unreferenced: {model}")
+    for models in duplicate_models(manifest).values():
+        print(f"duplicates: {', '.join(models)}")
+
+    print(f"{len(changed)} changed, {len(stored)} new objects, {len(manifest['models'])} models")
+
+
+if __name__ == "__main__":
+    tui()
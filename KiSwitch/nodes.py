@@ -32,6 +32,7 @@ class SwitchPad(Node):
 
     _TYPES = [TYPE_REGULAR, TYPE_MASKED, TYPE_SMALL_TOP]
 
+    # the layer lists are shared by every pad using them, they are never modified
     LAYERS_FRONT = ["F.Cu", "F.Mask"]
     LAYERS_BACK = ["B.Cu", "B.Mask"]
     LAYERS_FRONT_MASK = ["F.Mask"]
@@ -60,41 +61,33 @@ class SwitchPad(Node):
         self.virtual_childs.append(Pad(**kwargs))
 
     def _init_masked_pad(self, **kwargs):
-        self.mask_margin = kwargs.get("solder_mask_margin", 0.05)  # default 0.05mm
-        self.drill_size = kwargs.get("drill")
+        mask_margin = kwargs.get("solder_mask_margin", 0.05)  # default 0.05mm
+        drill = kwargs.get("drill")
 
         kwargs.__setitem__("type", Pad.TYPE_THT)
         kwargs.__setitem__("layers", SwitchPad.LAYERS_MASKED_FRONT)
         self.virtual_childs.append(Pad(**kwargs))
 
-        size = (
-            Vector2D(self.drill_size, self.drill_size)
-            if type(self.drill_size) in [int, float]
-            else Vector2D(self.drill_size)
-        )
+        size = Vector2D(drill, drill) if type(drill) in [int, float] else Vector2D(drill)
 
         kwargs.__setitem__("type", Pad.TYPE_SMT)
-        kwargs.__setitem__("size", size + Vector2D(self.mask_margin, self.mask_margin))
+        kwargs.__setitem__("size", size + Vector2D(mask_margin, mask_margin))
         kwargs.__setitem__("layers", SwitchPad.LAYERS_FRONT_MASK)
         kwargs.__setitem__("offset", Vector2D(0, 0))
         self.virtual_childs.append(Pad(**kwargs))
 
     def _init_small_top_pad(self, **kwargs):
-        self.annular_ring = kwargs.get("annular_ring", 0.13)  # default 0.13mm
-        self.drill_size = kwargs.get("drill")
+        annular_ring = kwargs.get("annular_ring", 0.13)  # default 0.13mm
+        drill = kwargs.get("drill")
 
         kwargs.__setitem__("type", Pad.TYPE_THT)
 
         kwargs.__setitem__("layers", SwitchPad.LAYERS_BACK)
         self.virtual_childs.append(Pad(**kwargs))
 
-        size = (
-            Vector2D(self.drill_size, self.drill_size)
-            if type(self.drill_size) in [int, float]
-            else Vector2D(self.drill_size)
-        )
+        size = Vector2D(drill, drill) if type(drill) in [int, float] else Vector2D(drill)
 
-        kwargs.__setitem__("size", size + Vector2D(self.annular_ring, self.annular_ring))
+        kwargs.__setitem__("size", size + Vector2D(annular_ring, annular_ring))
         kwargs.__setitem__("layers", SwitchPad.LAYERS_FRONT)
         kwargs.__setitem__("offset", Vector2D(0, 0))
         self.virtual_childs.append(Pad(**kwargs))
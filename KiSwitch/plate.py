@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import os
+import sys
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from shapely.geometry import JOIN_STYLE, Polygon
+from shapely.ops import unary_union
+
+from KiSwitch.collision import footprint_shapes, outline_loops, place_point, placement_transform
+from KiSwitch.generator import KEYCAPS, SWITCHES, ParseKwargs
+from KiSwitch.layout import build_layout, parse_kle, read_kle
+
+CUTOUT_LAYER = "Eco1.User"
+
+PLATE_FORMATS = [".dxf", ".svg"]
+
+SIMPLIFY_TOLERANCE = 1e-4
+
+# dxf layers of the written rings
+CUTOUT_DXF_LAYER = "CUTOUT"
+OUTLINE_DXF_LAYER = "OUTLINE"
+
+
+def footprint_cutouts(footprint) -> list[list[tuple[float, float]]]:
+    return outline_loops([node for node in footprint.serialize() if getattr(node, "layer", None) == CUTOUT_LAYER])
+
+
+def _placed_polygons(footprints: list, placements: list[dict], loops_of) -> list[Polygon]:
+    # loops of each distinct footprint are extracted once, then placed for every key
+    footprint_loops = {}
+    polygons = []
+
+    for placement in placements:
+        footprint_id = placement["footprint"]
+        if footprint_id not in footprint_loops:
+            footprint_loops[footprint_id] = loops_of(footprints[footprint_id])
+
+        transform = placement_transform(placement)
+        for loop in footprint_loops[footprint_id]:
+            polygon = Polygon([place_point(point, *transform) for point in loop])
+            # self touching outlines are repaired, a zero buffer keeps their area
+            polygons.append(polygon if polygon.is_valid else polygon.buffer(0))
+
+    return polygons
+
+
+def plate_geometry(footprints: list, placements: list[dict], margin: float = None) -> tuple:
+    # the merged cutouts, and the plate outline grown from the keycaps by margin, None without a margin
+    # the union leaves collinear points where outlines met, they are dropped with a negligible tolerance
+    cutouts = unary_union(_placed_polygons(footprints, placements, footprint_cutouts)).simplify(SIMPLIFY_TOLERANCE)
+
+    if margin is None:
+        return cutouts, None
+
+    keycaps = _placed_polygons(
+        footprints,
+        placements,
+        lambda footprint: [geometry for kind, geometry in footprint_shapes(footprint) if kind == "keycap"],
+    )
+    outline = unary_union(keycaps).buffer(margin, join_style=JOIN_STYLE.mitre)
+
+    # gaps between keys are not cut out of the plate
+    outline = unary_union([Polygon(polygon.exterior) for polygon in _polygons(outline)]).simplify(SIMPLIFY_TOLERANCE)
+
+    return cutouts, outline
+
+
+def _polygons(geometry) -> list[Polygon]:
+    if geometry is None or geometry.is_empty:
+        return []
+    return list(getattr(geometry, "geoms", [geometry]))
+
+
+def _rings(geometry):
+    for polygon in _polygons(geometry):
+        yield polygon.exterior.coords[:-1]
+        for interior in polygon.interiors:
+            yield interior.coords[:-1]
+
+
+def write_dxf(f, cutouts, outline=None) -> None:
+    # R12 polylines are read by every laser cutter package, dxf has y pointing up
+    def group(code: int, value) -> None:
+        f.write(f"{code}\n{value}\n")
+
+    group(0, "SECTION")
+    group(2, "HEADER")
+    group(9, "$ACADVER")
+    group(1, "AC1009")
+    group(9, "$INSUNITS")
+    group(70, 4)
+    group(0, "ENDSEC")
+
+    group(0, "SECTION")
+    group(2, "ENTITIES")
+
+    for layer, geometry in [(OUTLINE_DXF_LAYER, outline), (CUTOUT_DXF_LAYER, cutouts)]:
+        for ring in _rings(geometry):
+            group(0, "POLYLINE")
+            group(8, layer)
+            group(66, 1)
+            group(70, 1)
+            group(10, 0)
+            group(20, 0)
+            group(30, 0)
+            for x, y in ring:
+                group(0, "VERTEX")
+                group(8, layer)
+                group(10, f"{x:.4f}")
+                group(20, f"{-y:.4f}")
+            group(0, "SEQEND")
+            group(8, layer)
+
+    group(0, "ENDSEC")
+    group(0, "EOF")
+
+
+def write_svg(f, cutouts, outline=None) -> None:
+    # hairline strokes only, one path per polygon with its holes
+    everything = unary_union([geometry for geometry in [cutouts, outline] if geometry is not None])
+    min_x, min_y, max_x, max_y = everything.bounds if not everything.is_empty else (0, 0, 0, 0)
+    width, height = max_x - min_x, max_y - min_y
+
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    f.write(
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.4f}mm" height="{height:.4f}mm" '
+        f'viewBox="{min_x:.4f} {min_y:.4f} {width:.4f} {height:.4f}">\n'
+    )
+
+    for layer, geometry in [("outline", outline), ("cutouts", cutouts)]:
+        f.write(f'<g id="{layer}" fill="none" stroke="#000000" stroke-width="0.1">\n')
+        for polygon in _polygons(geometry):
+            path = " ".join("M " + " L ".join(f"{x:.4f} {y:.4f}" for x, y in ring) + " Z" for ring in _rings(polygon))
+            f.write(f'<path d="{path}"/>\n')
+        f.write("</g>\n")
+
+    f.write("</svg>\n")
+
+
+def write_plate(path: str, cutouts, outline=None) -> None:
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in PLATE_FORMATS:
+        raise ValueError(f"{extension} is an invalid plate format, valid formats are {PLATE_FORMATS}")
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        if extension == ".dxf":
+            write_dxf(f, cutouts, outline)
+        else:
+            write_svg(f, cutouts, outline)
+    os.replace(tmp_path, path)
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(
+        description="Export the plate cutouts of a keyboard-layout-editor layout.", usage="%(prog)s [options]"
+    )
+
+    parser.add_argument(
+        "-o", "--output", type=str, default="./plate.dxf", help="output .dxf or .svg file (default: %(default)s)"
+    )
+    parser.add_argument(
+        "-a",
+        "--switch-arg",
+        type=str,
+        nargs="+",
+        action=ParseKwargs,
+        default={},
+        help="switch arguments (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-k", "--keycap", type=str, choices=KEYCAPS.keys(), help="keycap (default: the switch default keycap)"
+    )
+    parser.add_argument(
+        "-b",
+        "--keycap-arg",
+        type=str,
+        nargs="+",
+        action=ParseKwargs,
+        default={},
+        help="keycap arguments (default: %(default)s)",
+    )
+    parser.add_argument("-s", "--stabilizers", action="store_true", help="add stabilizers to the keys 2u and longer")
+    parser.add_argument(
+        "-m", "--margin", type=float, default=None, help="add a plate outline this far around the keycaps, in mm"
+    )
+    parser.add_argument("layout", type=str, help="keyboard-layout-editor json file")
+    parser.add_argument("switch", type=str, choices=SWITCHES.keys(), help="switch to use")
+
+    args = parser.parse_args()
+
+    # --------------------- Export ---------------------
+    keycap = args.keycap if args.keycap is not None else SWITCHES[args.switch].DEFAULT_KEYCAP
+    keys = parse_kle(read_kle(args.layout))
+
+    footprints, placements = build_layout(keys, args.switch, args.switch_arg, keycap, args.keycap_arg, args.stabilizers)
+    cutouts, outline = plate_geometry(footprints, placements, args.margin)
+
+    write_plate(args.output, cutouts, outline)
+
+    print(f"{len(_polygons(cutouts))} cutouts for {len(placements)} placements written to {args.output}")
+
+
+if __name__ == "__main__":
+    tui()
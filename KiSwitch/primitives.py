@@ -0,0 +1,493 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import math
+import os
+import sys
+import time
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+
+from KiSwitch.deps_path import deps_path
+from KiSwitch.kicad_mod import read_kicad_mod, read_library, read_pretty
+
+with deps_path():
+    from KicadModTree.KicadFileHandler import KicadFileHandler
+    from KicadModTree.nodes.Footprint import Footprint
+    from KicadModTree.nodes.base import Arc, Circle, Line, Model, Pad, Polygon, Text
+
+# strings (names, layers, pad numbers, text) are interned in one table, records hold their index.
+# None is stored as nan for numbers and as NO_STRING for strings
+NO_STRING = 0xFFFFFFFF
+
+FOOTPRINT_DTYPE = np.dtype(
+    [
+        ("name", "<u4"),
+        ("description", "<u4"),
+        ("tags", "<u4"),
+        ("attribute", "<u4"),
+        ("mask_margin", "<f8"),
+        ("paste_margin", "<f8"),
+        ("paste_margin_ratio", "<f8"),
+    ]
+)
+
+LINE_DTYPE = np.dtype(
+    [("footprint", "<u4"), ("layer", "<u4"), ("start", "<f8", 2), ("end", "<f8", 2), ("width", "<f8")]
+)
+
+CIRCLE_DTYPE = np.dtype(
+    [("footprint", "<u4"), ("layer", "<u4"), ("center", "<f8", 2), ("radius", "<f8"), ("width", "<f8")]
+)
+
+ARC_DTYPE = np.dtype(
+    [
+        ("footprint", "<u4"),
+        ("layer", "<u4"),
+        ("center", "<f8", 2),
+        ("start", "<f8", 2),
+        ("angle", "<f8"),
+        ("width", "<f8"),
+    ]
+)
+
+# the points of polygon i are points[offsets[i]:offsets[i + 1]]
+POLYGON_DTYPE = np.dtype([("footprint", "<u4"), ("layer", "<u4"), ("width", "<f8")])
+
+# layers of a pad are interned as one space separated string
+PAD_DTYPE = np.dtype(
+    [
+        ("footprint", "<u4"),
+        ("number", "<u4"),
+        ("type", "<u4"),
+        ("shape", "<u4"),
+        ("layers", "<u4"),
+        ("at", "<f8", 2),
+        ("rotation", "<f8"),
+        ("size", "<f8", 2),
+        ("drill", "<f8", 2),
+        ("offset", "<f8", 2),
+        ("radius_ratio", "<f8"),
+        ("solder_mask_margin", "<f8"),
+        ("solder_paste_margin", "<f8"),
+        ("solder_paste_margin_ratio", "<f8"),
+    ]
+)
+
+TEXT_DTYPE = np.dtype(
+    [
+        ("footprint", "<u4"),
+        ("type", "<u4"),
+        ("text", "<u4"),
+        ("layer", "<u4"),
+        ("at", "<f8", 2),
+        ("rotation", "<f8"),
+        ("size", "<f8", 2),
+        ("thickness", "<f8"),
+        ("hide", "?"),
+        ("mirror", "?"),
+    ]
+)
+
+MODEL_DTYPE = np.dtype(
+    [("footprint", "<u4"), ("filename", "<u4"), ("at", "<f8", 3), ("scale", "<f8", 3), ("rotate", "<f8", 3)]
+)
+
+KINDS = {
+    "lines": LINE_DTYPE,
+    "circles": CIRCLE_DTYPE,
+    "arcs": ARC_DTYPE,
+    "polygons": POLYGON_DTYPE,
+    "pads": PAD_DTYPE,
+    "texts": TEXT_DTYPE,
+    "models": MODEL_DTYPE,
+}
+
+
+def _optional(value) -> float:
+    return math.nan if value is None else value
+
+
+def _restore(value: float):
+    return None if math.isnan(value) else float(value)
+
+
+def _xy(vector) -> tuple[float, float]:
+    return (vector.x, vector.y)
+
+
+def _xyz(vector) -> tuple[float, float, float]:
+    return (vector.x, vector.y, vector.z)
+
+
+class _StoreBuilder:
+    # rows are gathered as tuples and turned into arrays once, appending to arrays row by row would copy them
+    def __init__(self):
+        self.strings = []
+        self.string_ids = {}
+        self.footprints = []
+        self.rows = {kind: [] for kind in KINDS}
+        self.points = []
+        self.offsets = [0]
+
+    def string(self, value) -> int:
+        if value is None:
+            return NO_STRING
+        value = str(value)
+        if value not in self.string_ids:
+            self.string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return self.string_ids[value]
+
+    def add(self, footprint) -> None:
+        index = len(self.footprints)
+        self.footprints.append(
+            (
+                self.string(footprint.name),
+                self.string(footprint.description),
+                self.string(footprint.tags),
+                self.string(footprint.attribute),
+                _optional(footprint.maskMargin),
+                _optional(footprint.pasteMargin),
+                _optional(footprint.pasteMarginRatio),
+            )
+        )
+
+        # positions are stored as the serializer sees them, so nothing depends on the parent nodes anymore
+        for node in footprint.serialize():
+            if isinstance(node, Line):
+                self.rows["lines"].append(
+                    (
+                        index,
+                        self.string(node.layer),
+                        _xy(node.getRealPosition(node.start_pos)),
+                        _xy(node.getRealPosition(node.end_pos)),
+                        _optional(node.width),
+                    )
+                )
+            elif isinstance(node, Circle):
+                self.rows["circles"].append(
+                    (
+                        index,
+                        self.string(node.layer),
+                        _xy(node.getRealPosition(node.center_pos)),
+                        node.radius,
+                        _optional(node.width),
+                    )
+                )
+            elif isinstance(node, Arc):
+                self.rows["arcs"].append(
+                    (
+                        index,
+                        self.string(node.layer),
+                        _xy(node.getRealPosition(node.center_pos)),
+                        _xy(node.getRealPosition(node.start_pos)),
+                        node.angle,
+                        _optional(node.width),
+                    )
+                )
+            elif isinstance(node, Polygon):
+                self.rows["polygons"].append((index, self.string(node.layer), _optional(node.width)))
+                self.points += [_xy(node.getRealPosition(point)) for point in node.nodes]
+                self.offsets.append(len(self.points))
+            elif isinstance(node, Pad):
+                if node.shape == Pad.SHAPE_CUSTOM:
+                    raise ValueError(f"Custom pads are not supported, found one in {footprint.name}")
+                at, rotation = node.getRealPosition(node.at, node.rotation)
+                self.rows["pads"].append(
+                    (
+                        index,
+                        self.string(node.number),
+                        self.string(node.type),
+                        self.string(node.shape),
+                        self.string(" ".join(node.layers)),
+                        _xy(at),
+                        rotation,
+                        _xy(node.size),
+                        _xy(node.drill) if node.drill is not None else (math.nan, math.nan),
+                        _xy(node.offset),
+                        node.radius_ratio,
+                        node.solder_mask_margin,
+                        node.solder_paste_margin,
+                        node.solder_paste_margin_ratio,
+                    )
+                )
+            elif isinstance(node, Text):
+                at, rotation = node.getRealPosition(node.at, node.rotation)
+                self.rows["texts"].append(
+                    (
+                        index,
+                        self.string(node.type),
+                        self.string(node.text),
+                        self.string(node.layer),
+                        _xy(at),
+                        rotation,
+                        _xy(node.size),
+                        node.thickness,
+                        node.hide,
+                        node.mirror,
+                    )
+                )
+            elif isinstance(node, Model):
+                self.rows["models"].append(
+                    (index, self.string(node.filename), _xyz(node.at), _xyz(node.scale), _xyz(node.rotate))
+                )
+
+    def build(self) -> "PrimitiveStore":
+        return PrimitiveStore(
+            strings=self.strings,
+            footprints=np.array(self.footprints, dtype=FOOTPRINT_DTYPE),
+            points=np.array(self.points, dtype="<f8").reshape(-1, 2),
+            offsets=np.array(self.offsets, dtype="<u4"),
+            **{kind: np.array(rows, dtype=KINDS[kind]) for kind, rows in self.rows.items()},
+        )
+
+
+class PrimitiveStore:
+    # a whole library as one typed array per primitive kind instead of a tree of node objects.
+    # records of a footprint are contiguous and in the order the footprint serialized them, which is the
+    # order the file handler writes them in, so a footprint rebuilt from the store writes the same file
+    def __init__(self, strings: list, footprints: np.ndarray, points: np.ndarray, offsets: np.ndarray, **kinds):
+        self.strings = strings
+        self.footprints = footprints
+        self.points = points
+        self.offsets = offsets
+        for kind in KINDS:
+            setattr(self, kind, kinds[kind])
+
+        self.names = {strings[name]: index for index, name in enumerate(footprints["name"])}
+        self.string_ids = {value: index for index, value in enumerate(strings)}
+
+    @classmethod
+    def from_footprints(cls, footprints) -> "PrimitiveStore":
+        builder = _StoreBuilder()
+        for footprint in footprints:
+            builder.add(footprint)
+        return builder.build()
+
+    def __len__(self):
+        return len(self.footprints)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.footprints, self.points, self.offsets] + [getattr(self, kind) for kind in KINDS]
+        return sum(array.nbytes for array in arrays)
+
+    def _string(self, index: int):
+        return None if index == NO_STRING else self.strings[index]
+
+    def _footprint_index(self, footprint) -> int:
+        return self.names[footprint] if isinstance(footprint, str) else footprint
+
+    def _slice(self, kind: str, index: int) -> slice:
+        column = getattr(self, kind)["footprint"]
+        return slice(np.searchsorted(column, index, "left"), np.searchsorted(column, index, "right"))
+
+    def records(self, kind: str, footprint=None, layer: str = None) -> np.ndarray:
+        # the records of a kind, optionally of one footprint and one layer, as a view where possible
+        records = getattr(self, kind)
+        if footprint is not None:
+            records = records[self._slice(kind, self._footprint_index(footprint))]
+        if layer is not None:
+            if kind == "pads":
+                # a pad is on every layer of its interned layer list
+                layer_ids = [index for index, value in enumerate(self.strings) if layer in value.split(" ")]
+                records = records[np.isin(records["layers"], layer_ids)]
+            elif "layer" in records.dtype.names:
+                records = records[records["layer"] == self.string_ids.get(layer, NO_STRING)]
+            else:
+                raise ValueError(f"{kind} have no layer")
+        return records
+
+    def polygon_points(self, polygon: int) -> np.ndarray:
+        return self.points[self.offsets[polygon] : self.offsets[polygon + 1]]
+
+    def footprint(self, footprint) -> Footprint:
+        # rebuilds the nodes the existing serializers expect, only for the footprint asked for
+        index = self._footprint_index(footprint)
+        record = self.footprints[index]
+
+        rebuilt = Footprint(self.strings[record["name"]])
+        rebuilt.setDescription(self._string(record["description"]))
+        rebuilt.setTags(self._string(record["tags"]))
+        rebuilt.setAttribute(self._string(record["attribute"]))
+
+        for field, setter in [
+            ("mask_margin", rebuilt.setMaskMargin),
+            ("paste_margin", rebuilt.setPasteMargin),
+            ("paste_margin_ratio", rebuilt.setPasteMarginRatio),
+        ]:
+            if not math.isnan(record[field]):
+                setter(float(record[field]))
+
+        for line in self.lines[self._slice("lines", index)]:
+            rebuilt.append(
+                Line(
+                    start=line["start"].tolist(),
+                    end=line["end"].tolist(),
+                    layer=self.strings[line["layer"]],
+                    width=_restore(line["width"]),
+                )
+            )
+
+        for circle in self.circles[self._slice("circles", index)]:
+            rebuilt.append(
+                Circle(
+                    center=circle["center"].tolist(),
+                    radius=float(circle["radius"]),
+                    layer=self.strings[circle["layer"]],
+                    width=_restore(circle["width"]),
+                )
+            )
+
+        for arc in self.arcs[self._slice("arcs", index)]:
+            rebuilt.append(
+                Arc(
+                    center=arc["center"].tolist(),
+                    start=arc["start"].tolist(),
+                    angle=float(arc["angle"]),
+                    layer=self.strings[arc["layer"]],
+                    width=_restore(arc["width"]),
+                )
+            )
+
+        polygons = self._slice("polygons", index)
+        for number, polygon in zip(range(polygons.start, polygons.stop), self.polygons[polygons]):
+            rebuilt.append(
+                Polygon(
+                    nodes=self.polygon_points(number).tolist(),
+                    layer=self.strings[polygon["layer"]],
+                    width=_restore(polygon["width"]),
+                )
+            )
+
+        for pad in self.pads[self._slice("pads", index)]:
+            kwargs = {
+                "number": self.strings[pad["number"]],
+                "type": self.strings[pad["type"]],
+                "shape": self.strings[pad["shape"]],
+                "layers": self.strings[pad["layers"]].split(" "),
+                "at": pad["at"].tolist(),
+                "rotation": float(pad["rotation"]),
+                "size": pad["size"].tolist(),
+                "offset": pad["offset"].tolist(),
+                "solder_mask_margin": float(pad["solder_mask_margin"]),
+                "solder_paste_margin": float(pad["solder_paste_margin"]),
+                "solder_paste_margin_ratio": float(pad["solder_paste_margin_ratio"]),
+            }
+            if not np.isnan(pad["drill"]).any():
+                kwargs["drill"] = pad["drill"].tolist()
+            if kwargs["shape"] == Pad.SHAPE_ROUNDRECT:
+                kwargs["radius_ratio"] = float(pad["radius_ratio"])
+            rebuilt.append(Pad(**kwargs))
+
+        for text in self.texts[self._slice("texts", index)]:
+            rebuilt.append(
+                Text(
+                    type=self.strings[text["type"]],
+                    text=self.strings[text["text"]],
+                    at=text["at"].tolist(),
+                    rotation=float(text["rotation"]),
+                    layer=self.strings[text["layer"]],
+                    size=text["size"].tolist(),
+                    thickness=float(text["thickness"]),
+                    hide=bool(text["hide"]),
+                    mirror=bool(text["mirror"]),
+                )
+            )
+
+        for model in self.models[self._slice("models", index)]:
+            rebuilt.append(
+                Model(
+                    filename=self.strings[model["filename"]],
+                    at=model["at"].tolist(),
+                    scale=model["scale"].tolist(),
+                    rotate=model["rotate"].tolist(),
+                )
+            )
+
+        return rebuilt
+
+    def serialize(self, footprint) -> str:
+        return KicadFileHandler(self.footprint(footprint)).serialize(timestamp=0)
+
+    def write(self, path: str) -> None:
+        # plain arrays only, the file is read back without pickle
+        arrays = {kind: getattr(self, kind) for kind in KINDS}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                strings=np.array(self.strings, dtype=str),
+                footprints=self.footprints,
+                points=self.points,
+                offsets=self.offsets,
+                **arrays,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def read(cls, path: str) -> "PrimitiveStore":
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {key: data[key] for key in data.files}
+        arrays["strings"] = arrays["strings"].tolist()
+        return cls(**arrays)
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(
+        description="Load a footprint library into a primitive store.", usage="%(prog)s [options] path"
+    )
+
+    parser.add_argument("path", type=str, help="library path, a .pretty directory or a .kicad_mod file")
+    parser.add_argument("-o", "--output", type=str, default=None, help="write the store to this .npz file")
+    parser.add_argument(
+        "-c", "--check", action="store_true", help="check every footprint serializes as it did before the store"
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: cpu count)")
+
+    args = parser.parse_args()
+
+    # --------------------- Load ---------------------
+    if os.path.isfile(args.path):
+        footprints = {os.path.basename(args.path): read_kicad_mod(args.path)}
+    elif args.path.endswith(".pretty"):
+        footprints = read_pretty(args.path, args.jobs)
+    else:
+        footprints = read_library(args.path, args.jobs)
+
+    start = time.perf_counter()
+    store = PrimitiveStore.from_footprints(footprints.values())
+
+    records = sum(len(getattr(store, kind)) for kind in KINDS)
+    print(
+        f"{len(store)} footprints, {records} primitives, {store.nbytes / 1024:.1f} kB "
+        f"in {time.perf_counter() - start:.3f} s"
+    )
+
+    if args.output is not None:
+        store.write(args.output)
+
+    # --------------------- Check ---------------------
+    if args.check:
+        mismatches = [
+            name
+            for index, (name, footprint) in enumerate(footprints.items())
+            if store.serialize(index) != KicadFileHandler(footprint).serialize(timestamp=0)
+        ]
+        for name in mismatches:
+            print(f"{name} differs")
+        sys.exit(1 if len(mismatches) > 0 else 0)
+
+
+if __name__ == "__main__":
+    tui()
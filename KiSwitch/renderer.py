@@ -5,8 +5,9 @@
 from KiSwitch.deps_path import deps_path
 
 with deps_path():
-    from KicadModTree.Vector import Vector3D
+    from KicadModTree.Vector import Vector2D, Vector3D
     from KicadModTree.KicadFileHandler import DEFAULT_LAYER_WIDTH
+    from KicadModTree.nodes.base import Pad
 
 
 class GenericRenderer(object):
@@ -32,7 +33,6 @@ class GenericRenderer(object):
         for key, value in sorted(grouped_nodes.items()):
             # check if key is a base node, except Model and Text
             if key not in {"Arc", "Circle", "Line", "Pad", "Polygon"}:
-                print(f"ignoring {key}")
                 continue
 
             # render base nodes
@@ -67,6 +67,7 @@ class GenericRenderer(object):
             "B.Mask": "#02FFEE66",
             "Edge.Cuts": "#D0D2CDFF",
             "User.D": "#C2C2C2FF",
+            "Dwgs.User": "#C2C2C2FF",
             "B.CrtYd": "#26E9FFFF",
             "F.CrtYd": "#FF26E2FF",
             "F.Fab": "#AFAFAFFF",
@@ -92,31 +93,25 @@ class GenericRenderer(object):
         else:
             raise NotImplementedError(f"{method_name} (node) not found, cannot draw the node of type {method_type}")
 
-    def _draw_node_ArcPoints(self, node):
-        raise NotImplementedError
-        # # in KiCAD, some file attributes of Arc are named not in the way of their real meaning
-        # center_pos = node.getRealPosition(node.center_pos)
-        # end_pos = node.getRealPosition(node.start_pos)
-
-        # return [
-        #         ['start', center_pos.x, center_pos.y],
-        #         ['end', end_pos.x, end_pos.y],
-        #         ['angle', node.angle]
-        #        ]
-
     def _draw_node_Arc(self, node):
-        raise NotImplementedError
-        # sexpr = ['fp_arc']
-        # sexpr += self._draw_node_ArcPoints(node)
-        # sexpr += [
-        #           ['layer', node.layer],
-        #           ['width', _get_layer_width(node.layer, node.width)]
-        #          ]  # NOQA
+        # in KiCAD, arcs are described by center, start and a clockwise angle
+        center_pos = node.getRealPosition(node.center_pos)
+        start_pos = node.getRealPosition(node.start_pos)
+        end_pos = Vector2D(start_pos.x, start_pos.y).rotate(node.angle, origin=(center_pos.x, center_pos.y))
+
+        # draw_arc expects counter-clockwise start and end points
+        if node.angle > 0:
+            start_pos, end_pos = end_pos, start_pos
+
+        center = self.point_to_pixel(center_pos)
+        start = self.point_to_pixel(start_pos)
+        end = self.point_to_pixel(end_pos)
+        color = self.layer_to_color(node.layer)
+        width = self.width_to_pixel(node.width, node.layer)
 
-        # return sexpr
+        self.draw_arc(center, start, end, color, width)
 
     def _draw_node_Circle(self, node):
-        print("_draw_node_Circle")
         center_pos = self.point_to_pixel(node.getRealPosition(node.center_pos))
         radius = self.scale_value(node.radius)
         color = self.layer_to_color(node.layer)
@@ -219,98 +214,45 @@ class GenericRenderer(object):
         # return sexpr_primitives
 
     def _draw_node_Pad(self, node):
-        print("_draw_node_Pad")
-        # sexpr = ['pad', node.number, node.type, node.shape]
-
         position, rotation = node.getRealPosition(node.at, node.rotation)
+        color = self.pad_to_color(node)
 
-        position = self.point_to_pixel(position)
-        rotation = rotation % 360
+        if node.shape == Pad.SHAPE_CIRCLE:
+            self.draw_circle(self.point_to_pixel(position), self.scale_value(node.size.x / 2), color)
+            return
 
-        print(node.layers)
+        # every other shape is drawn as its (rotated) bounding rectangle
+        half_x = node.size.x / 2
+        half_y = node.size.y / 2
+        corners = [(-half_x, -half_y), (half_x, -half_y), (half_x, half_y), (-half_x, half_y)]
 
-        color = self.layer_to_color(None)
+        points = []
+        for corner in corners:
+            point = Vector2D(corner).rotate(-rotation) + Vector2D(position.x, position.y)
+            points.append(self.point_to_pixel(point))
 
-        size = (self.scale_value(node.size.x), self.scale_value(node.size.y))
+        self.draw_polygon(points, color, None)
 
-        print(size)
+    def pad_to_color(self, node):
+        if node.type in [Pad.TYPE_THT, Pad.TYPE_NPTH]:
+            return self.layer_to_color("ThroughHole")
 
-        self.draw_circle(position, size[0] // 2, color)
+        for layer in node.layers:
+            layer = layer.replace("*", "F")
+            if layer.endswith(".Cu"):
+                return self.layer_to_color(layer)
 
-        # if not rotation % 360 == 0:
-        #     sexpr.append(['at', position.x, position.y, rotation])
-        # else:
-        #     sexpr.append(['at', position.x, position.y])
-
-        # sexpr.append(['size', node.size.x, node.size.y])
-
-        # if node.type in [Pad.TYPE_THT, Pad.TYPE_NPTH]:
-
-        #     if node.drill.x == node.drill.y:
-        #         drill_config = ['drill', node.drill.x]
-        #     else:
-        #         drill_config = ['drill', 'oval', node.drill.x, node.drill.y]
-
-        #     # append offset only if necessary
-        #     if node.offset.x != 0 or node.offset.y != 0:
-        #         drill_config.append(['offset', node.offset.x,  node.offset.y])
-
-        #     sexpr.append(drill_config)
-
-        # sexpr.append(['layers'] + node.layers)
-        # if node.shape == Pad.SHAPE_ROUNDRECT:
-        #     sexpr.append(['roundrect_rratio', node.radius_ratio])
-
-        # if node.shape == Pad.SHAPE_CUSTOM:
-        #     # gr_line, gr_arc, gr_circle or gr_poly
-        #     sexpr.append(SexprSerializer.NEW_LINE)
-        #     sexpr.append(['options',
-        #                  ['clearance', node.shape_in_zone],
-        #                  ['anchor', node.anchor_shape]
-        #                 ])  # NOQA
-        #     sexpr.append(SexprSerializer.NEW_LINE)
-        #     sexpr_primitives = self._draw_node_CustomPadPrimitives(node)
-        #     sexpr.append(['primitives', SexprSerializer.NEW_LINE] + sexpr_primitives)
-
-        # if node.solder_paste_margin_ratio != 0 or node.solder_mask_margin != 0 or node.solder_paste_margin != 0:
-        #     sexpr.append(SexprSerializer.NEW_LINE)
-        #     if node.solder_mask_margin != 0:
-        #         sexpr.append(['solder_mask_margin', node.solder_mask_margin])
-        #     if node.solder_paste_margin_ratio != 0:
-        #         sexpr.append(['solder_paste_margin_ratio', node.solder_paste_margin_ratio])
-        #     if node.solder_paste_margin != 0:
-        #         sexpr.append(['solder_paste_margin', node.solder_paste_margin])
-
-        # return sexpr
-
-    def _draw_node_PolygonPoints(self, node, newline_after_pts=False):
-        print("_draw_node_PolygonPoints")
-        # node_points = ['pts']
-        # if newline_after_pts:
-        #     node_points.append(SexprSerializer.NEW_LINE)
-        # points_appended = 0
-        # for n in node.nodes:
-        #     if points_appended >= 4:
-        #         points_appended = 0
-        #         node_points.append(SexprSerializer.NEW_LINE)
-        #     points_appended += 1
+        return self.layer_to_color(node.layers[0] if node.layers else None)
 
-        #     n_pos = node.getRealPosition(n)
-        #     node_points.append(['xy', n_pos.x, n_pos.y])
-
-        # return node_points
+    def _draw_node_PolygonPoints(self, node) -> list[tuple[int, int]]:
+        return [self.point_to_pixel(node.getRealPosition(point)) for point in node.nodes]
 
     def _draw_node_Polygon(self, node):
-        print("_draw_node_Polygon")
-        node_points = self._draw_node_PolygonPoints(node)
-
-        # sexpr = ['fp_poly',
-        #          node_points,
-        #          ['layer', node.layer],
-        #          ['width', _get_layer_width(node.layer, node.width)]
-        #         ]  # NOQA
+        # footprint polygons are filled, as KiCad draws them
+        points = self._draw_node_PolygonPoints(node)
+        color = self.layer_to_color(node.layer)
 
-        # return sexpr
+        self.draw_polygon(points, color, None)
 
     def draw_circle(self, center: tuple[int, int], radius: int, color: str, width: int | None = None) -> None:
         raise NotImplementedError
@@ -324,5 +266,32 @@ class GenericRenderer(object):
     def draw_rect(self, start: tuple[int, int], end: tuple[int, int], color: str, width: int):
         raise NotImplementedError
 
-    def draw_polygon(self, points: list[tuple[int, int]], color: str, width: int):
+    def draw_polygon(self, points: list[tuple[int, int]], color: str, width: int | None = None):
         raise NotImplementedError
+
+
+class DisplayListRenderer(GenericRenderer):
+    # records draw calls so the geometry work can happen away from the target device,
+    # the recorded calls are later replayed on any other renderer
+    def __init__(self, scale: int = 1, center: tuple[int, int] = (0, 0)):
+        super().__init__(scale, center)
+        self.display_list = []
+
+    def replay(self, renderer: GenericRenderer) -> None:
+        for method_name, args in self.display_list:
+            getattr(renderer, method_name)(*args)
+
+    def draw_circle(self, center: tuple[int, int], radius: int, color: str, width: int | None = None) -> None:
+        self.display_list.append(("draw_circle", (center, radius, color, width)))
+
+    def draw_arc(self, center: tuple[int, int], start: tuple[int, int], end: tuple[int, int], color: str, width: int):
+        self.display_list.append(("draw_arc", (center, start, end, color, width)))
+
+    def draw_line(self, start: tuple[int, int], end: tuple[int, int], color: str, width: int):
+        self.display_list.append(("draw_line", (start, end, color, width)))
+
+    def draw_rect(self, start: tuple[int, int], end: tuple[int, int], color: str, width: int):
+        self.display_list.append(("draw_rect", (start, end, color, width)))
+
+    def draw_polygon(self, points: list[tuple[int, int]], color: str, width: int | None = None):
+        self.display_list.append(("draw_polygon", (points, color, width)))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import re
+
+_TOKEN_RE = re.compile(r'\s*(?:(?P<open>\()|(?P<close>\))|"(?P<string>(?:[^"\\]|\\.)*)"|(?P<atom>[^\s()"]+))')
+_COMMENT_TOKEN_RE = re.compile(
+    r'\s*(?:(?P<open>\()|(?P<close>\))|"(?P<string>(?:[^"\\]|\\.)*)"|(?P<comment>#[^\n]*)|(?P<atom>[^\s()"]+))'
+)
+_BYTES_TOKEN_RE = re.compile(
+    rb'(?P<open>\()|(?P<close>\))|"(?P<string>(?:[^"\\]|\\.)*)"|(?P<atom>[^\s()"]+)|(?P<error>\S)', re.DOTALL
+)
+_UNESCAPE_RE = re.compile(r"\\(?:([0-7]{1,3})|x([0-9a-fA-F]{1,2})|(.))", re.DOTALL)
+_ESCAPE_RE = re.compile(r'["\\\n\r\t]')
+# the escapes KiCad reads in quoted strings, anything else escaped stands for itself
+_UNESCAPES = {"a": "\a", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v"}
+_ESCAPES = {'"': '\\"', "\\": "\\\\", "\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_BARE_ATOM_RE = re.compile(r'[^\s()"#\\]+')
+
+
+class SexprComment(str):
+    pass
+
+
+def _unescape_match(match) -> str:
+    octal, hexadecimal, char = match.groups()
+    if octal is not None:
+        return chr(int(octal, 8))
+    if hexadecimal is not None:
+        return chr(int(hexadecimal, 16))
+    return _UNESCAPES.get(char, char)
+
+
+def unescape_sexpr(string: str) -> str:
+    return _UNESCAPE_RE.sub(_unescape_match, string)
+
+
+def tokenize_sexpr(string: str, comments: bool = False):
+    # with comments enabled, a '#' starting a token comments out the rest of the line
+    token_re = _COMMENT_TOKEN_RE if comments else _TOKEN_RE
+    position = 0
+    length = len(string)
+
+    while position < length:
+        match = token_re.match(string, position)
+        if match is None:
+            if string[position:].strip() == "":
+                return
+            raise ValueError(f"Invalid s-expression at offset {position}")
+
+        position = match.end()
+        kind = match.lastgroup
+
+        if kind == "open":
+            yield "("
+        elif kind == "close":
+            yield ")"
+        elif kind == "string":
+            yield ("string", unescape_sexpr(match.group(kind)))
+        elif kind == "comment":
+            yield ("comment", SexprComment(match.group(kind)))
+        elif kind == "atom":
+            yield ("atom", match.group(kind))
+
+
+def tokenize_sexpr_bytes(buffer):
+    # works on any bytes-like buffer, including a mmap, without decoding the whole file first
+    for match in _BYTES_TOKEN_RE.finditer(buffer):
+        kind = match.lastgroup
+
+        if kind == "open":
+            yield "("
+        elif kind == "close":
+            yield ")"
+        elif kind == "string":
+            yield ("string", unescape_sexpr(match.group(kind).decode("utf-8")))
+        elif kind == "atom":
+            yield ("atom", match.group(kind).decode("utf-8"))
+        else:
+            raise ValueError(f"Invalid s-expression at offset {match.start()}")
+
+
+def parse_sexpr(string, comments: bool = False) -> list:
+    # comments, when kept, are SexprComment strings in the list they appear in
+    if isinstance(string, str):
+        tokens = tokenize_sexpr(string, comments)
+    elif comments:
+        raise ValueError("Comments are only supported when parsing text")
+    else:
+        tokens = tokenize_sexpr_bytes(string)
+
+    stack = [[]]
+
+    for token in tokens:
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            if len(stack) == 1:
+                raise ValueError("Unexpected closing bracket")
+            group = stack.pop()
+            stack[-1].append(group)
+        else:
+            stack[-1].append(token[1])
+
+    if len(stack) != 1:
+        raise ValueError("No closing bracket found")
+
+    expressions = [item for item in stack[0] if not isinstance(item, SexprComment)]
+    if len(expressions) != 1:
+        raise ValueError("Expected a single top level s-expression")
+
+    # comments around the top level expression are moved into it, so they survive a round trip
+    if comments:
+        index = stack[0].index(expressions[0])
+        expressions[0][1:1] = stack[0][:index]
+        expressions[0].extend(stack[0][index + 1 :])
+
+    return expressions[0]
+
+
+def quote_sexpr(value) -> str:
+    return '"' + _ESCAPE_RE.sub(lambda match: _ESCAPES[match.group()], str(value)) + '"'
+
+
+def format_sexpr(sexpr) -> str:
+    if isinstance(sexpr, list):
+        return "(" + " ".join(format_sexpr(item) for item in sexpr) + ")"
+    if _BARE_ATOM_RE.fullmatch(str(sexpr)):
+        return str(sexpr)
+    return quote_sexpr(sexpr)
+
+
+def sexpr_find(sexpr: list, keyword: str) -> list:
+    for item in sexpr:
+        if isinstance(item, list) and len(item) > 0 and item[0] == keyword:
+            return item
+    return None
+
+
+def sexpr_find_all(sexpr: list, keyword: str):
+    for item in sexpr:
+        if isinstance(item, list) and len(item) > 0 and item[0] == keyword:
+            yield item
@@ -6,6 +6,7 @@ from os import path
 
 from KiSwitch.deps_path import deps_path
 from KiSwitch.keycap import Keycap
+from KiSwitch.model_store import MODEL_LODS, has_lod_model, lod_model
 from KiSwitch.property import kiswitch_property
 from KiSwitch.nodes import SwitchPad, SwitchMountHole
 from KiSwitch.util import offset_poly
@@ -20,6 +21,18 @@ with deps_path():
 
 class Switch(Footprint):
     DEFAULT_KEYS = []
+    DEFAULT_KEYCAP = "Keycap"
+
+    # properties that only affect the listed features, these can be changed on a built switch with update(),
+    # changing any other property requires building a new switch
+    FEATURE_PROPERTIES = {
+        "switch_w": ["fab_outline", "silkscreen", "courtyard", "cutout"],
+        "switch_h": ["fab_outline", "silkscreen", "courtyard", "cutout"],
+        "switch_cut_w": ["cutout"],
+        "switch_cut_h": ["cutout"],
+        "cutout": ["cutout"],
+        "annular_ring": ["pads", "pcb_mount_holes"],
+    }
 
     name = kiswitch_property(base_type=str)
     description = kiswitch_property(base_type=str, default="")
@@ -31,6 +44,7 @@ class Switch(Footprint):
         default="${KICAD6_3RD_PARTY}/3dmodels/com_github_perigoso_keyswitch-kicad-library/3d-library.3dshapes/",
     )
     model3d = kiswitch_property(base_type=str, list_property=True)
+    model3d_lod = kiswitch_property(base_type=int, allowed_list=MODEL_LODS)
     text_offset = kiswitch_property(base_type=float, default=8)
     switch_w = kiswitch_property(base_type=float, default=18)
     switch_h = kiswitch_property(base_type=float, default=18)
@@ -38,6 +52,15 @@ class Switch(Footprint):
     switch_cut_h = kiswitch_property(base_type=float, default=16)
 
     def __init__(self, **kwargs):
+        # feature name -> (container node, init method name, init method args)
+        self._features = {}
+        self._feature_building = None
+        # name, description and tags before the first feature, and every change made to them after it
+        self._metadata_base = None
+        self._metadata_log = []
+        # the value text shows the name, which rebuilt features may change
+        self._value_text = None
+
         Footprint.__init__(self, None)
 
         for key, value in kwargs.items():
@@ -45,18 +68,102 @@ class Switch(Footprint):
 
         self.name = self.name.replace(" ", "_")
 
+    @property
+    def features(self) -> dict:
+        return {feature: container for feature, (container, _, _) in self._features.items()}
+
+    def append(self, node: Node):
+        if self._feature_building is not None:
+            self._features[self._feature_building][0].append(node)
+        else:
+            Footprint.append(self, node)
+
+    def build_feature(self, feature: str, init_method: str, *args):
+        if self._metadata_base is None:
+            self._metadata_base = (self.name, self.description, self.tags)
+
+        container = Node()
+        self._features[feature] = (container, init_method, args)
+        self._metadata_log.append((feature, None, None))
+
+        Footprint.append(self, container)
+        self._run_feature(feature)
+
+    def rebuild_feature(self, feature: str):
+        old_container, init_method, args = self._features[feature]
+
+        # components are appended again, release them from the old container
+        for child in old_container.getNormalChilds():
+            child._parent = None
+
+        # swap in an empty container at the same position, keeping the serialization order
+        container = Node()
+        container._parent = self
+        self._childs[self._childs.index(old_container)] = container
+        old_container._parent = None
+        self._features[feature] = (container, init_method, args)
+
+        # drop the metadata this feature added, it is logged again in the same place while it is rebuilt
+        marker = self._metadata_log.index((feature, None, None))
+        log_tail = [entry for entry in self._metadata_log[marker + 1 :] if entry[0] != feature]
+        self._metadata_log = self._metadata_log[: marker + 1]
+
+        self._run_feature(feature)
+
+        self._metadata_log += log_tail
+
+        # replay the metadata log so name, description and tags keep their original order
+        self.name, self.description, self.tags = self._metadata_base
+        for _, kind, value in self._metadata_log:
+            if kind is not None:
+                self._apply_metadata(kind, value)
+
+        if self._value_text is not None:
+            self._value_text.text = self.name
+
+    def _run_feature(self, feature: str):
+        _, init_method, args = self._features[feature]
+
+        self._feature_building = feature
+        try:
+            getattr(self, init_method)(*args)
+        finally:
+            self._feature_building = None
+
+    def update(self, **kwargs) -> list[str]:
+        # returns the rebuilt features, or None if the change can not be applied incrementally,
+        # in which case nothing was changed and a new switch has to be built
+        features = set()
+        for key in kwargs.keys():
+            if key not in self.FEATURE_PROPERTIES:
+                return None
+            features.update(self.FEATURE_PROPERTIES[key])
+
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+        rebuilt = [feature for feature in self._features.keys() if feature in features]
+        for feature in rebuilt:
+            self.rebuild_feature(feature)
+
+        return rebuilt
+
     def add_generic_nodes(self):
         self._init_generic_nodes()
 
     def _init_generic_nodes(self):
         # add general values
         self.append(Text(type="reference", text="REF**", at=[0, -self.text_offset], layer="F.SilkS"))
-        self.append(Text(type="value", text=self.name, at=[0, self.text_offset], layer="F.Fab"))
+        self._value_text = Text(type="value", text=self.name, at=[0, self.text_offset], layer="F.Fab")
+        self.append(self._value_text)
         self.append(Text(type="user", text="%R", at=[0, 0], layer="F.Fab"))
 
         # add model if available
         if self.path3d is not None and self.model3d is not None:
             for model in self.model3d:
+                # reduced detail variants only exist for vrml models large enough to be reduced
+                if self.model3d_lod is not None and model.endswith(".wrl") and has_lod_model(model, self.model3d_lod):
+                    model = lod_model(model, self.model3d_lod)
                 model_path = path.join(self.path3d, model)
                 self.append(Model(filename=model_path, at=[0, 0, 0], scale=[1, 1, 1], rotate=[0, 0, 0]))
 
@@ -111,25 +218,49 @@ class Switch(Footprint):
         # Each of these methods has a default implementation in Switch that, in
         # the case of many switches, will only need to be customized by setting
         # class variables.
-        self._init_fab_outline()
-        self._init_silkscreen()
-        self._init_courtyard()
-        self._init_pads()
-        self._init_center_hole()
-        self._init_pcb_mount_holes()
+        # Each of them is built as a separate feature, so it can be rebuilt alone.
+        self.build_feature("fab_outline", "_init_fab_outline")
+        self.build_feature("silkscreen", "_init_silkscreen")
+        self.build_feature("courtyard", "_init_courtyard")
+        self.build_feature("pads", "_init_pads")
+        self.build_feature("center_hole", "_init_center_hole")
+        self.build_feature("pcb_mount_holes", "_init_pcb_mount_holes")
+        self.build_feature("cutout", "_init_switch_cutout")
+
+    def _init_switch_cutout(self):
         if self.cutout:
             self._init_cutout()
 
+    def _init_component(self, component: Node):
+        self.append_name(component.name)
+        self.append_tags(component.tags)
+        self.append_description(component.description)
+
+        self.append(component)
+
+    def _append_metadata(self, kind: str, value: str):
+        if self._metadata_base is not None:
+            self._metadata_log.append((self._feature_building, kind, value))
+        self._apply_metadata(kind, value)
+
+    def _apply_metadata(self, kind: str, value: str):
+        if kind == "name":
+            self.name += "_" + value.replace(" ", "_")
+        elif kind == "description":
+            if self.description != "":
+                self.description += " "
+            self.description += value
+        elif kind == "tags":
+            self.tags += " " + value
+
     def append_name(self, name: str):
-        self.name += "_" + name.replace(" ", "_")
+        self._append_metadata("name", name)
 
     def append_description(self, desc: str):
-        if self.description != "":
-            self.description += " "
-        self.description += desc
+        self._append_metadata("description", desc)
 
     def append_tags(self, tags: str):
-        self.tags += " " + tags
+        self._append_metadata("tags", tags)
 
     def append_center_rect(self, layer, x=None, y=None, width=None, offset=0):
         x = x or self.switch_w
@@ -137,12 +268,13 @@ class Switch(Footprint):
 
         self.append(RectLine(start=[-x / 2, -y / 2], end=[x / 2, y / 2], layer=layer, width=width, offset=offset))
 
-    def append_component(self, component: Node):
-        self.append_name(component.name)
-        self.append_tags(component.tags)
-        self.append_description(component.description)
+    def append_component(self, component: Node, feature: str = "keycap"):
+        self.build_feature(feature, "_init_component", component)
 
-        self.append(component)
+    def replace_component(self, component: Node, feature: str = "keycap"):
+        container, init_method, _ = self._features[feature]
+        self._features[feature] = (container, init_method, (component,))
+        self.rebuild_feature(feature)
 
 
 class StabilizerCherryMX(Switch):
@@ -156,6 +288,17 @@ class StabilizerCherryMX(Switch):
     }
 
     DEFAULT_KEYS = LU_TABLE.keys()
+    DEFAULT_KEYCAP = None
+
+    # mounting holes, shared with the generated 3d models
+    SMALL_HOLE_SIZE = 3.048
+    LARGE_HOLE_SIZE = 3.9878
+    TOP_OFFSET = -6.985
+    BOTTOM_OFFSET = 8.225
+
+    CUTOUT_W = 6.75
+    CUTOUT_TOP = -5.53
+    CUTOUT_BOTTOM = 6.77
 
     name = kiswitch_property(base_type=str, default="Stabilizer_Cherry_MX")
     description = kiswitch_property(base_type=str, default="Cherry MX PCB Stabilizer")
@@ -174,27 +317,20 @@ class StabilizerCherryMX(Switch):
         if self.model3d == None:
             self.model3d = [f"{self.name}.wrl"]
 
-        self._init_base()
-
-        if self.cutout is True:
-            self._init_cutout()
+        self.build_feature("base", "_init_base")
+        self.build_feature("cutout", "_init_switch_cutout")
 
     def _init_base(self):
         # set attributes
         self.setAttribute("virtual")
 
-        # add pads
-        small_hole_size = 3.048
-        large_hole_size = 3.9878
-        top_offset = -6.985
-        bottom_offset = 8.225
         offset = self.LU_TABLE[self.size]["offset"]
 
         # create pads
-        self.append(SwitchMountHole(at=[-offset, top_offset], drill=small_hole_size))
-        self.append(SwitchMountHole(at=[offset, top_offset], drill=small_hole_size))
-        self.append(SwitchMountHole(at=[-offset, bottom_offset], drill=large_hole_size))
-        self.append(SwitchMountHole(at=[offset, bottom_offset], drill=large_hole_size))
+        self.append(SwitchMountHole(at=[-offset, self.TOP_OFFSET], drill=self.SMALL_HOLE_SIZE))
+        self.append(SwitchMountHole(at=[offset, self.TOP_OFFSET], drill=self.SMALL_HOLE_SIZE))
+        self.append(SwitchMountHole(at=[-offset, self.BOTTOM_OFFSET], drill=self.LARGE_HOLE_SIZE))
+        self.append(SwitchMountHole(at=[offset, self.BOTTOM_OFFSET], drill=self.LARGE_HOLE_SIZE))
 
         # create reference center point
         self.append(Line(start=[0, 2], end=[0, -2], layer="Dwgs.User", width=0.1))
@@ -204,8 +340,15 @@ class StabilizerCherryMX(Switch):
         offset = self.LU_TABLE[self.size]["offset"]
 
         # create cutout
-        self.append(RectLine(start=[offset - 3.375, -5.53], end=[offset + 3.375, 6.77], layer="Eco1.User", width=0.1))
-        self.append(RectLine(start=[-offset - 3.375, -5.53], end=[-offset + 3.375, 6.77], layer="Eco1.User", width=0.1))
+        for x in [offset, -offset]:
+            self.append(
+                RectLine(
+                    start=[x - self.CUTOUT_W / 2, self.CUTOUT_TOP],
+                    end=[x + self.CUTOUT_W / 2, self.CUTOUT_BOTTOM],
+                    layer="Eco1.User",
+                    width=0.1,
+                )
+            )
 
         self.append_tags("Cutout")
 
@@ -598,6 +741,7 @@ class SwitchKailhChoc(HotswapBase, Switch):
         Keycap.KEYCAP_ISO_ENTER_180,
         Keycap.KEYCAP_ISO_ENTER_270,
     ]
+    DEFAULT_KEYCAP = "KeycapChoc"
 
     SWITCH_TYPES = ["V1", "V2", "V1V2"]
 
@@ -776,6 +920,7 @@ class SwitchKailhChoc(HotswapBase, Switch):
 # https://www.kailhswitch.com/mechanical-keyboard-switches/mini-keyboard-push-button-switches.html
 class SwitchKailhChocMini(Switch):
     DEFAULT_KEYS = SwitchKailhChoc.DEFAULT_KEYS
+    DEFAULT_KEYCAP = "KeycapChoc"
 
     name = kiswitch_property(base_type=str, default="SW_Kailh_Choc_Mini")
     description = kiswitch_property(base_type=str, default="Kailh Choc Mini CPG1232 low profile keyswitch")
@@ -907,17 +1052,23 @@ class SwitchHotswapKailh(HotswapBase, CherryMXBase, Switch):
     switch_cut_w = kiswitch_property(base_type=float, default=CherryMXBase.SWITCH_W)
     switch_cut_h = kiswitch_property(base_type=float, default=CherryMXBase.SWITCH_H)
 
+    FEATURE_PROPERTIES = {**Switch.FEATURE_PROPERTIES, "hotswap_plated": ["pads"]}
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
+        self.setAttribute("smd")
+
+        self._init_switch()
+
+    def _init_pads(self):
+        # part of the pads feature, so hotswap_plated only needs the pads rebuilt
         if self.hotswap_plated is True:
             self.append_name("Plated")
             self.append_tags("Plated")
             self.append_description("plated holes")
 
-        self.setAttribute("smd")
-
-        self._init_switch()
+        super()._init_pads()
 
     def _init_fab_outline(self):
         super()._init_fab_outline()
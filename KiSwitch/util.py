@@ -8,6 +8,7 @@ from KiSwitch.deps_path import deps_path
 
 with deps_path():
     from KicadModTree.Vector import Vector2D
+    from KicadModTree.nodes.base import Arc, Circle, Line, Pad, Polygon
 
 
 def norm_vector(v):
@@ -23,8 +24,9 @@ def offset_poly(poly: list, offset: float, origin: Vector2D = Vector2D(0, 0), ou
     outer_ccw = 1 if outer_ccw else -1
     closed = poly[0] == poly[-1]
 
+    # the closing point is left out of a copy, callers keep their polyline for the next rebuild
     if closed:
-        poly.pop()
+        poly = poly[:-1]
 
     num_points = len(poly)
 
@@ -54,3 +56,46 @@ def offset_poly(poly: list, offset: float, origin: Vector2D = Vector2D(0, 0), ou
         new_poly.append(new_poly[0])
 
     return new_poly
+
+
+def node_bbox_points(node) -> list[Vector2D]:
+    # points bounding the drawn geometry of a node, arcs and rotated pads are bounded loosely
+    if isinstance(node, Line):
+        return [node.start_pos, node.end_pos]
+    elif isinstance(node, Arc):
+        radius = node.start_pos.distance_to(node.center_pos)
+        return [node.center_pos + [radius, radius], node.center_pos - [radius, radius]]
+    elif isinstance(node, Circle):
+        return [node.center_pos + [node.radius, node.radius], node.center_pos - [node.radius, node.radius]]
+    elif isinstance(node, Polygon):
+        return list(node.nodes)
+    elif isinstance(node, Pad):
+        if node.rotation % 90 == 0:
+            half = node.size / 2 if node.rotation % 180 == 0 else Vector2D(node.size.y, node.size.x) / 2
+        else:
+            radius = sqrt(node.size.x**2 + node.size.y**2) / 2
+            half = Vector2D(radius, radius)
+        return [node.at + half, node.at - half]
+
+    return []
+
+
+def points_bbox(points: list[Vector2D]) -> tuple[float, float, float, float]:
+    if len(points) == 0:
+        return (0, 0, 0, 0)
+
+    return (
+        min(point.x for point in points),
+        min(point.y for point in points),
+        max(point.x for point in points),
+        max(point.y for point in points),
+    )
+
+
+def footprint_bbox(footprint) -> tuple[float, float, float, float]:
+    # (min_x, min_y, max_x, max_y) of the drawn geometry
+    points = []
+    for node in footprint.serialize():
+        points += node_bbox_points(node)
+
+    return points_bbox(points)
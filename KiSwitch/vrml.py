@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import codecs
+import functools
+import math
+import os
+import re
+import sys
+import time
+
+if __name__ == "__main__":
+    sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from KiSwitch.switch import StabilizerCherryMX
+
+# kicad reads vrml in tenths of an inch
+VRML_SCALE = 1 / 2.54
+
+VRML_HEADER = "#VRML V2.0 utf8\n"
+
+_VRML_TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|#[^\n]*|[\[\]{}]|[^\s,\[\]{}#"]+')
+_VRML_NUMBER_RE = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?$|0[xX][0-9a-fA-F]+$")
+
+VRML_ATOMS = {"TRUE", "FALSE", "NULL"}
+
+# diffuse, specular, ambient intensity, shininess
+MATERIALS = {
+    "PLASTIC-BLACK": ((0.148, 0.145, 0.145), (0.180, 0.168, 0.160), 0.293, 0.35),
+    "PLASTIC-WHITE": ((0.880, 0.880, 0.880), (0.500, 0.500, 0.500), 0.494, 0.125),
+    "MET-STEEL": ((0.298, 0.298, 0.298), (0.398, 0.398, 0.398), 0.250, 0.056),
+}
+
+# stabilizer housing, slider and wire, in mm from the footprint origin of each side
+STAB_CLEARANCE = 0.1
+STAB_HOUSING_Z = 6.5
+STAB_PEG_LENGTH = 3.0
+STAB_SLIDER_SIZE = 4.0
+STAB_SLIDER_Z = (2.5, 9.5)
+STAB_STEM_SIZE = (4.0, 1.2)
+STAB_STEM_Z = 13.0
+STAB_WIRE_RADIUS = 0.8
+STAB_WIRE_Y = -4.5
+STAB_WIRE_Z = 1.5
+
+
+class Mesh:
+    # points in mm, x right, y down and z up as in the footprint, faces index the points
+    def __init__(self, points: list = None, faces: list = None):
+        self.points = points or []
+        self.faces = faces or []
+
+    def extend(self, mesh: "Mesh") -> "Mesh":
+        base = len(self.points)
+        self.points += mesh.points
+        self.faces += [[base + index for index in face] for face in mesh.faces]
+        return self
+
+
+def box(x0: float, y0: float, z0: float, x1: float, y1: float, z1: float) -> Mesh:
+    points = [[x, y, z] for z in [z0, z1] for y in [y0, y1] for x in [x0, x1]]
+    faces = [[0, 2, 3, 1], [4, 5, 7, 6], [0, 1, 5, 4], [2, 6, 7, 3], [0, 4, 6, 2], [1, 3, 7, 5]]
+    return Mesh(points, faces)
+
+
+def cylinder(center: list, radius: float, length: float, axis: int = 2, segments: int = 24) -> Mesh:
+    # starts at center and extends along the given axis
+    points = []
+    for offset in [0, length]:
+        for segment in range(segments):
+            angle = 2 * math.pi * segment / segments
+            point = list(center)
+            point[(axis + 1) % 3] += radius * math.cos(angle)
+            point[(axis + 2) % 3] += radius * math.sin(angle)
+            point[axis] += offset
+            points.append(point)
+
+    faces = [
+        [segment, (segment + 1) % segments, segments + (segment + 1) % segments, segments + segment]
+        for segment in range(segments)
+    ]
+    faces.append(list(reversed(range(segments))))
+    faces.append(list(range(segments, 2 * segments)))
+
+    return Mesh(points, faces)
+
+
+def _number(value: float) -> str:
+    # round to the micron, kicad does not need more and it keeps the files small
+    text = f"{value:.4f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def _point(point: list) -> str:
+    return " ".join(_number(value * VRML_SCALE) for value in [point[0], -point[1], point[2]])
+
+
+class VrmlWriter:
+    def __init__(self):
+        self.materials = set()
+        self.nodes = []
+
+    def material(self, name: str) -> str:
+        # the first use defines the material, every other shape references it
+        if name in self.materials:
+            return f"USE {name}"
+        self.materials.add(name)
+
+        diffuse, specular, ambient, shininess = MATERIALS[name]
+        return (
+            f"DEF {name} Material {{ diffuseColor {' '.join(_number(value) for value in diffuse)} "
+            f"specularColor {' '.join(_number(value) for value in specular)} "
+            f"ambientIntensity {_number(ambient)} shininess {_number(shininess)} }}"
+        )
+
+    def shape(self, mesh: Mesh, material: str) -> str:
+        points = ",".join(_point(point) for point in mesh.points)
+        # flipping y mirrors the mesh, reversing the faces keeps them counter-clockwise seen from outside
+        faces = ",".join(",".join(str(index) for index in reversed(face)) + ",-1" for face in mesh.faces)
+        return (
+            f"Shape {{ appearance Appearance {{ material {self.material(material)} }}\n"
+            f"geometry IndexedFaceSet {{ creaseAngle 0.5 coordIndex [{faces}]\n"
+            f"coord Coordinate {{ point [{points}] }} }} }}\n"
+        )
+
+    def group(self, shapes: list[str], name: str = None) -> str:
+        definition = f"DEF {name} " if name is not None else ""
+        return f"{definition}Group {{ children [\n{''.join(shapes)}] }}\n"
+
+    def transform(self, translation: list, children: str) -> str:
+        return f"Transform {{ translation {_point(translation)} children [\n{children}] }}\n"
+
+    def use(self, name: str) -> str:
+        return f"USE {name}\n"
+
+    def append(self, node: str) -> None:
+        self.nodes.append(node)
+
+    def __str__(self) -> str:
+        return VRML_HEADER + "".join(self.nodes)
+
+
+class VrmlNode:
+    # fields keep their file order, values are nodes, VrmlUse, lists for MF fields or tuples of atoms
+    def __init__(self, type: str, fields: list = None, name: str = None):
+        self.type = type
+        self.fields = fields or []
+        self.name = name
+
+    def get(self, field: str, default=None):
+        for name, value in self.fields:
+            if name == field:
+                return value
+        return default
+
+    def set(self, field: str, value) -> None:
+        for item in self.fields:
+            if item[0] == field:
+                item[1] = value
+                return
+        self.fields.append([field, value])
+
+    def remove(self, field: str) -> None:
+        self.fields = [item for item in self.fields if item[0] != field]
+
+
+class VrmlUse:
+    def __init__(self, name: str):
+        self.name = name
+
+
+def tokenize_vrml(f, chunk_size: int = 1024 * 1024):
+    # yields the tokens in batches, each chunk is cut at its last line break so no token is split
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    text = ""
+
+    while True:
+        chunk = f.read(chunk_size)
+        eof = len(chunk) == 0
+        text += decoder.decode(chunk, final=eof)
+
+        end = len(text) if eof else text.rfind("\n") + 1
+        if end > 0:
+            yield [token for token in _VRML_TOKEN_RE.findall(text, 0, end) if not token.startswith("#")]
+            text = text[end:]
+
+        if eof:
+            return
+
+
+def _is_atom(token: str) -> bool:
+    return token.startswith('"') or token in VRML_ATOMS or _VRML_NUMBER_RE.match(token) is not None
+
+
+class _VrmlReader:
+    def __init__(self, batches):
+        self.batches = batches
+        self.tokens = []
+        self.position = 0
+
+    def fill(self, count: int) -> bool:
+        while len(self.tokens) - self.position < count:
+            batch = next(self.batches, None)
+            if batch is None:
+                return False
+            self.tokens = self.tokens[self.position :] + batch
+            self.position = 0
+        return True
+
+    def peek(self, offset: int = 0) -> str:
+        if self.position + offset >= len(self.tokens) and not self.fill(offset + 1):
+            return None
+        return self.tokens[self.position + offset]
+
+    def next(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise ValueError("Unexpected end of vrml")
+        self.position += 1
+        return token
+
+    def read_atoms(self) -> list[str]:
+        # mf fields hold a single type, a list of numbers runs to the closing bracket
+        while True:
+            try:
+                end = self.tokens.index("]", self.position)
+            except ValueError:
+                if not self.fill(len(self.tokens) - self.position + 1):
+                    raise ValueError("Unexpected end of vrml")
+                continue
+
+            atoms = self.tokens[self.position : end]
+            self.position = end + 1
+            return atoms
+
+    def expect(self, expected: str) -> None:
+        token = self.next()
+        if token != expected:
+            raise ValueError(f"Expected '{expected}' in vrml, got '{token}'")
+
+    def is_node(self) -> bool:
+        return self.peek() in {"DEF", "USE"} or self.peek(1) == "{"
+
+    def read_node(self):
+        token = self.next()
+        if token == "USE":
+            return VrmlUse(self.next())
+
+        name = None
+        if token == "DEF":
+            name = self.next()
+            token = self.next()
+
+        if token in {"PROTO", "EXTERNPROTO", "ROUTE"}:
+            raise ValueError(f"Unsupported vrml statement {token}")
+
+        node = VrmlNode(token, name=name)
+        self.expect("{")
+        while self.peek() != "}":
+            field = self.next()
+            node.fields.append([field, self.read_value()])
+        self.next()
+
+        return node
+
+    def read_value(self):
+        if self.peek() == "[":
+            self.next()
+            if self.peek() != "]" and _is_atom(self.peek()):
+                return self.read_atoms()
+
+            values = []
+            while self.peek() != "]":
+                values.append(self.read_node() if self.is_node() else self.next())
+            self.next()
+            return values
+
+        if self.is_node():
+            return self.read_node()
+
+        atoms = []
+        while self.peek() is not None and _is_atom(self.peek()):
+            atoms.append(self.next())
+        return tuple(atoms)
+
+
+def iter_vrml(f):
+    # top level nodes, one at a time
+    reader = _VrmlReader(tokenize_vrml(f))
+    while reader.peek() is not None:
+        yield reader.read_node()
+
+
+def read_vrml(path: str) -> list:
+    with open(path, "rb") as f:
+        return list(iter_vrml(f))
+
+
+def format_vrml(value) -> str:
+    if isinstance(value, VrmlNode):
+        definition = f"DEF {value.name} " if value.name is not None else ""
+        fields = " ".join(f"{field} {format_vrml(field_value)}" for field, field_value in value.fields)
+        return f"{definition}{value.type}{{{fields}}}"
+    if isinstance(value, VrmlUse):
+        return f"USE {value.name}"
+    if isinstance(value, list):
+        if len(value) > 0 and isinstance(value[0], str):
+            return f"[{' '.join(value)}]"
+        return f"[{' '.join(format_vrml(item) for item in value)}]"
+    if isinstance(value, tuple):
+        return " ".join(value)
+    return value
+
+
+@functools.cache
+def _stabilizer_side() -> list[tuple[Mesh, str]]:
+    # one side of the stabilizer, the same for every size
+    stab = StabilizerCherryMX
+
+    # clear of the cutout and the holes
+    half_w = stab.CUTOUT_W / 2 - STAB_CLEARANCE
+    top, bottom = stab.CUTOUT_TOP + STAB_CLEARANCE, stab.CUTOUT_BOTTOM - STAB_CLEARANCE
+    housing = box(-half_w, top, 0, half_w, bottom, STAB_HOUSING_Z)
+
+    for y, hole_size in [(stab.TOP_OFFSET, stab.SMALL_HOLE_SIZE), (stab.BOTTOM_OFFSET, stab.LARGE_HOLE_SIZE)]:
+        housing.extend(cylinder([0, y, -STAB_PEG_LENGTH], hole_size / 2 - STAB_CLEARANCE, STAB_PEG_LENGTH))
+
+    slider_half = STAB_SLIDER_SIZE / 2
+    slider = box(-slider_half, -slider_half, STAB_SLIDER_Z[0], slider_half, slider_half, STAB_SLIDER_Z[1])
+
+    # cherry mx cross stem
+    stem_long, stem_short = STAB_STEM_SIZE[0] / 2, STAB_STEM_SIZE[1] / 2
+    slider.extend(box(-stem_long, -stem_short, STAB_SLIDER_Z[1], stem_long, stem_short, STAB_STEM_Z))
+    slider.extend(box(-stem_short, -stem_long, STAB_SLIDER_Z[1], stem_short, stem_long, STAB_STEM_Z))
+
+    return [(housing, "PLASTIC-BLACK"), (slider, "PLASTIC-WHITE")]
+
+
+def stabilizer_cherry_mx_model(size: float) -> str:
+    offset = StabilizerCherryMX.LU_TABLE[size]["offset"]
+
+    writer = VrmlWriter()
+
+    # both sides share a single mesh, only the wire depends on the size
+    side = writer.group([writer.shape(mesh, material) for mesh, material in _stabilizer_side()], "STAB-SIDE")
+    writer.append(writer.transform([-offset, 0, 0], side))
+    writer.append(writer.transform([offset, 0, 0], writer.use("STAB-SIDE")))
+
+    wire = cylinder([-offset, STAB_WIRE_Y, STAB_WIRE_Z], STAB_WIRE_RADIUS, 2 * offset, axis=0, segments=12)
+    writer.append(writer.shape(wire, "MET-STEEL"))
+
+    return str(writer)
+
+
+def write_model(path: str, model: str) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(model)
+    os.replace(tmp_path, path)
+
+
+def generate_stabilizer_models(output_path: str, sizes: list = None) -> list[str]:
+    files = []
+    for size in sizes if sizes is not None else StabilizerCherryMX.LU_TABLE.keys():
+        path = os.path.join(output_path, f"Stabilizer_Cherry_MX_{size:1.2f}u.wrl")
+        write_model(path, stabilizer_cherry_mx_model(size))
+        files.append(path)
+
+    return files
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(description="Generate parametric 3D models.", usage="%(prog)s [options]")
+
+    # the library ships the FreeCAD models, matching their .step exports, so these go to a separate output
+    parser.add_argument(
+        "-o", "--output", type=str, default="./output/3dmodels", help="output path (default: %(default)s)"
+    )
+
+    args = parser.parse_args()
+
+    # --------------------- Generate ---------------------
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+
+    start = time.perf_counter()
+    files = generate_stabilizer_models(args.output)
+    print(f"{len(files)} models in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    tui()
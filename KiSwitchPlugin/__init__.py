@@ -2,13 +2,18 @@
 # SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: 2022 Rafael Silva <perigoso@riseup.net>
 
+import time
+
 try:
-    from KiSwitchPlugin.plugin.plugin import KiSwitchPluginGenerator, KiSwitchPluginImporter
+    _start = time.perf_counter()
 
-    print('Loading KiSwitch Plugins')
+    # only the registration shim is imported here, dialogs are loaded on the first Run()
+    from KiSwitchPlugin.plugin.plugin import KiSwitchPluginGenerator, KiSwitchPluginImporter
 
     KiSwitchPluginGenerator().register()
-    # KiSwitchPluginImporter().register()
+    KiSwitchPluginImporter().register()
+
+    print(f'Loading KiSwitch Plugins ({(time.perf_counter() - _start) * 1000:.1f} ms)')
 
 except Exception as e:
     from KiSwitchPlugin.util import logException
@@ -3,46 +3,136 @@
 # SPDX-FileCopyrightText: 2022 Rafael Silva <perigoso@riseup.net>
 
 import os
+import queue
 import shutil
+import tempfile
+import threading
 import wx
+import wx.lib.newevent
 
 from KiSwitchPlugin.deps_path import deps_path
+from KiSwitchPlugin.plugin.cache import SessionCache
 from KiSwitchPlugin.plugin.dialog_util import get_confirmation_dialog, error_dialog
+from KiSwitchPlugin.util import logException
 
 with deps_path():
-    from KiSwitch.fplibtable import FpLib, FpLibTable
+    from KiSwitch import installed_version
+    from KiSwitch.fplibtable import FpLib, FpLibTable, register_libs
     from KiSwitch.switch import SwitchCherryMX
-    from KiSwitch.renderer import GenericRenderer
-    from KiSwitch.generator import SWITCHES
+    from KiSwitch.renderer import GenericRenderer, DisplayListRenderer
+    from KiSwitch.footprint_cache import FootprintCache
+    from KiSwitch.generator import SWITCHES, count_switches, generate_switches, write_footprint_data
 
 LIBNAME = 'KiSwitchLib'
 
+GenerateProgressEvent, EVT_GENERATE_PROGRESS = wx.lib.newevent.NewEvent()
+GenerateDoneEvent, EVT_GENERATE_DONE = wx.lib.newevent.NewEvent()
 
-def prepare_lib_table(parent_frame=None, project_path: str = '', lib_name: str = LIBNAME) -> None:
-    fp_lib_table = FpLibTable.read(project_path)
 
-    if lib_name in fp_lib_table.libs:
+def confirm_lib_overwrite(parent_frame=None, project_path: str = '', lib_name: str = LIBNAME) -> str:
+    # all questions are asked up front, generation then runs unattended
+    library_dir = os.path.join(project_path, f'{lib_name}.pretty')
+
+    if os.path.exists(library_dir):
+        if not get_confirmation_dialog(parent_frame, f'Local library {lib_name} already exists, overwrite?'):
+            raise Exception(
+                f'Local library {lib_name} already exists, cannot overwrite.')
+
+    if lib_name in FpLibTable.read(project_path):
         if not get_confirmation_dialog(parent_frame, f'Library {lib_name} already exists in fp-lib-table, overwrite?'):
             raise Exception(
                 f'Library {lib_name} already exists in fp-lib-table, cannot overwrite.')
-        fp_lib_table.removeLib(lib_name)
 
-    fp_lib_table.addLib(FpLib(lib_name, '${KIPRJMOD}' + f'/{lib_name}.pretty'))
-    fp_lib_table.write(project_path)
+    return library_dir
 
 
-def prepare_lib_dir(parent_frame=None, project_path: str = '', lib_name: str = LIBNAME) -> str:
-    library_dir = os.path.join(project_path, f'{lib_name}.pretty')
+def prepare_lib_table(project_path: str = '', lib_name: str = LIBNAME) -> None:
+    register_libs(project_path, [FpLib(lib_name, '${KIPRJMOD}' + f'/{lib_name}.pretty')])
 
+
+def swap_lib_dir(staging_dir: str, library_dir: str) -> None:
+    # directories can't be replaced in a single rename, the old library is moved aside first and restored on failure
+    old_dir = None
     if os.path.exists(library_dir):
-        if not get_confirmation_dialog(parent_frame, f'Local library {lib_name} already exists, overwrite?'):
-            raise Exception(
-                f'Local library {lib_name} already exists, cannot overwrite.')
-        shutil.rmtree(library_dir)
+        old_dir = f'{staging_dir}.old'
+        os.rename(library_dir, old_dir)
 
-    os.mkdir(library_dir)
+    try:
+        os.rename(staging_dir, library_dir)
+    except Exception:
+        if old_dir is not None:
+            os.rename(old_dir, library_dir)
+        raise
 
-    return library_dir
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+class GenerationCancelled(Exception):
+    pass
+
+
+class GeneratorThread(threading.Thread):
+    # footprints are written to a staging directory next to the library, which only replaces it once complete,
+    # a cancelled or failed run leaves the previous library untouched
+    def __init__(self, notify_window, library_dir: str, jobs: list[dict]):
+        super().__init__(daemon=True)
+        self.notify_window = notify_window
+        self.library_dir = library_dir
+        self.jobs = jobs
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        error = None
+        cancelled = False
+        staging_dir = None
+
+        # footprints generated before, by the plugin or the command line, are taken from the user cache
+        try:
+            footprint_cache = FootprintCache()
+        except OSError as e:
+            footprint_cache = None
+            logException(e, 'KiSwitchGenerator')
+
+        try:
+            staging_dir = tempfile.mkdtemp(
+                prefix=f'.{os.path.basename(self.library_dir)}.', dir=os.path.dirname(self.library_dir))
+
+            total = sum(count_switches(**job) for job in self.jobs)
+            done = 0
+
+            for job in self.jobs:
+                for _, name, data, _, _ in generate_switches(**job, cache=footprint_cache):
+                    if self.cancel_event.is_set():
+                        raise GenerationCancelled()
+
+                    write_footprint_data(staging_dir, name, data)
+                    done += 1
+                    wx.PostEvent(self.notify_window, GenerateProgressEvent(
+                        done=done, total=total, name=name))
+
+            if self.cancel_event.is_set():
+                raise GenerationCancelled()
+
+            swap_lib_dir(staging_dir, self.library_dir)
+
+            if footprint_cache is not None:
+                footprint_cache.prune()
+
+        except GenerationCancelled:
+            cancelled = True
+        except Exception as e:
+            error = e
+            logException(e, 'KiSwitchGenerator')
+
+        finally:
+            if staging_dir is not None and os.path.isdir(staging_dir):
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+        wx.PostEvent(self.notify_window, GenerateDoneEvent(error=error, cancelled=cancelled))
 
 
 class wxRenderer(GenericRenderer):
@@ -66,44 +156,231 @@ class wxRenderer(GenericRenderer):
         self.paint_dc.SetPen(wx.Pen(color, width=width))
         self.paint_dc.DrawLine(wx.Point(start[0], start[1]), wx.Point(end[0], end[1]))
 
+    def draw_polygon(self, points: list[tuple[int, int]], color: str, width: int | None=None):
+        if width is None:
+            self.paint_dc.SetPen(wx.Pen(color, width=0))
+            self.paint_dc.SetBrush(wx.Brush(color, style=wx.BRUSHSTYLE_SOLID))
+        else:
+            self.paint_dc.SetPen(wx.Pen(color, width=width))
+            self.paint_dc.SetBrush(wx.TRANSPARENT_BRUSH)
+        self.paint_dc.DrawPolygon([wx.Point(point[0], point[1]) for point in points])
+
 
 class FootprintPreview(wx.Panel):
-    def __init__(self, parent):
+    RESIZE_DELAY_MS = 150
+    BACKGROUND_COLOR = '#001023'
+
+    def __init__(self, parent, cache: SessionCache = None, switch_class=SwitchCherryMX, switch_args: dict = {}):
         super().__init__(parent)
-        self.SetBackgroundStyle(wx.BG_STYLE_CUSTOM)
+        self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
+
+        # built switches and finished bitmaps are kept in the plugin's session cache, so reopening the dialog
+        # shows what the user last saw without rebuilding it
+        self.cache = cache if cache is not None else SessionCache()
+
+        self.switch_class = switch_class
+        self.switch_args = dict(switch_args)
+        self.keycap_class = None
+        self.keycap_args = {}
+
+        # cached double buffer, paint handlers only ever blit this
+        self.bitmap = None
+        self.render_generation = 0
+        self.resize_timer = None
+
+        # worker state, only touched by the render thread
+        self._switch = None
+        self._switch_args = None
+        self._keycap = None
+        self._size = None
+        self._feature_renders = {}
+
+        self.render_requests = queue.Queue()
+        self.render_thread = threading.Thread(target=self._render_worker, daemon=True)
+        self.render_thread.start()
+
         self.Bind(wx.EVT_SIZE, self.on_size)
         self.Bind(wx.EVT_PAINT, self.on_paint)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.on_destroy)
 
-    def on_size(self, event):
-        event.Skip()
-        self.Refresh()
+    def set_switch(self, switch_class, switch_args: dict = {}, keycap_class=None, keycap_args: dict = {}):
+        self.switch_class = switch_class
+        self.switch_args = dict(switch_args)
+        self.keycap_class = keycap_class
+        self.keycap_args = dict(keycap_args)
+        self.update_preview()
 
-    def on_paint(self, event):
+    def update_preview(self):
         w, h = self.GetClientSize()
+        if w <= 0 or h <= 0:
+            return
+
+        self.render_generation += 1
+
+        bitmap = self.cache.get(('bitmap', (w, h)) + self._cache_key(
+            self.switch_class, self.switch_args, self.keycap_class, self.keycap_args))
+        if bitmap is not None:
+            self.bitmap = bitmap
+            self.Refresh(eraseBackground=False)
+            return
+
+        self.render_requests.put((
+            self.render_generation, (w, h),
+            self.switch_class, dict(self.switch_args),
+            self.keycap_class, dict(self.keycap_args)))
+
+    def _render_worker(self):
+        while True:
+            request = self.render_requests.get()
+
+            # only the latest request matters, skip the ones it replaced
+            while request is not None and not self.render_requests.empty():
+                request = self.render_requests.get()
+
+            if request is None:
+                self._store_switch()
+                return
+
+            try:
+                renders = self._render(*request[1:])
+            except Exception as e:
+                self._switch = None
+                logException(e, 'KiSwitchPreview')
+                continue
+
+            wx.CallAfter(self._on_render_done, request[0], request[1], self._cache_key(*request[2:]), renders)
+
+    @staticmethod
+    def _cache_key(switch_class, switch_args: dict, keycap_class, keycap_args: dict) -> tuple:
+        keycap = (keycap_class.__name__, repr(sorted(keycap_args.items()))) if keycap_class is not None else None
+        return (switch_class.__name__, repr(sorted(switch_args.items())), keycap)
+
+    def _store_switch(self):
+        # hands the worker state back to the session cache, the switch is mutated in place so it is never shared
+        if self._switch is None:
+            return
+
+        keycap_class, keycap_args = self._keycap if self._keycap is not None else (None, {})
+        key = ('switch',) + self._cache_key(type(self._switch), self._switch_args, keycap_class, keycap_args)
+        self.cache.put(key, (self._switch, self._switch_args, self._keycap, self._size, self._feature_renders))
+        self._switch = None
+
+    def _load_switch(self, switch_class, switch_args, keycap_class, keycap_args) -> bool:
+        key = ('switch',) + self._cache_key(switch_class, switch_args, keycap_class, keycap_args)
+        state = self.cache.pop(key)
+        if state is None:
+            return False
+
+        self._switch, self._switch_args, self._keycap, self._size, self._feature_renders = state
+        return True
+
+    def _render(self, size, switch_class, switch_args, keycap_class, keycap_args) -> list:
+        # building and serializing the footprint is the expensive part, it only needs python objects
+        # so it runs here, the recorded draw calls are replayed on the ui thread
+        keycap = (keycap_class, keycap_args) if keycap_class is not None else None
+
+        rebuilt = None
+        if self._switch is not None and type(self._switch) is switch_class and (self._keycap is None) == (keycap is None):
+            changes = {key: value for key, value in switch_args.items() if self._switch_args.get(key) != value}
+            changes.update({key: None for key in self._switch_args.keys() if key not in switch_args})
+            rebuilt = self._switch.update(**changes)
+
+        if rebuilt is None:
+            self._store_switch()
+
+            if self._load_switch(switch_class, switch_args, keycap_class, keycap_args):
+                rebuilt = []
+            else:
+                self._switch = switch_class(**switch_args)
+                self._keycap = None
+                self._feature_renders = {}
+                rebuilt = list(self._switch.features.keys())
+        self._switch_args = switch_args
+
+        if keycap != self._keycap:
+            if self._keycap is None:
+                self._switch.append_component(keycap_class(**keycap_args))
+            else:
+                self._switch.replace_component(keycap_class(**keycap_args))
+            self._keycap = keycap
+            rebuilt.append('keycap')
+
+        # scale depends on the panel size, so a resize redraws every feature, without rebuilding any
+        if size != self._size:
+            self._size = size
+            self._feature_renders = {}
+
+        w, h = size
         pxmm = w / 25
-        print(f'panel size: {w}x{h} mm/px: {pxmm}')
 
-        dc = wx.PaintDC(self)
+        features = self._switch.features
+        for feature, container in features.items():
+            if feature in rebuilt or feature not in self._feature_renders:
+                renderer = DisplayListRenderer(pxmm, (w // 2, h // 2))
+                renderer.draw(container)
+                self._feature_renders[feature] = renderer
+
+        return [self._feature_renders[feature] for feature in features.keys()]
+
+    def _on_render_done(self, generation: int, size: tuple[int, int], key: tuple, renders: list):
+        # the panel may have been destroyed, or a newer render requested, while the worker ran
+        if not self or generation != self.render_generation:
+            return
+
+        bitmap = wx.Bitmap(size[0], size[1])
+        dc = wx.MemoryDC(bitmap)
+        dc.SetBackground(wx.Brush(self.BACKGROUND_COLOR))
         dc.Clear()
+        for renderer in renders:
+            renderer.replay(wxRenderer(dc, renderer.scale, renderer.center))
+        dc.SelectObject(wx.NullBitmap)
+
+        self.bitmap = bitmap
+        self.cache.put(('bitmap', size) + key, bitmap)
+        self.Refresh(eraseBackground=False)
 
-        renderer = wxRenderer(dc, pxmm, (w // 2, h // 2))
+    def on_destroy(self, event):
+        event.Skip()
+        if event.GetEventObject() is self:
+            self.render_requests.put(None)
 
-        switch = SwitchCherryMX()
+    def on_size(self, event):
+        event.Skip()
 
-        renderer.draw(switch)
+        # debounce, only render once the user stops resizing
+        if self.resize_timer is not None and self.resize_timer.IsRunning():
+            self.resize_timer.Start(self.RESIZE_DELAY_MS)
+        else:
+            self.resize_timer = wx.CallLater(self.RESIZE_DELAY_MS, self.update_preview)
+
+        self.Refresh(eraseBackground=False)
+
+    def on_paint(self, event):
+        dc = wx.AutoBufferedPaintDC(self)
+        dc.SetBackground(wx.Brush(self.BACKGROUND_COLOR))
+        dc.Clear()
+
+        if self.bitmap is not None:
+            w, h = self.GetClientSize()
+            dc.DrawBitmap(self.bitmap, (w - self.bitmap.GetWidth()) // 2, (h - self.bitmap.GetHeight()) // 2)
 
 
 class GeneratorDialog(wx.Dialog):
     NAME = 'KiSwitch Generator'
     DESCRIPTION = 'Generate Keyboard Switch Footprints'
 
-    def __init__(self, pcbnew_window, project_path):
+    def __init__(self, pcbnew_window, project_path, cache: SessionCache = None):
         super().__init__(
             pcbnew_window, title=self.NAME,
             style=wx.DEFAULT_DIALOG_STYLE)
 
         self.project_path = project_path
         self.pcbnew_window = pcbnew_window
+        self.generator_thread = None
+        self.close_pending = False
+
+        self.cache = cache if cache is not None else SessionCache()
+        self.cache.validate(installed_version())
 
         top_sizer = wx.BoxSizer(wx.VERTICAL)
 
@@ -125,11 +402,12 @@ class GeneratorDialog(wx.Dialog):
         self.setup_preview(middle_sizer)
 
 
-        sampleList = [sw.__name__ for sw in SWITCHES]
+        sampleList = list(SWITCHES.keys())
 
         self.cb = wx.ComboBox(self,
                               size=wx.DefaultSize,
                               choices=sampleList)
+        self.cb.Bind(wx.EVT_COMBOBOX, self.on_switch_select)
 
         top_sizer.Add(self.cb, 0, wx.ALL, 8 )
 
@@ -139,6 +417,10 @@ class GeneratorDialog(wx.Dialog):
 
         self.SetSizer(top_sizer)
 
+        self.Bind(EVT_GENERATE_PROGRESS, self.on_generate_progress)
+        self.Bind(EVT_GENERATE_DONE, self.on_generate_done)
+        self.Bind(wx.EVT_CLOSE, self.on_close)
+
         self.on_resize()
 
     def on_resize(self):
@@ -149,17 +431,82 @@ class GeneratorDialog(wx.Dialog):
         self.Fit()
 
     def on_close(self, event):
+        # the worker posts events to this dialog, it is cancelled and the dialog closes once it is done
+        if self.generator_thread is not None:
+            self.generator_thread.cancel()
+
+            if not isinstance(event, wx.CloseEvent) or event.CanVeto():
+                if isinstance(event, wx.CloseEvent):
+                    event.Veto()
+                self.close_pending = True
+                self.generate_button.Disable()
+                self.status_label.SetLabel('Cancelling...')
+                return
+
         self.EndModal(0)  # return 0 to showModal()
 
+    def on_switch_select(self, event):
+        self.preview.set_switch(SWITCHES[self.cb.GetValue()])
+
     def on_generate(self, event):
-        print('on_generate')
+        if self.generator_thread is not None:
+            self.generator_thread.cancel()
+            self.generate_button.Disable()
+            self.status_label.SetLabel('Cancelling...')
+            return
+
+        switch = self.cb.GetValue()
+        if switch not in SWITCHES:
+            error_dialog(self, 'Select a switch to generate.')
+            return
+
         try:
-            library_dir = prepare_lib_dir(
-                self, self.project_path, LIBNAME)
-            prepare_lib_table(self, self.project_path, LIBNAME)
-            # generate_switch_cherry_mx(library_dir)
+            library_dir = confirm_lib_overwrite(self, self.project_path, LIBNAME)
         except Exception as e:
             error_dialog(self, str(e))
+            return
+
+        jobs = [{'switch': switch, 'keycap': SWITCHES[switch].DEFAULT_KEYCAP}]
+
+        self.progress_gauge.SetValue(0)
+        self.status_label.SetLabel('Generating...')
+        self.generate_button.SetLabel('Cancel')
+
+        self.generator_thread = GeneratorThread(self, library_dir, jobs)
+        self.generator_thread.start()
+
+    def on_generate_progress(self, event):
+        self.progress_gauge.SetRange(event.total)
+        self.progress_gauge.SetValue(event.done)
+        self.status_label.SetLabel(f'{event.done}/{event.total} {event.name}')
+
+    def on_generate_done(self, event):
+        self.generator_thread = None
+
+        if self.close_pending:
+            self.EndModal(0)  # return 0 to showModal()
+            return
+
+        self.generate_button.SetLabel('Generate')
+        self.generate_button.Enable()
+
+        if event.cancelled:
+            self.progress_gauge.SetValue(0)
+            self.status_label.SetLabel('Cancelled, library unchanged')
+            return
+
+        if event.error is not None:
+            self.status_label.SetLabel('Failed, library unchanged')
+            error_dialog(self, str(event.error))
+            return
+
+        try:
+            prepare_lib_table(self.project_path, LIBNAME)
+        except Exception as e:
+            error_dialog(self, str(e))
+            return
+
+        self.status_label.SetLabel('Done')
 
     def setup_preview(self, sizer):
         internal_sizer = wx.BoxSizer(wx.VERTICAL)
@@ -168,38 +515,30 @@ class GeneratorDialog(wx.Dialog):
             self, label="Preview:", size=wx.DefaultSize, style=wx.ALIGN_LEFT)
         internal_sizer.Add(preview_label, 0, wx.EXPAND | wx.ALL, 2)
 
-        preview = FootprintPreview(self)
-        preview.SetSizeHints(wx.Size(self.maxDialogSize.width,
-                             self.maxDialogSize.height // 2), wx.Size(self.maxDialogSize.width, -1))
+        self.preview = FootprintPreview(self, self.cache)
+        self.preview.SetSizeHints(wx.Size(self.maxDialogSize.width,
+                                  self.maxDialogSize.height // 2), wx.Size(self.maxDialogSize.width, -1))
 
-        internal_sizer.Add(preview, 0, wx.EXPAND | wx.ALL, 2)
+        internal_sizer.Add(self.preview, 0, wx.EXPAND | wx.ALL, 2)
 
         sizer.Add(internal_sizer, 0, wx.EXPAND | wx.ALL, 2)
 
     def setup_buttons(self, parent_sizer):
         button_box = wx.BoxSizer(wx.HORIZONTAL)
 
+        self.status_label = wx.StaticText(self, label='', style=wx.ST_ELLIPSIZE_END)
+        button_box.Add(self.status_label, 1, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 10)
+
+        self.progress_gauge = wx.Gauge(self, range=1)
+        button_box.Add(self.progress_gauge, 1, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 10)
+
         close_button = wx.Button(self, label='Close')
         self.Bind(wx.EVT_BUTTON, self.on_close, id=close_button.GetId())
         button_box.Add(close_button, 1, wx.RIGHT, 10)
 
-        generate_button = wx.Button(self, label='Generate')
-        self.Bind(wx.EVT_BUTTON, self.on_generate, id=generate_button.GetId())
-        button_box.Add(generate_button, 1, wx.RIGHT, 10)
+        self.generate_button = wx.Button(self, label='Generate')
+        self.Bind(wx.EVT_BUTTON, self.on_generate, id=self.generate_button.GetId())
+        button_box.Add(self.generate_button, 1, wx.RIGHT, 10)
 
-        parent_sizer.Add(button_box, 0, wx.ALIGN_RIGHT |
+        parent_sizer.Add(button_box, 0, wx.EXPAND |
                          wx.LEFT | wx.RIGHT | wx.BOTTOM, 10)
-
-
-class ImporterDialog(wx.Dialog):
-    def __init__(self, parent, title, project_path=None):
-        super().__init__(
-            parent, title=title,
-            style=wx.DEFAULT_DIALOG_STYLE)
-
-    def OnResize(self):
-        self.scrollWindow.GetSizer().Layout()
-        self.scrollWindow.Fit()
-        self.scrollWindow.FitInside()
-        self.GetSizer().Layout()
-        self.Fit()
@@ -2,16 +2,213 @@
 # SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: 2022 Rafael Silva <perigoso@riseup.net>
 
+import os
+import re
+import shutil
+import tempfile
+import pcbnew
 import wx
 
+from KiSwitchPlugin.deps_path import deps_path
+from KiSwitchPlugin.plugin.cache import SessionCache
+from KiSwitchPlugin.plugin.dialog_generator import confirm_lib_overwrite, prepare_lib_table, swap_lib_dir
+from KiSwitchPlugin.plugin.dialog_util import error_dialog
+from KiSwitchPlugin.util import logException
+
+with deps_path():
+    from KiSwitch import installed_version
+    from KiSwitch.footprint_cache import FootprintCache
+    from KiSwitch.generator import SWITCHES
+    from KiSwitch.layout import STABILIZER, parse_kle, read_kle, render_layout
+
+LIBNAME = 'KiSwitchLayout'
+
+REFERENCE_PREFIXES = {STABILIZER: 'ST'}
+DEFAULT_REFERENCE_PREFIX = 'SW'
+REFERENCE_RE = re.compile(r'^([A-Za-z]+)(\d+)$')
+
+
+def board_point(x: float, y: float):
+    # KiCad 7 moved board coordinates from wxPoint to VECTOR2I
+    point_class = getattr(pcbnew, 'VECTOR2I', None) or pcbnew.wxPoint
+    return point_class(pcbnew.FromMM(x), pcbnew.FromMM(y))
+
+
+def reference_counters(board) -> dict:
+    # highest number in use per prefix, so imported keys continue after the switches already on the board
+    prefixes = {*REFERENCE_PREFIXES.values(), DEFAULT_REFERENCE_PREFIX}
+    counters = {}
+    for footprint in board.GetFootprints():
+        match = REFERENCE_RE.match(footprint.GetReference())
+        if match is not None and match.group(1) in prefixes:
+            counters[match.group(1)] = max(counters.get(match.group(1), 0), int(match.group(2)))
+    return counters
+
+
+def place_footprints(
+        board, library_dir: str, lib_name: str, placements: list[dict], origin: tuple[float, float]) -> list:
+    # each distinct footprint is read from the library once, every key gets a duplicate of it,
+    # the board is only refreshed by the caller once everything is added
+    templates = {}
+    counters = reference_counters(board)
+    footprints = []
+
+    for placement in placements:
+        name = placement['footprint']
+        if name not in templates:
+            template = pcbnew.FootprintLoad(library_dir, name)
+            if template is None:
+                raise Exception(f'Footprint {name} not found in {library_dir}')
+            template.SetFPID(pcbnew.LIB_ID(lib_name, name))
+            templates[name] = template
+
+        footprint = templates[name].Duplicate().Cast()
+
+        prefix = REFERENCE_PREFIXES.get(placement['switch'], DEFAULT_REFERENCE_PREFIX)
+        counters[prefix] = counters.get(prefix, 0) + 1
+        footprint.SetReference(f'{prefix}{counters[prefix]}')
+
+        footprint.SetPosition(board_point(origin[0] + placement['x'], origin[1] + placement['y']))
+        footprint.SetOrientationDegrees(placement['rotation'])
+        footprints.append(footprint)
+
+    for footprint in footprints:
+        board.Add(footprint)
+
+    return footprints
+
+
 class ImporterDialog(wx.Dialog):
     NAME = 'KiSwitch Importer'
     DESCRIPTION = 'Import Keyboard layout'
 
-    def __init__(self, pcbnew_window, project_path=None):
-        wx.Dialog.__init__(
-            self, pcbnew_window, title=self.NAME,
+    def __init__(self, pcbnew_window, project_path=None, cache: SessionCache = None):
+        super().__init__(
+            pcbnew_window, title=self.NAME,
             style=wx.DEFAULT_DIALOG_STYLE)
 
-    def OnResize(self):
-        return
+        self.project_path = project_path
+        self.pcbnew_window = pcbnew_window
+
+        self.cache = cache if cache is not None else SessionCache()
+        self.cache.validate(installed_version())
+
+        top_sizer = wx.BoxSizer(wx.VERTICAL)
+        grid_sizer = wx.FlexGridSizer(cols=2, vgap=5, hgap=10)
+        grid_sizer.AddGrowableCol(1)
+
+        grid_sizer.Add(wx.StaticText(self, label='Layout:'), 0, wx.ALIGN_CENTER_VERTICAL)
+        self.layout_picker = wx.FilePickerCtrl(
+            self, wildcard='keyboard-layout-editor (*.json;*.txt)|*.json;*.txt|All files (*.*)|*.*',
+            style=wx.FLP_OPEN | wx.FLP_FILE_MUST_EXIST | wx.FLP_USE_TEXTCTRL)
+        self.layout_picker.SetPath(self.cache.get('importer_layout', ''))
+        grid_sizer.Add(self.layout_picker, 1, wx.EXPAND)
+
+        grid_sizer.Add(wx.StaticText(self, label='Switch:'), 0, wx.ALIGN_CENTER_VERTICAL)
+        switches = [switch for switch in SWITCHES.keys() if switch != STABILIZER]
+        self.switch_box = wx.ComboBox(self, choices=switches, style=wx.CB_READONLY)
+        self.switch_box.SetValue(self.cache.get('importer_switch', switches[0]))
+        grid_sizer.Add(self.switch_box, 1, wx.EXPAND)
+
+        grid_sizer.Add(wx.StaticText(self, label='Origin (mm):'), 0, wx.ALIGN_CENTER_VERTICAL)
+        origin_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        origin = self.cache.get('importer_origin', (25.4, 25.4))
+        self.origin_x = wx.SpinCtrlDouble(self, min=-1000, max=1000, initial=origin[0], inc=0.1)
+        self.origin_y = wx.SpinCtrlDouble(self, min=-1000, max=1000, initial=origin[1], inc=0.1)
+        origin_sizer.Add(self.origin_x, 1, wx.RIGHT, 5)
+        origin_sizer.Add(self.origin_y, 1)
+        grid_sizer.Add(origin_sizer, 1, wx.EXPAND)
+
+        grid_sizer.AddSpacer(0)
+        self.stabilizer_check = wx.CheckBox(self, label='Place stabilizers')
+        self.stabilizer_check.SetValue(self.cache.get('importer_stabilizers', True))
+        grid_sizer.Add(self.stabilizer_check)
+
+        top_sizer.Add(grid_sizer, 1, wx.EXPAND | wx.ALL, 10)
+        self.setup_buttons(top_sizer)
+
+        self.SetSizer(top_sizer)
+        self.SetMinSize(wx.Size(500, -1))
+        self.Fit()
+
+    @staticmethod
+    def footprint_cache():
+        # the footprints are shared with the generator and the command line through the user cache,
+        # importing still works without it
+        try:
+            return FootprintCache()
+        except OSError as e:
+            logException(e, 'KiSwitchImporter')
+            return None
+
+    def on_close(self, event):
+        self.EndModal(0)  # return 0 to showModal()
+
+    def on_import(self, event):
+        layout_file = self.layout_picker.GetPath()
+        switch = self.switch_box.GetValue()
+        stabilizers = self.stabilizer_check.GetValue()
+        origin = (self.origin_x.GetValue(), self.origin_y.GetValue())
+
+        self.cache.put('importer_layout', layout_file)
+        self.cache.put('importer_switch', switch)
+        self.cache.put('importer_origin', origin)
+        self.cache.put('importer_stabilizers', stabilizers)
+
+        if not os.path.isfile(layout_file):
+            error_dialog(self, 'Select a layout to import.')
+            return
+
+        try:
+            library_dir = confirm_lib_overwrite(self, self.project_path, LIBNAME)
+        except Exception as e:
+            error_dialog(self, str(e))
+            return
+
+        self.status_label.SetLabel('Importing...')
+
+        # the footprints are written to a staging directory first, like the generator, so a bad layout
+        # leaves the previous library untouched
+        staging_dir = tempfile.mkdtemp(prefix=f'.{LIBNAME}.pretty.', dir=self.project_path)
+
+        try:
+            with wx.BusyCursor():
+                keys = parse_kle(read_kle(layout_file))
+                placements = render_layout(
+                    staging_dir, keys, switch, keycap=SWITCHES[switch].DEFAULT_KEYCAP, stabilizers=stabilizers,
+                    cache=self.footprint_cache())
+                swap_lib_dir(staging_dir, library_dir)
+                prepare_lib_table(self.project_path, LIBNAME)
+
+                # every footprint is added inside the plugin run, pcbnew records them as a single undo step
+                footprints = place_footprints(pcbnew.GetBoard(), library_dir, LIBNAME, placements, origin)
+                pcbnew.Refresh()
+
+        except Exception as e:
+            self.status_label.SetLabel('Failed')
+            error_dialog(self, str(e))
+            return
+
+        finally:
+            if os.path.isdir(staging_dir):
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+        names = set(placement['footprint'] for placement in placements)
+        self.status_label.SetLabel(f'Placed {len(footprints)} footprints, {len(names)} distinct')
+
+    def setup_buttons(self, parent_sizer):
+        button_box = wx.BoxSizer(wx.HORIZONTAL)
+
+        self.status_label = wx.StaticText(self, label='', style=wx.ST_ELLIPSIZE_END)
+        button_box.Add(self.status_label, 1, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, 10)
+
+        close_button = wx.Button(self, label='Close')
+        self.Bind(wx.EVT_BUTTON, self.on_close, id=close_button.GetId())
+        button_box.Add(close_button, 0, wx.RIGHT, 10)
+
+        import_button = wx.Button(self, label='Import')
+        self.Bind(wx.EVT_BUTTON, self.on_import, id=import_button.GetId())
+        button_box.Add(import_button, 0, wx.RIGHT, 10)
+
+        parent_sizer.Add(button_box, 0, wx.EXPAND |
+                         wx.LEFT | wx.RIGHT | wx.BOTTOM, 10)
@@ -2,14 +2,13 @@
 # SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: 2022 Rafael Silva <perigoso@riseup.net>
 
+import importlib
 import os
-import shutil
+import time
 import pcbnew
 import wx
 
-from KiSwitchPlugin.plugin.dialog_generator import GeneratorDialog
-from KiSwitchPlugin.plugin.dialog_importer import ImporterDialog
-from KiSwitchPlugin.plugin.dialog_util import error_dialog
+from KiSwitchPlugin.plugin.cache import SessionCache
 from KiSwitchPlugin.util import logException, PLUGINPATH
 
 
@@ -41,12 +40,14 @@ def get_pcbnew_frame() -> wx.Frame:
 
 
 class KiSwitchPlugin(pcbnew.ActionPlugin):
+    # the dialogs pull in the whole geometry stack, so they are only imported on the first Run()
     def __init__(self):
-        try:
-            getattr(self, 'dialog_class')
-        except AttributeError:
-            raise Exception('required dialog_class not defined')
+        for attr in ('NAME', 'DESCRIPTION', 'DIALOG_MODULE', 'DIALOG_CLASS'):
+            if not hasattr(self, attr):
+                raise Exception(f'required {attr} not defined')
 
+        self.dialog_class = None
+        self.cache = SessionCache()
         self.pcbnew_frame = None
         self.project_path = None
 
@@ -54,27 +55,40 @@ class KiSwitchPlugin(pcbnew.ActionPlugin):
 
 
     def defaults(self):
-        self.name = self.dialog_class.NAME
+        self.name = self.NAME
         self.category = 'Keyboard switch keyswitch'
-        self.description = self.dialog_class.DESCRIPTION
+        self.description = self.DESCRIPTION
         self.show_toolbar_button = True
 
         icon_path = os.path.join(PLUGINPATH, 'assets', 'icon24.png')
         self.icon_file_name = icon_path
 
+    def load_dialog_class(self):
+        if self.dialog_class is None:
+            start = time.perf_counter()
+            module = importlib.import_module(self.DIALOG_MODULE)
+            self.dialog_class = getattr(module, self.DIALOG_CLASS)
+            print(f'{self.NAME} loaded in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+        return self.dialog_class
+
     def Run(self):
         try:
+            dialog_class = self.load_dialog_class()
+
             if self.pcbnew_frame is None:
                 self.pcbnew_frame = get_pcbnew_frame()
 
             if self.project_path is None:
                 self.project_path = get_project_path()
 
-            dialog = self.dialog_class(self.pcbnew_frame, self.project_path)
+            dialog = dialog_class(self.pcbnew_frame, self.project_path, self.cache)
             dialog.ShowModal()
 
         except Exception as e:
-            if dialog in locals():
+            from KiSwitchPlugin.plugin.dialog_util import error_dialog
+
+            if 'dialog' in locals():
                 parent = dialog
             else:
                 parent = self.pcbnew_frame
@@ -88,12 +102,14 @@ class KiSwitchPlugin(pcbnew.ActionPlugin):
 
 
 class KiSwitchPluginGenerator(KiSwitchPlugin):
-    def __init__(self):
-        self.dialog_class = GeneratorDialog
-        super().__init__()
+    NAME = 'KiSwitch Generator'
+    DESCRIPTION = 'Generate Keyboard Switch Footprints'
+    DIALOG_MODULE = 'KiSwitchPlugin.plugin.dialog_generator'
+    DIALOG_CLASS = 'GeneratorDialog'
 
 
 class KiSwitchPluginImporter(KiSwitchPlugin):
-    def __init__(self):
-        self.dialog_class = ImporterDialog
-        super().__init__()
+    NAME = 'KiSwitch Importer'
+    DESCRIPTION = 'Import Keyboard layout'
+    DIALOG_MODULE = 'KiSwitchPlugin.plugin.dialog_importer'
+    DIALOG_CLASS = 'ImporterDialog'
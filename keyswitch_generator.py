@@ -5,10 +5,13 @@
 import argparse
 import os
 
+from KiSwitch.footprint_cache import FootprintCache
 from KiSwitch.generator import render_keycaps, render_switches, SWITCHES, KEYCAPS
+from KiSwitch.geometry import FootprintGeometry
+from KiSwitch.index import FootprintIndex, INDEX_FILE
 
 
-def generate_stabilizer(output_path):
+def generate_stabilizer(output_path, index=None, geometry=None, cache=None):
     group = "Mounting_Keyboard_Stabilizer"
     out_path = os.path.join(output_path, f"{group}.pretty")
     if not os.path.isdir(out_path):
@@ -16,65 +19,94 @@ def generate_stabilizer(output_path):
 
     sizes = [2, 3, 6, 6.25, 7, 8]
     for size in sizes:
-        render_switches(out_path, "StabilizerCherryMX", args={"size": size})
+        render_switches(
+            out_path, "StabilizerCherryMX", args={"size": size}, index=index, geometry=geometry, cache=cache
+        )
 
 
-def generate_switch_alps_matias(output_path):
+def generate_switch_alps_matias(output_path, index=None, geometry=None, cache=None):
     group = "Switch_Keyboard_Alps_Matias"
     out_path = os.path.join(output_path, f"{group}.pretty")
     if not os.path.isdir(out_path):
         os.mkdir(out_path)
 
-    render_switches(out_path, "SwitchAlpsMatias", keycap="Keycap")
+    render_switches(out_path, "SwitchAlpsMatias", keycap="Keycap", index=index, geometry=geometry, cache=cache)
 
 
-def generate_switch_cherry_mx(output_path):
+def generate_switch_cherry_mx(output_path, index=None, geometry=None, cache=None):
     group = "Switch_Keyboard_Cherry_MX"
     out_path = os.path.join(output_path, f"{group}.pretty")
     if not os.path.isdir(out_path):
         os.mkdir(out_path)
 
     for switch_type in ["PCB", "Plate"]:
-        render_switches(out_path, "SwitchCherryMX", args={"switch_type": switch_type}, keycap="Keycap")
-
-
-def generate_switch_hybrid(output_path):
+        render_switches(
+            out_path,
+            "SwitchCherryMX",
+            args={"switch_type": switch_type},
+            keycap="Keycap",
+            index=index,
+            geometry=geometry,
+            cache=cache,
+        )
+
+
+def generate_switch_hybrid(output_path, index=None, geometry=None, cache=None):
     group = "Switch_Keyboard_Hybrid"
     out_path = os.path.join(output_path, f"{group}.pretty")
     if not os.path.isdir(out_path):
         os.mkdir(out_path)
 
-    render_switches(out_path, "SwitchHybridCherryMxAlps", keycap="Keycap")
+    render_switches(out_path, "SwitchHybridCherryMxAlps", keycap="Keycap", index=index, geometry=geometry, cache=cache)
 
 
-def generate_switch_kailh(output_path):
+def generate_switch_kailh(output_path, index=None, geometry=None, cache=None):
     group = "Switch_Keyboard_Kailh"
     out_path = os.path.join(output_path, f"{group}.pretty")
     if not os.path.isdir(out_path):
         os.mkdir(out_path)
 
-    render_switches(out_path, "SwitchKailhChocMini", keycap="KeycapChoc")
-    render_switches(out_path, "SwitchKailhKH", keycap="Keycap")
-    render_switches(out_path, "SwitchKailhNB", keycap="Keycap")
+    render_switches(out_path, "SwitchKailhChocMini", keycap="KeycapChoc", index=index, geometry=geometry, cache=cache)
+    render_switches(out_path, "SwitchKailhKH", keycap="Keycap", index=index, geometry=geometry, cache=cache)
+    render_switches(out_path, "SwitchKailhNB", keycap="Keycap", index=index, geometry=geometry, cache=cache)
 
     for switch_type in ["V1", "V2", "V1V2"]:
-        render_switches(out_path, "SwitchKailhChoc", args={"switch_type": switch_type}, keycap="KeycapChoc")
-
-
-def generate_switch_hotswap_kailh(output_path):
+        render_switches(
+            out_path,
+            "SwitchKailhChoc",
+            args={"switch_type": switch_type},
+            keycap="KeycapChoc",
+            index=index,
+            geometry=geometry,
+            cache=cache,
+        )
+
+
+def generate_switch_hotswap_kailh(output_path, index=None, geometry=None, cache=None):
     group = "Switch_Keyboard_Hotswap_Kailh"
     out_path = os.path.join(output_path, f"{group}.pretty")
     if not os.path.isdir(out_path):
         os.mkdir(out_path)
 
     for plated in [False, True]:
-        render_switches(out_path, "SwitchHotswapKailh", args={"hotswap_plated": plated}, keycap="Keycap")
+        render_switches(
+            out_path,
+            "SwitchHotswapKailh",
+            args={"hotswap_plated": plated},
+            keycap="Keycap",
+            index=index,
+            geometry=geometry,
+            cache=cache,
+        )
         for switch_type in ["V1", "V2", "V1V2"]:
             render_switches(
                 out_path,
                 "SwitchKailhChoc",
                 args={"switch_type": switch_type, "hotswap": True, "hotswap_plated": plated},
                 keycap="KeycapChoc",
+                index=index,
+                geometry=geometry,
+                cache=cache,
             )
 
 
@@ -84,14 +116,27 @@ if __name__ == "__main__":
 
     parser.add_argument("-o", "--output", type=str, default="./output", help="output path " "(default: %(default)s)")
 
+    parser.add_argument("-c", "--cache", type=str, default=None, help="generation cache path (default: user cache)")
+    parser.add_argument("--no-cache", action="store_true", help="build every footprint from scratch")
+
     args = parser.parse_args()
 
     if not os.path.isdir(args.output):
         os.mkdir(args.output)
 
-    generate_stabilizer(args.output)
-    generate_switch_alps_matias(args.output)
-    generate_switch_cherry_mx(args.output)
-    generate_switch_hybrid(args.output)
-    generate_switch_kailh(args.output)
-    generate_switch_hotswap_kailh(args.output)
+    index = FootprintIndex()
+    geometry = FootprintGeometry()
+    cache = None if args.no_cache else FootprintCache(args.cache)
+
+    generate_stabilizer(args.output, index, geometry, cache)
+    generate_switch_alps_matias(args.output, index, geometry, cache)
+    generate_switch_cherry_mx(args.output, index, geometry, cache)
+    generate_switch_hybrid(args.output, index, geometry, cache)
+    generate_switch_kailh(args.output, index, geometry, cache)
+    generate_switch_hotswap_kailh(args.output, index, geometry, cache)
+
+    index.write(os.path.join(args.output, INDEX_FILE))
+    geometry.write(args.output)
+
+    if cache is not None:
+        cache.prune()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: 2023 Rafael Silva <perigoso@riseup.net>
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import zipfile
+
+from KiSwitch.model_compact import compact_vrml_file
+from KiSwitch.model_store import build_manifest, redundant_lod_models, referenced_models
+
+NAME = "keyswitch-kicad-library"
+
+ROOT_PATH = os.path.dirname(os.path.realpath(__file__))
+
+METADATA_FILE = os.path.join(ROOT_PATH, "metadata.json")
+
+VERSION_FILE = os.path.join(ROOT_PATH, "KiSwitch", "__init__.py")
+
+# archive directory -> source directory
+CONTENT = {
+    "footprints": os.path.join(ROOT_PATH, "library", "footprints"),
+    "3dmodels": os.path.join(ROOT_PATH, "library", "3dmodels"),
+}
+
+MODELS_PATH = os.path.join(ROOT_PATH, "library", "3dmodels", "3d-library.3dshapes")
+
+ICON_SVG = os.path.join(ROOT_PATH, "assets", "icon.svg")
+ICON_PNG = os.path.join(ROOT_PATH, "assets", "icon128.png")
+ICON_SIZE = 64
+
+# fixed entry metadata keeps the archive byte for byte reproducible
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+ZIP_FILE_MODE = 0o644 << 16
+
+# only known once the archive exists, so they are kept out of the packaged metadata
+DOWNLOAD_KEYS = ["download_sha256", "download_size", "download_url"]
+
+
+class HashingWriter(io.RawIOBase):
+    # write only and unseekable, so zipfile streams the archive through in a single pass
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.file.write(data)
+        self.sha256.update(data)
+        self.size += len(data)
+        return len(data)
+
+
+def render_icon() -> bytes:
+    try:
+        import cairosvg
+
+        return cairosvg.svg2png(url=ICON_SVG, output_width=ICON_SIZE, output_height=ICON_SIZE)
+    except ImportError:
+        from PIL import Image
+
+        # without cairo, downscale the prerendered icon
+        with Image.open(ICON_PNG) as image:
+            output = io.BytesIO()
+            image.resize((ICON_SIZE, ICON_SIZE), Image.LANCZOS).save(output, format="PNG")
+            return output.getvalue()
+
+
+def read_metadata() -> dict:
+    with open(METADATA_FILE, "r") as f:
+        return json.load(f)
+
+
+def write_metadata(metadata: dict) -> None:
+    tmp_file = f"{METADATA_FILE}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(metadata, f, indent=4)
+        f.write("\n")
+    os.replace(tmp_file, METADATA_FILE)
+
+
+def write_version(version: str) -> None:
+    # KiSwitch.__version__ follows the latest version in metadata.json, it is never edited by hand
+    with open(VERSION_FILE, "r") as f:
+        lines = f.readlines()
+
+    lines = [f'__version__ = "{version}"\n' if line.startswith("__version__") else line for line in lines]
+
+    tmp_file = f"{VERSION_FILE}.tmp"
+    with open(tmp_file, "w") as f:
+        f.writelines(lines)
+    os.replace(tmp_file, VERSION_FILE)
+
+
+def get_version_entry(metadata: dict, version: str, status: str, kicad_version: str) -> dict:
+    for entry in metadata["versions"]:
+        if entry["version"] == version:
+            return entry
+
+    entry = {"version": version, "status": status, "kicad_version": kicad_version}
+    metadata["versions"].insert(0, entry)
+    return entry
+
+
+def archive_files(all_models: bool = False) -> list[tuple[str, str]]:
+    # models no footprint references are left out of the package, and so are reduced variants that are
+    # copies of their full model
+    manifest = build_manifest(MODELS_PATH, CONTENT["footprints"])
+    skipped = set(redundant_lod_models(manifest))
+    if not all_models:
+        skipped |= set(manifest["models"]) - set(referenced_models(manifest))
+    skipped = {os.path.join(MODELS_PATH, model) for model in skipped}
+
+    files = []
+    for archive_dir, source_dir in CONTENT.items():
+        for dirpath, dirnames, filenames in os.walk(source_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if path in skipped:
+                    continue
+                relpath = os.path.relpath(path, source_dir).replace(os.sep, "/")
+                files.append((f"{archive_dir}/{relpath}", path))
+
+    return sorted(files)
+
+
+def _zip_info(name: str) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.external_attr = ZIP_FILE_MODE
+    info.create_system = 3
+    return info
+
+
+def build_package(
+    output_path: str,
+    version: str = None,
+    status: str = "stable",
+    kicad_version: str = "5.1",
+    all_models: bool = False,
+    compact: bool = True,
+) -> dict:
+    metadata = read_metadata()
+
+    if version is None:
+        version = metadata["versions"][0]["version"]
+    entry = get_version_entry(metadata, version, status, kicad_version)
+
+    if not os.path.isdir(output_path):
+        os.makedirs(output_path)
+
+    # metadata is written last, so it can carry the install size of everything else
+    entries = archive_files(all_models)
+    if compact:
+        entries = [(name, compact_vrml_file(source) if name.endswith(".wrl") else source) for name, source in entries]
+    entries.append(("resources/icon.png", render_icon()))
+
+    install_size = 0
+    archive_file = os.path.join(output_path, f"{NAME}.zip")
+
+    with open(archive_file, "wb") as f:
+        writer = HashingWriter(f)
+
+        with zipfile.ZipFile(writer, "w", compresslevel=9) as archive:
+            for name, source in entries:
+                with archive.open(_zip_info(name), "w") as archive_entry:
+                    if isinstance(source, bytes):
+                        archive_entry.write(source)
+                        install_size += len(source)
+                    else:
+                        with open(source, "rb") as source_file:
+                            shutil.copyfileobj(source_file, archive_entry, 1024 * 1024)
+                        install_size += os.path.getsize(source)
+
+            packaged_metadata = json.loads(json.dumps(metadata))
+            packaged_metadata["versions"] = [
+                {key: value for key, value in packaged_entry.items() if key not in DOWNLOAD_KEYS}
+                for packaged_entry in packaged_metadata["versions"]
+                if packaged_entry["version"] == version
+            ]
+
+            # the metadata counts towards the install size it states, settle on a size that includes itself
+            metadata_bytes = b""
+            while install_size + len(metadata_bytes) != packaged_metadata["versions"][0].get("install_size"):
+                packaged_metadata["versions"][0]["install_size"] = install_size + len(metadata_bytes)
+                metadata_bytes = (json.dumps(packaged_metadata, indent=4) + "\n").encode()
+            install_size += len(metadata_bytes)
+
+            archive.writestr(_zip_info("metadata.json"), metadata_bytes)
+
+    entry["download_sha256"] = writer.sha256.hexdigest()
+    entry["download_size"] = writer.size
+    entry["install_size"] = install_size
+
+    write_metadata(metadata)
+    write_version(metadata["versions"][0]["version"])
+
+    return entry
+
+
+def tui():
+    # --------------------- Parser ---------------------
+    parser = argparse.ArgumentParser(description="Build the KiCad PCM package.", usage="%(prog)s [options]")
+
+    parser.add_argument("-o", "--output", type=str, default="./release", help="output path (default: %(default)s)")
+    parser.add_argument(
+        "-v", "--version", type=str, default=None, help="package version (default: latest in metadata.json)"
+    )
+    parser.add_argument("--status", type=str, default="stable", help="status of a new version (default: %(default)s)")
+    parser.add_argument(
+        "--kicad-version", type=str, default="5.1", help="minimum kicad version of a new version (default: %(default)s)"
+    )
+    parser.add_argument("--all-models", action="store_true", help="package 3D models no footprint references")
+    parser.add_argument("--no-compact", action="store_true", help="package the vrml models as they are")
+
+    args = parser.parse_args()
+
+    # --------------------- Build ---------------------
+    entry = build_package(
+        args.output, args.version, args.status, args.kicad_version, args.all_models, not args.no_compact
+    )
+
+    for key in ["version", "download_sha256", "download_size", "install_size"]:
+        print(f'"{key}": {json.dumps(entry[key])}')
+
+
+if __name__ == "__main__":
+    tui()